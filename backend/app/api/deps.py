@@ -1,5 +1,10 @@
-from fastapi import FastAPI
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+
+from ..core.config import settings
+from ..services.vector_store import DEFAULT_TENANT, TENANT_ID_PATTERN
 origins = [
     "http://localhost:5173",    # Vite's default port
     "http://localhost:3000",    # Just in case you use a different port
@@ -16,4 +21,29 @@ def setup_middlewares(app: FastAPI):
     allow_methods=["*"],
     allow_headers=["*"],
     expose_headers=["*"]
-)
\ No newline at end of file
+)
+
+
+def get_tenant(
+    x_tenant_id: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
+) -> str:
+    """
+    Tenant whose shard a request reads and writes. An API key listed in
+    TENANT_API_KEYS selects its tenant; otherwise the X-Tenant-ID header
+    does, and requests with neither use the default shard. A tenant bound
+    to a key in TENANT_API_KEYS can only be selected with that key.
+    """
+    if x_api_key is not None:
+        tenant = settings.TENANT_API_KEYS.get(x_api_key)
+        if tenant is None:
+            raise HTTPException(status_code=401, detail="Unknown API key")
+        if x_tenant_id is not None and x_tenant_id != tenant:
+            raise HTTPException(status_code=403, detail="API key does not belong to this tenant")
+        return tenant
+    tenant = DEFAULT_TENANT if x_tenant_id is None else x_tenant_id
+    if not TENANT_ID_PATTERN.match(tenant):
+        raise HTTPException(status_code=400, detail="Invalid X-Tenant-ID")
+    if tenant in settings.TENANT_API_KEYS.values():
+        raise HTTPException(status_code=401, detail="This tenant requires an API key")
+    return tenant
@@ -1,21 +1,28 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional
 import json
+import asyncio
 from pydantic import BaseModel
 import os
-import aiohttp
 from fastapi import Header
 from ...core.config import settings
-from ...services.rag import query_rag
-from ...services.search import google_search, store_search_context
-from ...services.db_manager import update_database
+from ..deps import get_tenant
+from ...services.rag import query_flights, query_rag, query_rag_stream
+from ...services.search import SearchError, google_search, search_cache, search_flights, store_search_context, summary_flights
+from ...services.backup import backup_database, backup_database_incremental, restore_backup
+from ...services.cid_retrieval import FAILED, PRESENT, RETRIEVED, InvalidCIDError, needs_ingest, retrieve_cid, retrieve_cids
+from ...services.dsn import DSNError
+from ...services.ingest_jobs import get_ingest_queue
+from ...services.semantic_cache import semantic_cache
+from ...services.uploads import upload_encrypted
+from ...services.vector_store import DEFAULT_TENANT, StoreBusyError, tenant_paths, tenant_store_stats
+from ...utils.embedding_cache import get_embedding_cache
+from ...utils.lexical_index import get_lexical_index
+from ...utils.object_cache import get_object_cache
 import mimetypes
-import shutil
 import logging
-from ...utils.encryption import encrypt_file_for_tee
-from ...utils.tee_decryption import decrypt_tee_file
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 router = APIRouter()
 
@@ -33,31 +40,64 @@ class SearchRequest(BaseModel):
 class ChatContextRequest(BaseModel):
     context: str
 
+class RetrieveBatchRequest(BaseModel):
+    cids: List[str]
+
 class QueryRequest(BaseModel):
     query_text: str
     config: Dict[str, Any]
+    stream: bool = False
 
 def get_mime_type(filename):
     """Detect the MIME type of a file based on its extension"""
     mime_type, _ = mimetypes.guess_type(filename)
     return mime_type or 'application/octet-stream'
 
+def stream_query_response(query_text: str, config: dict, tenant: str) -> StreamingResponse:
+    """Wrap query_rag_stream as a Server-Sent Events response"""
+    async def event_stream():
+        try:
+            async for event in query_rag_stream(query_text, config, tenant):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/query")
-async def query_endpoint_get(query_text: str, config: Optional[str] = None):
+async def query_endpoint_get(
+    query_text: str,
+    config: Optional[str] = None,
+    stream: bool = False,
+    tenant: str = Depends(get_tenant)
+):
     try:
         config_dict = json.loads(config) if config else {}
-        response = await query_rag(query_text, config_dict)
+        if stream:
+            return stream_query_response(query_text, config_dict, tenant)
+        response = await query_rag(query_text, config_dict, tenant)
         return {"response": response}
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid configuration format")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/query")
-async def query_endpoint_post(request: QueryRequest):
+async def query_endpoint_post(request: QueryRequest, tenant: str = Depends(get_tenant)):
     try:
-        response = await query_rag(request.query_text, request.config)
+        if request.stream:
+            return stream_query_response(request.query_text, request.config, tenant)
+        response = await query_rag(request.query_text, request.config, tenant)
         return {"response": response}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -65,6 +105,39 @@ async def query_endpoint_post(request: QueryRequest):
 async def health_check():
     return {"status": "healthy"}
 
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, tenant: str = Depends(get_tenant)):
+    job = (await get_ingest_queue(tenant)).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {
+        "semantic": semantic_cache.stats(),
+        "query_flights": query_flights.stats(),
+        "embedding": get_embedding_cache().stats(),
+        "objects": get_object_cache().stats(),
+        "search": {
+            **search_cache.stats(),
+            "search_flights": search_flights.stats(),
+            "summary_flights": summary_flights.stats()
+        },
+        "tenant_stores": tenant_store_stats()
+    }
+
+@router.get("/facets")
+async def facets(tenant: str = Depends(get_tenant)):
+    """Chunk counts per source, type and CID, for building query filters."""
+    index = get_lexical_index(tenant_paths(tenant)[0])
+    loop = asyncio.get_running_loop()
+    total, facet_counts = await asyncio.gather(
+        loop.run_in_executor(None, index.count),
+        loop.run_in_executor(None, index.facets)
+    )
+    return {"total": total, "facets": facet_counts}
+
 @router.post("/search")
 async def search_endpoint(request: SearchRequest):
     if not request.query.strip():
@@ -73,18 +146,22 @@ async def search_endpoint(request: SearchRequest):
     try:
         result = await google_search(request.query)
         return JSONResponse(content={"result": result})
+    except SearchError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat/context")
-async def add_chat_context(request: ChatContextRequest):
+async def add_chat_context(request: ChatContextRequest, tenant: str = Depends(get_tenant)):
     if not request.context.strip():
         raise HTTPException(status_code=400, detail="Context cannot be empty")
     
     try:
         # Now store_search_context is properly imported
-        await store_search_context(request.context)
+        await store_search_context(request.context, tenant)
         return JSONResponse(content={"status": "success"})
+    except StoreBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error in add_chat_context: {str(e)}")  # Add logging
         raise HTTPException(status_code=500, detail=str(e))
@@ -92,54 +169,63 @@ async def add_chat_context(request: ChatContextRequest):
 @router.get("/retrieve/{cid}")
 async def retrieve_file(
     cid: str,
-    authorization: str = Header(None) 
+    authorization: str = Header(None),
+    tenant: str = Depends(get_tenant)
 ):
     try:
-        # Create data directory if it doesn't exist
-        os.makedirs(settings.DATA_PATH, exist_ok=True)
-        
-        # Download file from DSN
-        async with aiohttp.ClientSession() as session:
-            url = f"https://demo.auto-drive.autonomys.xyz/objects/{cid}/download"
-            headers = {
-                "Authorization": f"Bearer {settings.DSN_API_KEY}",
-                "x-auth-provider": "apikey"
+        # Files land in the tenant's data directory and are ingested into its shard
+        chroma_path, data_path = tenant_paths(tenant)
+        result = await retrieve_cid(cid, data_path, chroma_path)
+        if not needs_ingest(result):
+            return {
+                "message": "File already retrieved and indexed",
+                "name": result["name"],
+                "source": result["source"],
+                "job_id": None
             }
-            
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail="Failed to download file from DSN"
-                    )
-                
-                # Get filename from headers or use CID as filename
-                content_disposition = response.headers.get("Content-Disposition", "")
-                filename = content_disposition.split("filename=")[-1].strip('"') or f"{cid}.msgpack"
-                encrypted_file_path = os.path.join(settings.DATA_PATH, filename)
-                
-                # Save encrypted file
-                with open(encrypted_file_path, "wb") as f:
-                    f.write(await response.read())
         
-        # Decrypt the file
-        decrypted_filename = filename.replace('.msgpack', '')
-        decrypted_file_path = os.path.join(settings.DATA_PATH, decrypted_filename)
+        # Indexing runs in the background; poll /jobs/{job_id} for progress
+        job = (await get_ingest_queue(tenant)).enqueue(reason=f"retrieve:{cid}")
         
-        if not decrypt_tee_file(
-            encrypted_file_path=encrypted_file_path,
-            private_key_path=settings.PRIVATE_KEY_PATH,
-            output_file_path=decrypted_file_path
-        ):
-            raise HTTPException(status_code=500, detail="Failed to decrypt file")
+        return {
+            "message": "File retrieved and decrypted; database update queued",
+            "name": result["name"],
+            "source": result["source"],
+            "job_id": job["id"]
+        }
+        
+    except InvalidCIDError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        os.remove(encrypted_file_path)
+@router.post("/retrieve")
+async def retrieve_files(request: RetrieveBatchRequest, tenant: str = Depends(get_tenant)):
+    if not request.cids:
+        raise HTTPException(status_code=400, detail="No CIDs given")
+    if len(request.cids) > settings.RETRIEVE_BATCH_MAX_CIDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.RETRIEVE_BATCH_MAX_CIDS} CIDs per request"
+        )
+    try:
+        chroma_path, data_path = tenant_paths(tenant)
+        results = await retrieve_cids(request.cids, data_path, chroma_path)
         
-        await update_database()
+        # One ingestion run covers every file this batch added, plus any
+        # earlier ones that never made it into the index
+        to_ingest = [result["cid"] for result in results if needs_ingest(result)]
+        job_id = None
+        if to_ingest:
+            job = (await get_ingest_queue(tenant)).enqueue(reason=f"retrieve-batch:{len(to_ingest)}")
+            job_id = job["id"]
         
         return {
-            "message": "File retrieved, decrypted, and database updated successfully",
-            "name": decrypted_filename
+            "results": results,
+            "retrieved": sum(result["status"] == RETRIEVED for result in results),
+            "present": sum(result["status"] == PRESENT for result in results),
+            "failed": sum(result["status"] == FAILED for result in results),
+            "job_id": job_id
         }
         
     except Exception as e:
@@ -148,87 +234,31 @@ async def retrieve_file(
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        # Read file data
-        file_data = await file.read()
-        
-        # Encrypt file data for TEE
-        encrypted_bundle = encrypt_file_for_tee(
-            file_data, 
-            "public_key.pem"  # Assuming the key is in the root directory
+        # Encrypt the spooled upload frame by frame in a worker thread and
+        # stream the bundle into the chunked DSN upload as it is produced
+        _upload_id, completion_data = await upload_encrypted(
+            file.file,
+            filename=f"{file.filename}.msgpack"
         )
         
-        # Create upload request
-        base_url = "https://demo.auto-drive.autonomys.xyz"
-        headers = {
-            "Authorization": f"Bearer {settings.DSN_API_KEY}",
-            "X-Auth-Provider": "apikey",
-            "Content-Type": "application/json"
-        }
-        
-        create_data = {
-            "filename": f"{file.filename}.msgpack",
-            "mimeType": "application/octet-stream",
-            "uploadOptions": None
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            # Create upload
-            async with session.post(
-                f"{base_url}/uploads/file",
-                headers=headers,
-                json=create_data
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=response.status, detail="Failed to create upload")
-                upload_data = await response.json()
-                upload_id = upload_data["id"]
-            
-            # Upload encrypted bundle
-            chunk_headers = {
-                "Authorization": f"Bearer {settings.DSN_API_KEY}",
-                "X-Auth-Provider": "apikey"
-            }
-            
-            form_data = aiohttp.FormData()
-            form_data.add_field(
-                "file", 
-                encrypted_bundle,
-                filename=f"{file.filename}.msgpack",
-                content_type="application/octet-stream"
-            )
-            form_data.add_field("index", "0")
-            
-            async with session.post(
-                f"{base_url}/uploads/file/{upload_id}/chunk",
-                headers=chunk_headers,
-                data=form_data
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=response.status, detail="Failed to upload chunk")
-            
-            # Complete upload
-            async with session.post(
-                f"{base_url}/uploads/{upload_id}/complete",
-                headers=headers
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=response.status, detail="Failed to complete upload")
-                completion_data = await response.json()
-            
-            # print the response
-            print(completion_data)
+        # print the response
+        print(completion_data)
 
-            return JSONResponse(content={
-                "upload_id": completion_data["cid"],
-                "status": "success",
-                "completion": completion_data
-            })
+        return JSONResponse(content={
+            "upload_id": completion_data["cid"],
+            "status": "success",
+            "completion": completion_data
+        })
             
+    except DSNError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload-db")
-async def upload_db():
+async def upload_db(incremental: bool = False, tenant: str = Depends(get_tenant)):
+    if tenant != DEFAULT_TENANT:
+        raise HTTPException(status_code=400, detail="Backups are only supported for the default tenant")
     try:
         logger.info(f"Starting database backup process. Chroma path: {settings.CHROMA_PATH}")
         
@@ -239,127 +269,18 @@ async def upload_db():
                 detail=f"Chroma directory not found at {settings.CHROMA_PATH}"
             )
 
-        # Create zip file
-        zip_path = "chroma_backup.zip"
-        try:
-            logger.info("Creating zip archive...")
-            shutil.make_archive(
-                "chroma_backup",  # name of the file without extension
-                'zip',           # archive format
-                settings.CHROMA_PATH  # directory to zip
-            )
-            logger.info(f"Zip archive created successfully at {zip_path}")
-        except Exception as e:
-            logger.error(f"Failed to create zip archive: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to create zip archive: {str(e)}"
-            )
-
-        try:
-            # Verify zip file was created and get its size
-            if not os.path.exists(zip_path):
-                raise HTTPException(
-                    status_code=500,
-                    detail="Zip file was not created successfully"
-                )
-            
-            file_size = os.path.getsize(zip_path)
-            logger.info(f"Zip file size: {file_size} bytes")
-
-            # Upload to DSN
-            async with aiohttp.ClientSession() as session:
-                # Create upload request
-                headers = {
-                    "Authorization": f"Bearer {settings.DSN_API_KEY}",
-                    "X-Auth-Provider": "apikey",
-                    "Content-Type": "application/json"
-                }
-                
-                create_data = {
-                    "filename": "chroma_backup.zip",
-                    "mimeType": "application/zip",
-                    "uploadOptions": None
-                }
-                
-                logger.info("Creating upload request...")
-                base_url = "https://demo.auto-drive.autonomys.xyz"
-                
-                # Create upload
-                async with session.post(
-                    f"{base_url}/uploads/file",
-                    headers=headers,
-                    json=create_data
-                ) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        logger.error(f"Failed to create upload. Status: {response.status}, Response: {response_text}")
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Failed to create upload: {response_text}"
-                        )
-                    upload_data = await response.json()
-                    upload_id = upload_data["id"]
-                    logger.info(f"Upload created with ID: {upload_id}")
-                
-                # Upload file chunk
-                chunk_headers = {
-                    "Authorization": f"Bearer {settings.DSN_API_KEY}",
-                    "X-Auth-Provider": "apikey"
-                }
-                
-                # Read the entire file into memory
-                with open(zip_path, 'rb') as f:
-                    file_data = f.read()
-                
-                form_data = aiohttp.FormData()
-                form_data.add_field(
-                    "file", 
-                    file_data,
-                    filename="chroma_backup.zip",
-                    content_type="application/zip"
-                )
-                form_data.add_field("index", "0")
-                
-                logger.info("Uploading file chunk...")
-                async with session.post(
-                    f"{base_url}/uploads/file/{upload_id}/chunk",
-                    headers=chunk_headers,
-                    data=form_data
-                ) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        logger.error(f"Failed to upload chunk. Status: {response.status}, Response: {response_text}")
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Failed to upload chunk: {response_text}"
-                        )
-                    logger.info("File chunk uploaded successfully")
-                
-                # Complete upload
-                logger.info("Completing upload...")
-                async with session.post(
-                    f"{base_url}/uploads/{upload_id}/complete",
-                    headers=headers
-                ) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        logger.error(f"Failed to complete upload. Status: {response.status}, Response: {response_text}")
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Failed to complete upload: {response_text}"
-                        )
-                    completion_data = await response.json()
-                    logger.info("Upload completed successfully")
+        if incremental:
+            # Upload only blocks changed since the last backup, plus a manifest
+            upload_id, completion_data, stats = await backup_database_incremental()
+            return {
+                "message": "Incremental database backup uploaded successfully",
+                "upload_id": upload_id,
+                "completion": completion_data,
+                "stats": stats
+            }
 
-        finally:
-            # Clean up zip file
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                    logger.info("Cleaned up temporary zip file")
-            except Exception as e:
-                logger.error(f"Failed to clean up zip file: {str(e)}")
+        # Archive a consistent snapshot of the store and upload it in chunks
+        upload_id, completion_data = await backup_database()
 
         return {
             "message": "Database backup uploaded successfully",
@@ -373,3 +294,24 @@ async def upload_db():
             status_code=500,
             detail=f"Failed to backup database: {str(e)}"
         )
+
+@router.post("/restore-db/{cid}")
+async def restore_db(cid: str, tenant: str = Depends(get_tenant)):
+    """Replace the vector store with a full or incremental backup from DSN."""
+    if tenant != DEFAULT_TENANT:
+        raise HTTPException(status_code=400, detail="Backups are only supported for the default tenant")
+    try:
+        stats = await restore_backup(cid)
+        return {
+            "message": "Database restored successfully",
+            "cid": cid,
+            "stats": stats
+        }
+    except DSNError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    except Exception as e:
+        logger.error(f"Unexpected error during database restore: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to restore database: {str(e)}"
+        )
@@ -1,17 +1,80 @@
+from typing import Dict
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     CHROMA_PATH: str = "chroma"
     DATA_PATH: str = "data"
+    TENANTS_PATH: str = "tenants"
+    TENANT_MAX_OPEN_STORES: int = 8
+    TENANT_API_KEYS: Dict[str, str] = {}  # API key -> tenant ID
     MODEL_NAME: str = "gpt-4"
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     GOOGLE_API_KEY: str = ""
     GOOGLE_CSE_ID: str = ""
+    GOOGLE_SEARCH_URL: str = "https://www.googleapis.com/customsearch/v1"
+    SEARCH_RESULTS: int = 10  # the CSE API returns at most 10 per request
+    SEARCH_READ_TIMEOUT: float = 15
+    SEARCH_TOTAL_TIMEOUT: float = 30
+    SEARCH_CACHE_TTL: int = 600
+    SEARCH_CACHE_MAX_ENTRIES: int = 256
     DSN_API_KEY: str = ""
+    DSN_BASE_URL: str = "https://demo.auto-drive.autonomys.xyz"
+    DSN_UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    DSN_UPLOAD_CONCURRENCY: int = 4
+    DSN_UPLOAD_RETRIES: int = 3
+    DSN_UPLOAD_STATE_DIR: str = "dsn_uploads"
+    DSN_UPLOAD_STATE_TTL: int = 24 * 3600  # seconds a resumable upload's state is reused
+    DB_BACKUP_STREAMING: bool = True
+    DB_BACKUP_BLOCK_SIZE: int = 1024 * 1024
+    DB_BACKUP_STATE_PATH: str = "backup_state.json"
+    DSN_DOWNLOAD_CONCURRENCY: int = 8
+    RETRIEVE_BATCH_MAX_CIDS: int = 100
+    OBJECT_CACHE_PATH: str = "object_cache"
+    OBJECT_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
     OPENAI_API_KEY: str = ""
     VM_ENDPOINT: str = "http://20.49.47.204:8000"
+    VM_READ_TIMEOUT: float = 30
+    DSN_READ_TIMEOUT: float = 60
+    HTTP_POOL_SIZE: int = 100
+    HTTP_POOL_SIZE_PER_HOST: int = 16
+    HTTP_CONNECT_TIMEOUT: float = 10
+    HTTP_KEEPALIVE_TIMEOUT: float = 30
+    HTTP_DNS_CACHE_TTL: int = 300
     PRIVATE_KEY_PATH: str = "private_key.pem"
+    PUBLIC_KEY_PATH: str = "public_key.pem"
+    UPLOAD_FRAME_SIZE: int = 256 * 1024  # plaintext bytes per authenticated frame
+    UPLOAD_RESUMABLE: bool = True  # /upload spools the bundle to disk; False streams it (not resumable)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.97
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 512
+    SEMANTIC_CACHE_TTL: int = 3600
+    QUERY_COALESCING_ENABLED: bool = True
+    RETRIEVAL_K: int = 5
+    RETRIEVAL_FANOUT: int = 20  # candidates handed to the reranker
+    RETRIEVAL_MAX_FANOUT: int = 100
+    RETRIEVAL_MAX_PER_PAGE: int = 1  # 0 = no cap
+    RERANK_STRATEGY: str = "mmr"  # or "none"
+    MMR_LAMBDA: float = 0.7
+    PROMPT_TOKEN_BUDGET: int = 1024  # whole TEE prompt: template, question and context
+    PROMPT_TOKEN_BUDGET_MAX: int = 8192
+    CONTEXT_MIN_TRUNCATE_TOKENS: int = 64
+    TOKENIZER_ENCODING: str = "cl100k_base"
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20  # per retriever, before fusion
+    RRF_K: int = 60
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200000
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_MAX_CONCURRENCY: int = 4
+    INGEST_MAX_RETRIES: int = 5
+    INGEST_PDF_WORKERS: int = 0  # 0 = one per CPU
+    INGEST_STREAMING: bool = False
+    INGEST_INCREMENTAL: bool = True
+    INGEST_JOBS_PATH: str = "ingest_jobs.json"
+    CONTEXT_WRITE_WORKERS: int = 2
+    STORE_WRITE_LOCK_TIMEOUT: float = 10  # seconds a /chat/context write waits before a 503
 
     class Config:
         env_file = ".env"
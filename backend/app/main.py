@@ -1,16 +1,34 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .api.deps import setup_middlewares
 from .api.routes.query import router
 from .core.config import settings
+from .services.http_client import init_http_clients, close_http_clients
+from .services.ingest_jobs import start_ingest_queues, stop_ingest_queues
+from .services.vector_store import init_vector_store, close_vector_store
+from .utils.embedding_cache import flush_embedding_cache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared across all routes for the lifetime of the process
+    app.state.vector_store = init_vector_store()
+    app.state.http_clients = init_http_clients()
+    await start_ingest_queues()
+    yield
+    await stop_ingest_queues()
+    await close_http_clients()
+    close_vector_store()
+    flush_embedding_cache()
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="RAG API",
         description="API for RAG-powered question answering",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     setup_middlewares(app)
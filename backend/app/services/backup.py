@@ -0,0 +1,561 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+from vdb.manifest import INGEST_MANIFEST_FILENAME, IngestManifest
+
+from ..core.config import settings
+from ..utils.stream_pipe import ChunkFeed, PipeAborted, StreamPipe
+from .dsn import iter_object, read_object, upload_bytes, upload_path, upload_stream
+from .semantic_cache import semantic_cache
+from .vector_store import DEFAULT_TENANT, reload_vector_store, store_ingest_lock, store_write_lock
+
+logger = logging.getLogger(__name__)
+
+BACKUP_FILENAME = "chroma_backup.zip"
+BACKUP_MIME_TYPE = "application/zip"
+DECOMPRESS_READ_SIZE = 256 * 1024
+
+
+def snapshot_files(directory: str) -> Iterator[Tuple[str, str]]:
+    """(path, archive name) for every file under ``directory``, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, directory)
+
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+_SQLITE_SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def _is_sqlite(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def copy_store(directory: str, dest_dir: str) -> None:
+    """
+    Copy ``directory`` into ``dest_dir`` as of one point in time. Only the
+    copy runs under the store write lock; archiving and uploading work from
+    the copy, so writers aren't held up for the length of a DSN upload.
+    SQLite databases go through the backup API, which folds in their WAL,
+    so -wal/-shm sidecars are not copied. Runs in a worker thread.
+    """
+    with store_write_lock:
+        files = list(snapshot_files(directory))
+        databases = {path for path, _arcname in files if _is_sqlite(path)}
+        for path, arcname in files:
+            if path.endswith(_SQLITE_SIDECAR_SUFFIXES) and path.rsplit("-", 1)[0] in databases:
+                continue
+            target = os.path.join(dest_dir, arcname)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if path in databases:
+                source, copy = sqlite3.connect(path), sqlite3.connect(target)
+                try:
+                    source.backup(copy)
+                finally:
+                    copy.close()
+                    source.close()
+            else:
+                shutil.copy2(path, target)
+
+
+def snapshot_store() -> str:
+    """Point-in-time copy of CHROMA_PATH in a new directory next to it; the caller removes it."""
+    snapshot_dir = make_staging_dir(".chroma_snapshot_")
+    try:
+        copy_store(settings.CHROMA_PATH, snapshot_dir)
+    except BaseException:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+    return snapshot_dir
+
+
+def write_snapshot(directory: str, pipe: StreamPipe) -> None:
+    """
+    Zip ``directory`` (a copy from ``snapshot_store``) into ``pipe``. Runs
+    in a worker thread.
+    """
+    try:
+        # ZipFile falls back to data descriptors on an unseekable stream
+        with zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path, arcname in snapshot_files(directory):
+                archive.write(path, arcname)
+    except PipeAborted:
+        return
+    except BaseException as e:
+        try:
+            pipe.finish(e)
+        except PipeAborted:
+            pass
+        return
+    try:
+        pipe.finish()
+    except PipeAborted:
+        pass
+
+
+async def backup_database(session: Optional[aiohttp.ClientSession] = None) -> Tuple[str, dict]:
+    """
+    Archive CHROMA_PATH and upload it to DSN. Returns (upload_id, completion data).
+
+    In streaming mode (DB_BACKUP_STREAMING) the archive is compressed in a
+    worker thread and piped chunk by chunk into the upload, with no temp
+    file. Otherwise it is written to a private temp directory first and
+    uploaded resumably.
+    """
+    if settings.DB_BACKUP_STREAMING:
+        return await _backup_streaming(session)
+    return await _backup_via_file(session)
+
+
+async def _backup_streaming(session: Optional[aiohttp.ClientSession]) -> Tuple[str, dict]:
+    loop = asyncio.get_running_loop()
+    snapshot_dir = await loop.run_in_executor(None, snapshot_store)
+    try:
+        pipe = StreamPipe(loop, settings.DSN_UPLOAD_CHUNK_SIZE, settings.DSN_UPLOAD_CONCURRENCY)
+        writer = loop.run_in_executor(None, write_snapshot, snapshot_dir, pipe)
+        try:
+            logger.info("Streaming database snapshot to DSN...")
+            return await upload_stream(pipe.chunks(), BACKUP_FILENAME, BACKUP_MIME_TYPE, session)
+        finally:
+            # Unblocks the writer if the upload failed before draining the pipe
+            pipe.aborted.set()
+            await writer
+    finally:
+        await loop.run_in_executor(None, shutil.rmtree, snapshot_dir, True)
+
+
+async def _backup_via_file(session: Optional[aiohttp.ClientSession]) -> Tuple[str, dict]:
+    loop = asyncio.get_running_loop()
+    workdir = tempfile.mkdtemp(prefix="chroma_backup_")
+    try:
+        def make_archive():
+            snapshot_dir = snapshot_store()
+            try:
+                return shutil.make_archive(os.path.join(workdir, "chroma_backup"), "zip", snapshot_dir)
+            finally:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+        logger.info("Creating zip archive...")
+        zip_path = await loop.run_in_executor(None, make_archive)
+        logger.info(f"Zip file size: {os.path.getsize(zip_path)} bytes")
+        return await upload_path(zip_path, BACKUP_FILENAME, BACKUP_MIME_TYPE, session)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "chroma_manifest.json"
+MANIFEST_MIME_TYPE = "application/json"
+BLOCK_MIME_TYPE = "application/octet-stream"
+
+
+class BlockIndex:
+    """
+    Local record of which content blocks are already stored on DSN
+    (sha256 -> CID), so incremental backups only upload blocks that changed.
+    Losing it is harmless: the next backup simply uploads everything again.
+    """
+
+    def __init__(self, path: str, blocks: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.blocks: Dict[str, str] = blocks or {}
+
+    @classmethod
+    def load(cls, path: str) -> "BlockIndex":
+        try:
+            with open(path) as f:
+                return cls(path, json.load(f).get("blocks", {}))
+        except (OSError, ValueError):
+            return cls(path)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"blocks": self.blocks}, f)
+        os.replace(tmp_path, self.path)
+
+
+def scan_blocks(
+    directory: str,
+    block_size: int,
+    known: Dict[str, str],
+    upload_block: Callable[[str, bytes], concurrent.futures.Future],
+    max_in_flight: int
+) -> Tuple[List[dict], Dict[str, str], dict]:
+    """
+    Split every file under ``directory`` (a copy from ``snapshot_store``, so
+    the file list and block hashes describe one point in time) into
+    fixed-size blocks and hash them, handing blocks missing from ``known``
+    to ``upload_block``. Runs in a worker thread.
+
+    Returns the manifest file entries, the digest -> CID map of every block
+    they reference, and counters.
+    """
+    files: List[dict] = []
+    block_cids: Dict[str, str] = {}
+    in_flight: Dict[concurrent.futures.Future, str] = {}
+    stats = {"files": 0, "blocks_total": 0, "blocks_uploaded": 0, "bytes_changed": 0}
+
+    def collect(return_when):
+        done, _ = concurrent.futures.wait(in_flight, return_when=return_when)
+        for future in done:
+            block_cids[in_flight.pop(future)] = future.result()
+
+    try:
+        for path, arcname in snapshot_files(directory):
+            digests = []
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    digest = hashlib.sha256(block).hexdigest()
+                    digests.append(digest)
+                    stats["blocks_total"] += 1
+                    if digest in block_cids or digest in in_flight.values():
+                        continue
+                    if digest in known:
+                        block_cids[digest] = known[digest]
+                        continue
+                    if len(in_flight) >= max_in_flight:
+                        collect(concurrent.futures.FIRST_COMPLETED)
+                    in_flight[upload_block(digest, block)] = digest
+                    stats["blocks_uploaded"] += 1
+                    stats["bytes_changed"] += len(block)
+            files.append({"path": arcname, "size": os.path.getsize(path), "blocks": digests})
+            stats["files"] += 1
+        while in_flight:
+            collect(concurrent.futures.FIRST_COMPLETED)
+    finally:
+        for future in in_flight:
+            future.cancel()
+    return files, block_cids, stats
+
+
+async def backup_database_incremental(
+    session: Optional[aiohttp.ClientSession] = None
+) -> Tuple[str, dict, dict]:
+    """
+    Back up CHROMA_PATH as content blocks plus a manifest. Only blocks not
+    uploaded by an earlier backup are sent; unchanged SQLite pages and HNSW
+    segments are referenced by their existing CIDs. Returns
+    (manifest upload_id, manifest completion data, counters).
+    """
+    loop = asyncio.get_running_loop()
+    index = BlockIndex.load(settings.DB_BACKUP_STATE_PATH)
+
+    async def upload_block(digest: str, data: bytes) -> str:
+        # Blocks are identified by their raw content but stored compressed
+        compressed = await loop.run_in_executor(None, zlib.compress, data)
+        _upload_id, completion = await upload_bytes(compressed, f"{digest}.blk", BLOCK_MIME_TYPE, session)
+        return completion["cid"]
+
+    def submit(digest: str, data: bytes) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(upload_block(digest, data), loop)
+
+    snapshot_dir = await loop.run_in_executor(None, snapshot_store)
+    try:
+        files, block_cids, stats = await loop.run_in_executor(
+            None,
+            scan_blocks,
+            snapshot_dir,
+            settings.DB_BACKUP_BLOCK_SIZE,
+            index.blocks,
+            submit,
+            settings.DSN_UPLOAD_CONCURRENCY
+        )
+    finally:
+        await loop.run_in_executor(None, shutil.rmtree, snapshot_dir, True)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created_at": time.time(),
+        "block_size": settings.DB_BACKUP_BLOCK_SIZE,
+        "compression": "zlib",
+        "files": files,
+        "blocks": block_cids,
+    }
+    upload_id, completion_data = await upload_bytes(
+        json.dumps(manifest).encode("utf-8"), MANIFEST_FILENAME, MANIFEST_MIME_TYPE, session
+    )
+
+    # Remember only blocks the latest manifest references, so the index
+    # doesn't grow with every page that was ever rewritten
+    index.blocks = block_cids
+    await loop.run_in_executor(None, index.save)
+    logger.info(
+        f"Incremental backup: {stats['blocks_uploaded']}/{stats['blocks_total']} blocks uploaded "
+        f"({stats['bytes_changed']} bytes changed)"
+    )
+    return upload_id, completion_data, stats
+
+
+async def restore_backup(cid: str, session: Optional[aiohttp.ClientSession] = None) -> dict:
+    """
+    Replace CHROMA_PATH with the backup stored under ``cid`` and swap it in
+    under the shared store. ``cid`` may be a full zip backup, which is
+    unpacked while it downloads, or an incremental backup manifest. Nothing
+    is re-embedded, so restore time is bounded by download speed. Returns
+    counters.
+    """
+    stream = iter_object(cid, session)
+    # Chunk boundaries are up to the server and can split the signature
+    first = b""
+    async for block in stream:
+        first += block
+        if len(first) >= len(ZIP_LOCAL_HEADER_SIGNATURE):
+            break
+    if first.startswith(ZIP_LOCAL_HEADER_SIGNATURE):
+        return await _restore_zip(first, stream)
+
+    # Manifests are small JSON documents
+    parts = [first]
+    async for block in stream:
+        parts.append(block)
+    try:
+        manifest = json.loads(b"".join(parts))
+    except ValueError:
+        raise ValueError(f"{cid} is neither a zip backup nor a backup manifest")
+    return await _restore_manifest(manifest, session)
+
+
+async def _restore_zip(first: bytes, stream: AsyncIterator[bytes]) -> dict:
+    loop = asyncio.get_running_loop()
+    feed = ChunkFeed(loop, depth=4)
+    staging_dir = make_staging_dir()
+    extractor = loop.run_in_executor(None, extract_zip_stream, feed, staging_dir)
+
+    async def feed_block(block: bytes) -> None:
+        # Don't wait on a full queue the extractor will never drain again
+        put = asyncio.ensure_future(feed.put(block))
+        await asyncio.wait([put, extractor], return_when=asyncio.FIRST_COMPLETED)
+        put.cancel()
+
+    try:
+        await feed_block(first)
+        async for block in stream:
+            if extractor.done():
+                break
+            await feed_block(block)
+        if not extractor.done():
+            await feed_block(b"")
+        files = await extractor
+        await swap_in_store(staging_dir)
+    except BaseException:
+        feed.aborted.set()
+        await asyncio.wait([extractor])
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    finally:
+        await stream.aclose()
+    return {"format": "zip", "files": files}
+
+
+async def _restore_manifest(manifest: dict, session: Optional[aiohttp.ClientSession]) -> dict:
+    """
+    Rebuild the store from an incremental backup manifest, fetching its
+    blocks with DSN_DOWNLOAD_CONCURRENCY downloads in flight.
+    """
+    loop = asyncio.get_running_loop()
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported backup manifest version: {manifest.get('version')}")
+
+    block_size = manifest["block_size"]
+    # Each unique block is fetched once and written to every place it occurs
+    placements: Dict[str, List[Tuple[str, int]]] = {}
+    for entry in manifest["files"]:
+        for position, digest in enumerate(entry["blocks"]):
+            placements.setdefault(digest, []).append((entry["path"], position * block_size))
+
+    staging_dir = make_staging_dir()
+    try:
+        def allocate():
+            for entry in manifest["files"]:
+                path = _staged_path(staging_dir, entry["path"])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.truncate(entry["size"])
+        await loop.run_in_executor(None, allocate)
+
+        semaphore = asyncio.Semaphore(settings.DSN_DOWNLOAD_CONCURRENCY)
+
+        async def fetch(digest: str):
+            async with semaphore:
+                data = await read_object(manifest["blocks"][digest], session)
+            data = await loop.run_in_executor(None, zlib.decompress, data)
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Backup block {digest} failed its integrity check")
+            await loop.run_in_executor(None, _write_block, staging_dir, placements[digest], data)
+
+        fetches = [asyncio.ensure_future(fetch(digest)) for digest in placements]
+        try:
+            await asyncio.gather(*fetches)
+        except BaseException:
+            for task in fetches:
+                task.cancel()
+            raise
+        await swap_in_store(staging_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # The restored blocks are on DSN already; the next incremental backup
+    # from this node only needs to send what changes after the restore
+    index = BlockIndex(settings.DB_BACKUP_STATE_PATH, dict(manifest["blocks"]))
+    await loop.run_in_executor(None, index.save)
+    return {"format": "manifest", "files": len(manifest["files"]), "blocks_downloaded": len(placements)}
+
+
+def _staged_path(staging_dir: str, arcname: str) -> str:
+    path = os.path.normpath(os.path.join(staging_dir, arcname))
+    if not path.startswith(os.path.join(staging_dir, "")):
+        raise ValueError(f"Backup entry escapes the store directory: {arcname}")
+    return path
+
+
+def _write_block(staging_dir: str, placements: List[Tuple[str, int]], data: bytes) -> None:
+    for arcname, offset in placements:
+        with open(_staged_path(staging_dir, arcname), "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+
+
+def make_staging_dir(prefix: str = ".chroma_restore_") -> str:
+    """Empty directory next to CHROMA_PATH, so the final swap is a same-filesystem rename."""
+    parent = os.path.dirname(os.path.abspath(settings.CHROMA_PATH))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+
+async def swap_in_store(staging_dir: str) -> None:
+    """
+    Replace CHROMA_PATH with ``staging_dir`` and point the shared store at
+    it. The renames and the handle reload happen under the write lock, so
+    no writer can land in the store being replaced; readers holding the old
+    handle finish on the old files.
+    """
+    loop = asyncio.get_running_loop()
+    chroma_path = settings.CHROMA_PATH
+
+    def swap() -> Optional[str]:
+        # The backup's source PDFs usually aren't on this node
+        manifest = IngestManifest.load(os.path.join(staging_dir, INGEST_MANIFEST_FILENAME))
+        if manifest.files and manifest.mark_restored():
+            manifest.save()
+        # Wait out a running ingestion rather than swap the store under it
+        with store_ingest_lock, store_write_lock:
+            retired = None
+            if os.path.exists(chroma_path):
+                retired = staging_dir + ".retired"
+                os.replace(chroma_path, retired)
+            os.replace(staging_dir, chroma_path)
+            reload_vector_store()
+            return retired
+
+    retired = await loop.run_in_executor(None, swap)
+    semantic_cache.invalidate(DEFAULT_TENANT)
+    if retired:
+        await loop.run_in_executor(None, shutil.rmtree, retired, True)
+
+
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_CENTRAL_DIRECTORY_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_ZIP64_EXTRA_ID = 0x0001
+_FLAG_ENCRYPTED = 0x01
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+def extract_zip_stream(feed: ChunkFeed, dest_dir: str) -> int:
+    """
+    Unpack a zip archive front to back as it streams in, without the
+    central directory. Handles what zipfile writes for our snapshots:
+    stored or deflated members, data descriptors and zip64 sizes. Returns
+    the number of files written. Runs in a worker thread.
+    """
+    files = 0
+    while True:
+        signature = feed.read_exact(4)
+        if signature in _CENTRAL_DIRECTORY_SIGNATURES:
+            return files
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            raise ValueError("Backup archive is not a valid zip file")
+        (_sig, _version, flags, method, _time, _date, crc, compressed_size, size, name_length,
+         extra_length) = _LOCAL_HEADER.unpack(signature + feed.read_exact(_LOCAL_HEADER.size - 4))
+        name = feed.read_exact(name_length).decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        zip64_sizes = _zip64_sizes(feed.read_exact(extra_length))
+        if zip64_sizes:
+            size, compressed_size = zip64_sizes
+        if flags & _FLAG_ENCRYPTED:
+            raise ValueError(f"Encrypted zip member {name} is not supported")
+
+        target = _staged_path(dest_dir, name)
+        if name.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            feed.read_exact(compressed_size)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        actual_crc = 0
+        with open(target, "wb") as out:
+            if method == zipfile.ZIP_DEFLATED:
+                # Deflate streams are self-terminating, so the member's end
+                # is found without knowing its size up front
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                while not decompressor.eof:
+                    data = feed.read_some(DECOMPRESS_READ_SIZE)
+                    if not data:
+                        raise ValueError("Backup archive is truncated")
+                    plain = decompressor.decompress(data)
+                    actual_crc = zlib.crc32(plain, actual_crc)
+                    out.write(plain)
+                feed.unread(decompressor.unused_data)
+            elif method == zipfile.ZIP_STORED and not (flags & _FLAG_DATA_DESCRIPTOR and not compressed_size):
+                remaining = compressed_size
+                while remaining:
+                    data = feed.read_some(min(remaining, DECOMPRESS_READ_SIZE))
+                    if not data:
+                        raise ValueError("Backup archive is truncated")
+                    remaining -= len(data)
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    out.write(data)
+            else:
+                raise ValueError(f"Unsupported zip member {name} (method {method})")
+
+        if flags & _FLAG_DATA_DESCRIPTOR:
+            head = feed.read_exact(4)
+            if head == _DATA_DESCRIPTOR_SIGNATURE:
+                head = feed.read_exact(4)
+            crc = struct.unpack("<I", head)[0]
+            feed.read_exact(16 if zip64_sizes else 8)
+        if actual_crc != crc:
+            raise ValueError(f"Zip member {name} failed its CRC check")
+        files += 1
+
+
+def _zip64_sizes(extra: bytes) -> Optional[Tuple[int, int]]:
+    """(size, compressed size) from a zip64 extra field, if present."""
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, length = struct.unpack_from("<HH", extra, offset)
+        if field_id == _ZIP64_EXTRA_ID and length >= 16:
+            return struct.unpack_from("<QQ", extra, offset + 4)
+        offset += 4 + length
+    return None
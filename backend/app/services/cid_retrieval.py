@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+
+import aiohttp
+
+from ..core.config import settings
+from ..utils.cid_index import claim_filename, lookup_cid, record_cid
+from ..utils.lexical_index import get_lexical_index
+from ..utils.object_cache import CID_PATTERN, file_sha256, get_object_cache, link_or_copy
+from ..utils.tee_decryption import decrypt_tee_file
+from .dsn import DSNError, download_object
+from .http_client import get_dsn_session
+
+logger = logging.getLogger(__name__)
+
+# Claiming a filename and recording it must not interleave between CIDs
+_placement_lock = threading.Lock()
+
+RETRIEVED = "retrieved"
+PRESENT = "present"
+FAILED = "failed"
+
+# Where a retrieved file came from
+SOURCE_LOCAL = "local"
+SOURCE_CACHE = "cache"
+SOURCE_DSN = "dsn"
+
+
+class InvalidCIDError(ValueError):
+    """A CID that isn't alphanumeric; it never reaches a DSN URL or a path."""
+
+
+def _local_copy(data_path: str, cid: str) -> Optional[str]:
+    """Filename of ``cid``'s file in ``data_path`` if it is still what was retrieved."""
+    entry = lookup_cid(data_path, cid)
+    if not entry or not entry.get("sha256"):
+        return None
+    path = os.path.join(data_path, entry["filename"])
+    if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+        return None
+    return entry["filename"] if file_sha256(path) == entry["sha256"] else None
+
+
+def _restore_from_cache(data_path: str, cid: str) -> Optional[str]:
+    """Link a verified cached object into ``data_path``; returns its filename."""
+    cached = get_object_cache().get(cid)
+    if cached is None:
+        return None
+    with _placement_lock:
+        filename = claim_filename(data_path, cached["filename"], cid)
+        link_or_copy(cached["path"], os.path.join(data_path, filename))
+        record_cid(data_path, filename, cid, cached["size"], cached["sha256"])
+    return filename
+
+
+async def _download(cid: str, data_path: str, session: Optional[aiohttp.ClientSession]) -> str:
+    # Each download gets its own directory so concurrent CIDs whose objects
+    # share a filename can't clobber each other's partial files
+    download_dir = tempfile.mkdtemp(prefix=".retrieve-", dir=data_path)
+    loop = asyncio.get_running_loop()
+    try:
+        # Stream the encrypted file from DSN straight to disk
+        encrypted_file_path = await download_object(cid, download_dir, session)
+        decrypted_file_path = os.path.join(download_dir, f"{cid}.decrypted")
+
+        # Decryption streams through a bounded buffer; keep it off the event loop
+        decrypted = await loop.run_in_executor(None, lambda: decrypt_tee_file(
+            encrypted_file_path=encrypted_file_path,
+            private_key_path=settings.PRIVATE_KEY_PATH,
+            output_file_path=decrypted_file_path
+        ))
+        if not decrypted:
+            raise RuntimeError("Failed to decrypt file")
+
+        def place() -> str:
+            requested = os.path.basename(encrypted_file_path).replace('.msgpack', '')
+            size = os.path.getsize(decrypted_file_path)
+            sha256 = file_sha256(decrypted_file_path)
+            try:
+                get_object_cache().put(cid, decrypted_file_path, requested, sha256)
+            except OSError as e:
+                logger.warning(f"Could not cache object {cid}: {e}")
+            with _placement_lock:
+                filename = claim_filename(data_path, requested, cid)
+                os.replace(decrypted_file_path, os.path.join(data_path, filename))
+                record_cid(data_path, filename, cid, size, sha256)
+            return filename
+
+        return await loop.run_in_executor(None, place)
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+async def retrieve_cid(
+    cid: str,
+    data_path: str,
+    chroma_path: Optional[str] = None,
+    session: Optional[aiohttp.ClientSession] = None
+) -> dict:
+    """
+    Make ``cid``'s decrypted file available in ``data_path``, cheapest
+    source first: an unchanged local copy from an earlier retrieve, then
+    the local object cache, then a DSN download and decrypt. Returns
+    {"cid", "status", "name", "source", "chunks"} where ``chunks`` counts
+    the chunks already indexed for the CID. Raises InvalidCIDError,
+    DSNError or RuntimeError on failure. Does not trigger ingestion.
+    """
+    if not CID_PATTERN.match(cid):
+        raise InvalidCIDError(f"Invalid CID: {cid!r}")
+    os.makedirs(data_path, exist_ok=True)
+    loop = asyncio.get_running_loop()
+
+    filename = await loop.run_in_executor(None, _local_copy, data_path, cid)
+    if filename is not None:
+        chunks = await loop.run_in_executor(None, get_lexical_index(chroma_path).chunk_ids, cid)
+        return {"cid": cid, "status": PRESENT, "name": filename, "source": SOURCE_LOCAL, "chunks": len(chunks)}
+
+    filename = await loop.run_in_executor(None, _restore_from_cache, data_path, cid)
+    source = SOURCE_CACHE
+    if filename is None:
+        filename = await _download(cid, data_path, session)
+        source = SOURCE_DSN
+    return {"cid": cid, "status": RETRIEVED, "name": filename, "source": source, "chunks": 0}
+
+
+def needs_ingest(result: dict) -> bool:
+    """A new file arrived, or a present one never made it into the index."""
+    return result["status"] == RETRIEVED or (result["status"] == PRESENT and not result["chunks"])
+
+
+async def retrieve_cids(
+    cids: List[str],
+    data_path: str,
+    chroma_path: Optional[str] = None,
+    session: Optional[aiohttp.ClientSession] = None
+) -> List[dict]:
+    """
+    Retrieve several CIDs with at most DSN_DOWNLOAD_CONCURRENCY in flight.
+    Duplicate CIDs are fetched once. Returns one status entry per distinct
+    CID, in request order; failures don't stop the rest. A malformed CID
+    fails with "http_status": 400 without touching DSN.
+    """
+    session = session or get_dsn_session()
+    semaphore = asyncio.Semaphore(settings.DSN_DOWNLOAD_CONCURRENCY)
+
+    async def fetch(cid: str) -> dict:
+        async with semaphore:
+            try:
+                return await retrieve_cid(cid, data_path, chroma_path, session)
+            except InvalidCIDError as e:
+                return {"cid": cid, "status": FAILED, "error": str(e), "http_status": 400}
+            except DSNError as e:
+                logger.warning(f"Retrieving {cid} failed: {e.detail}")
+                return {"cid": cid, "status": FAILED, "error": e.detail, "dsn_status": e.status}
+            except Exception as e:
+                logger.warning(f"Retrieving {cid} failed: {e}")
+                return {"cid": cid, "status": FAILED, "error": str(e)}
+
+    return await asyncio.gather(*(fetch(cid) for cid in dict.fromkeys(cids)))
@@ -1,12 +1,20 @@
 import asyncio
-from ..core.config import settings
+from typing import Optional
+
+from .vector_store import tenant_paths
 from vdb.populate_db import main as populate_db
 
-async def update_database():
+async def update_database(progress=None, tenant: Optional[str] = None):
     """
     Updates the Chroma database with new documents.
-    Runs the populate_db script asynchronously.
+    Runs the populate_db script asynchronously. ``progress`` is called
+    from the worker thread with dicts of running counts. ``tenant`` selects
+    whose shard is ingested; the default one is CHROMA_PATH/DATA_PATH.
     """
+    chroma_path, data_path = tenant_paths(tenant)
+
     # Run populate_db in a separate thread to avoid blocking
     loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, lambda: populate_db(reset=False))
\ No newline at end of file
+    await loop.run_in_executor(None, lambda: populate_db(reset=False, progress=progress, chroma_path=chroma_path, data_path=data_path, tenant=tenant))
+    # populate_db's handle shares the query handle's chromadb system, so
+    # the new chunks are already visible; no reload needed
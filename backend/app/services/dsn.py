@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Optional, Tuple
+
+import aiohttp
+
+from ..core.config import settings
+from .http_client import get_dsn_session
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class DSNError(Exception):
+    """Non-success response from the Auto-Drive API."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def auth_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {settings.DSN_API_KEY}",
+        "X-Auth-Provider": "apikey"
+    }
+
+
+async def download_object(
+    cid: str,
+    dest_dir: str,
+    session: Optional[aiohttp.ClientSession] = None
+) -> str:
+    """
+    Stream ``/objects/{cid}/download`` to ``dest_dir`` in fixed-size blocks
+    and return the saved path. Only one block is held in memory at a time and
+    file writes run off the event loop.
+    """
+    session = session or get_dsn_session()
+
+    url = f"{settings.DSN_BASE_URL}/objects/{cid}/download"
+    async with session.get(url, headers=auth_headers()) as response:
+        if response.status != 200:
+            raise DSNError(response.status, "Failed to download file from DSN")
+
+        # Get filename from headers or use CID as filename
+        content_disposition = response.headers.get("Content-Disposition", "")
+        # basename() keeps a hostile header from writing outside dest_dir
+        filename = os.path.basename(content_disposition.split("filename=")[-1].strip('"')) or f"{cid}.msgpack"
+        file_path = os.path.join(dest_dir, filename)
+        partial_path = file_path + ".part"
+
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, open, partial_path, "wb")
+        try:
+            async for block in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                await loop.run_in_executor(None, f.write, block)
+        except BaseException:
+            f.close()
+            os.remove(partial_path)
+            raise
+        await loop.run_in_executor(None, f.close)
+
+    os.replace(partial_path, file_path)
+    return file_path
+
+
+async def iter_object(cid: str, session: Optional[aiohttp.ClientSession] = None) -> AsyncIterator[bytes]:
+    """Stream ``/objects/{cid}/download`` in DOWNLOAD_CHUNK_SIZE blocks."""
+    session = session or get_dsn_session()
+    url = f"{settings.DSN_BASE_URL}/objects/{cid}/download"
+    async with session.get(url, headers=auth_headers()) as response:
+        if response.status != 200:
+            raise DSNError(response.status, f"Failed to download object {cid} from DSN")
+        async for block in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            yield block
+
+
+async def read_object(cid: str, session: Optional[aiohttp.ClientSession] = None) -> bytes:
+    """Fetch a small object (a manifest or backup block) into memory."""
+    session = session or get_dsn_session()
+    url = f"{settings.DSN_BASE_URL}/objects/{cid}/download"
+    async with session.get(url, headers=auth_headers()) as response:
+        if response.status != 200:
+            raise DSNError(response.status, f"Failed to download object {cid} from DSN")
+        return await response.read()
+
+
+# Status codes worth retrying a chunk for; anything else fails the upload
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+async def create_upload(session: aiohttp.ClientSession, filename: str, mime_type: str) -> str:
+    create_data = {
+        "filename": filename,
+        "mimeType": mime_type,
+        "uploadOptions": None
+    }
+    async with session.post(
+        f"{settings.DSN_BASE_URL}/uploads/file",
+        headers={**auth_headers(), "Content-Type": "application/json"},
+        json=create_data
+    ) as response:
+        if response.status != 200:
+            response_text = await response.text()
+            logger.error(f"Failed to create upload. Status: {response.status}, Response: {response_text}")
+            raise DSNError(response.status, f"Failed to create upload: {response_text}")
+        upload_data = await response.json()
+        logger.info(f"Upload created with ID: {upload_data['id']}")
+        return upload_data["id"]
+
+
+async def upload_chunk(
+    session: aiohttp.ClientSession,
+    upload_id: str,
+    index: int,
+    data: bytes,
+    filename: str,
+    mime_type: str
+) -> None:
+    """Upload one chunk, retrying transient failures with exponential backoff."""
+    delay = 0.5
+    for attempt in range(settings.DSN_UPLOAD_RETRIES + 1):
+        form_data = aiohttp.FormData()
+        form_data.add_field("file", data, filename=filename, content_type=mime_type)
+        form_data.add_field("index", str(index))
+        try:
+            async with session.post(
+                f"{settings.DSN_BASE_URL}/uploads/file/{upload_id}/chunk",
+                headers=auth_headers(),
+                data=form_data
+            ) as response:
+                if response.status == 200:
+                    return
+                response_text = await response.text()
+                if response.status not in RETRYABLE_STATUSES or attempt == settings.DSN_UPLOAD_RETRIES:
+                    raise DSNError(response.status, f"Failed to upload chunk {index}: {response_text}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == settings.DSN_UPLOAD_RETRIES:
+                raise
+            logger.warning(f"Chunk {index} of upload {upload_id} failed ({e.__class__.__name__})")
+        await asyncio.sleep(delay * (1 + random.random()))
+        delay = min(delay * 2, 30.0)
+
+
+async def complete_upload(session: aiohttp.ClientSession, upload_id: str) -> dict:
+    async with session.post(
+        f"{settings.DSN_BASE_URL}/uploads/{upload_id}/complete",
+        headers={**auth_headers(), "Content-Type": "application/json"}
+    ) as response:
+        if response.status != 200:
+            response_text = await response.text()
+            logger.error(f"Failed to complete upload. Status: {response.status}, Response: {response_text}")
+            raise DSNError(response.status, f"Failed to complete upload: {response_text}")
+        logger.info("Upload completed successfully")
+        return await response.json()
+
+
+async def upload_chunks(
+    session: aiohttp.ClientSession,
+    upload_id: str,
+    chunks: AsyncIterator[Tuple[int, bytes]],
+    filename: str,
+    mime_type: str,
+    on_chunk_done: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Upload ``(index, data)`` pairs from ``chunks`` with at most
+    DSN_UPLOAD_CONCURRENCY requests in flight. The source is only read as
+    slots free up, so at most that many chunks are held in memory.
+    Returns the number of chunks uploaded.
+    """
+    in_flight = {}
+    uploaded = 0
+
+    async def drain(return_when):
+        nonlocal uploaded
+        done, _ = await asyncio.wait(in_flight, return_when=return_when)
+        for task in done:
+            index = in_flight.pop(task)
+            task.result()
+            uploaded += 1
+            if on_chunk_done:
+                on_chunk_done(index)
+
+    try:
+        async for index, data in chunks:
+            if len(in_flight) >= settings.DSN_UPLOAD_CONCURRENCY:
+                await drain(asyncio.FIRST_COMPLETED)
+            task = asyncio.create_task(upload_chunk(session, upload_id, index, data, filename, mime_type))
+            in_flight[task] = index
+        while in_flight:
+            await drain(asyncio.FIRST_COMPLETED)
+    finally:
+        for task in in_flight:
+            task.cancel()
+        # Wait for the cancellations and retrieve the other tasks' errors
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    return uploaded
+
+
+async def upload_stream(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    mime_type: str,
+    session: Optional[aiohttp.ClientSession] = None
+) -> Tuple[str, dict]:
+    """
+    Chunked upload of a payload produced on the fly, e.g. an archive being
+    written by another thread. Chunks are retried individually, but the
+    upload as a whole can't be resumed since the source can't be replayed.
+    Returns (upload_id, completion data).
+    """
+    session = session or get_dsn_session()
+
+    async def indexed():
+        index = 0
+        async for data in chunks:
+            yield index, data
+            index += 1
+
+    upload_id = await create_upload(session, filename, mime_type)
+    await upload_chunks(session, upload_id, indexed(), filename, mime_type)
+    return upload_id, await complete_upload(session, upload_id)
+
+
+async def upload_bytes(
+    data: bytes,
+    filename: str,
+    mime_type: str,
+    session: Optional[aiohttp.ClientSession] = None
+) -> Tuple[str, dict]:
+    """Chunked upload of an in-memory payload. Returns (upload_id, completion data)."""
+    chunk_size = settings.DSN_UPLOAD_CHUNK_SIZE
+    view = memoryview(data)
+
+    async def chunks():
+        for offset in range(0, max(len(data), 1), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+
+    return await upload_stream(chunks(), filename, mime_type, session)
+
+
+async def upload_path(
+    file_path: str,
+    filename: str,
+    mime_type: str,
+    session: Optional[aiohttp.ClientSession] = None
+) -> Tuple[str, dict]:
+    """
+    Resumable chunked upload of a file on disk. Chunks are read lazily off
+    the event loop. Progress is kept in a state file keyed by the file's
+    content hash, so retrying after a failure reuses the upload and skips
+    chunks the server already has. State older than DSN_UPLOAD_STATE_TTL is
+    discarded, and an upload the server rejects with a 4xx on resume (e.g.
+    it expired) is replaced by a new one. Returns (upload_id, completion data).
+    """
+    session = session or get_dsn_session()
+
+    loop = asyncio.get_running_loop()
+    chunk_size = settings.DSN_UPLOAD_CHUNK_SIZE
+    file_size = os.path.getsize(file_path)
+    chunk_count = max(1, -(-file_size // chunk_size))
+
+    content_hash = await loop.run_in_executor(None, _file_sha256, file_path)
+    state_path = os.path.join(
+        settings.DSN_UPLOAD_STATE_DIR,
+        f"{hashlib.sha256(f'{content_hash}:{chunk_size}:{filename}'.encode()).hexdigest()}.json"
+    )
+    state = _load_upload_state(state_path)
+    if state is not None:
+        logger.info(
+            f"Resuming upload {state['upload_id']}: "
+            f"{len(state['completed'])}/{chunk_count} chunks already uploaded"
+        )
+        try:
+            return await _upload_file_chunks(session, file_path, chunk_count, state, state_path, filename, mime_type)
+        except DSNError as e:
+            if not 400 <= e.status < 500 or e.status in RETRYABLE_STATUSES:
+                raise
+            # The server expired or forgot the upload; start a new one, once
+            logger.warning(f"Upload {state['upload_id']} can't be resumed ({e.status}); starting over")
+            _remove_upload_state(state_path)
+
+    state = {
+        "upload_id": await create_upload(session, filename, mime_type),
+        "file_path": file_path,
+        "chunk_size": chunk_size,
+        "created_at": time.time(),
+        "completed": []
+    }
+    _save_upload_state(state_path, state)
+    return await _upload_file_chunks(session, file_path, chunk_count, state, state_path, filename, mime_type)
+
+
+async def _upload_file_chunks(
+    session: aiohttp.ClientSession,
+    file_path: str,
+    chunk_count: int,
+    state: dict,
+    state_path: str,
+    filename: str,
+    mime_type: str
+) -> Tuple[str, dict]:
+    """Send the chunks ``state`` doesn't list as completed, then complete the upload."""
+    loop = asyncio.get_running_loop()
+    chunk_size = state["chunk_size"]
+    upload_id = state["upload_id"]
+    completed = set(state["completed"])
+
+    def mark_done(index: int):
+        completed.add(index)
+        state["completed"] = sorted(completed)
+        _save_upload_state(state_path, state)
+
+    with open(file_path, "rb") as f:
+        fd = f.fileno()
+
+        async def chunks():
+            for index in range(chunk_count):
+                if index in completed:
+                    continue
+                data = await loop.run_in_executor(None, os.pread, fd, chunk_size, index * chunk_size)
+                yield index, data
+
+        await upload_chunks(session, upload_id, chunks(), filename, mime_type, mark_done)
+
+    completion_data = await complete_upload(session, upload_id)
+    _remove_upload_state(state_path)
+    return upload_id, completion_data
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_upload_state(state_path: str) -> Optional[dict]:
+    """Saved progress for an upload, unless it is missing, unreadable or older than DSN_UPLOAD_STATE_TTL."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        # State files from before created_at was recorded age from their mtime
+        created_at = state.get("created_at") or os.path.getmtime(state_path)
+    except (OSError, ValueError):
+        return None
+    if time.time() - created_at > settings.DSN_UPLOAD_STATE_TTL:
+        logger.info(f"Discarding expired upload state for {state.get('upload_id')}")
+        _remove_upload_state(state_path)
+        return None
+    return state
+
+
+def _remove_upload_state(state_path: str) -> None:
+    try:
+        os.remove(state_path)
+    except FileNotFoundError:
+        pass
+
+
+def _save_upload_state(state_path: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
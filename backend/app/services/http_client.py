@@ -0,0 +1,118 @@
+import asyncio
+from typing import Dict, Optional
+
+import aiohttp
+
+from ..core.config import settings
+
+DSN = "dsn"
+VM = "vm"
+GOOGLE = "google"
+
+# Per-service bound on a stalled read
+_READ_TIMEOUTS = {
+    DSN: lambda: settings.DSN_READ_TIMEOUT,
+    VM: lambda: settings.VM_READ_TIMEOUT,
+    GOOGLE: lambda: settings.SEARCH_READ_TIMEOUT,
+}
+
+# Per-service bound on a whole request. DSN transfers and streamed VM
+# generations can legitimately run long, so only search gets one.
+_TOTAL_TIMEOUTS = {
+    DSN: lambda: None,
+    VM: lambda: None,
+    GOOGLE: lambda: settings.SEARCH_TOTAL_TIMEOUT,
+}
+
+
+class HTTPClients:
+    """
+    App-lifetime aiohttp sessions for the external services: Auto-Drive
+    (DSN), the TEE VM and Google Custom Search. Each keeps its own keep-alive
+    connection pool, per-host limit and DNS cache, so requests reuse open
+    TCP/TLS connections instead of paying a fresh handshake every time.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, service: str) -> aiohttp.ClientSession:
+        # Sessions are bound to the loop they were created on; scripts that
+        # call asyncio.run() more than once get a fresh set per loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                _release_sessions(self._loop, self._sessions)
+            self._sessions = {}
+            self._loop = loop
+        session = self._sessions.get(service)
+        if session is None or session.closed:
+            session = self._sessions[service] = self._open(service)
+        return session
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+    def _open(self, service: str) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_SIZE,
+            limit_per_host=settings.HTTP_POOL_SIZE_PER_HOST,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT
+        )
+        # ``connect`` also covers waiting for a free connection in the pool,
+        # which ``sock_connect`` alone doesn't
+        timeout = aiohttp.ClientTimeout(
+            total=_TOTAL_TIMEOUTS[service](),
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_read=_READ_TIMEOUTS[service]()
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def _release_sessions(loop: asyncio.AbstractEventLoop, sessions: Dict[str, aiohttp.ClientSession]) -> None:
+    """
+    Close sessions left behind by a previous event loop. A session can only
+    be closed on its own loop: if that loop is still alive the close is
+    handed to it. Once it has closed, nothing can await the close any more;
+    the session is detached instead, and its pooled connections are closed
+    as the connector is garbage collected.
+    """
+    for session in sessions.values():
+        if session.closed:
+            continue
+        if loop.is_closed():
+            session.detach()
+        else:
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+
+_clients = HTTPClients()
+
+
+def init_http_clients() -> HTTPClients:
+    """Open every session up front; call from the FastAPI lifespan."""
+    _clients.get(DSN)
+    _clients.get(VM)
+    _clients.get(GOOGLE)
+    return _clients
+
+
+def get_dsn_session() -> aiohttp.ClientSession:
+    return _clients.get(DSN)
+
+
+def get_vm_session() -> aiohttp.ClientSession:
+    return _clients.get(VM)
+
+
+def get_google_session() -> aiohttp.ClientSession:
+    return _clients.get(GOOGLE)
+
+
+async def close_http_clients() -> None:
+    await _clients.close()
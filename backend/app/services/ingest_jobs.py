@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from .db_manager import update_database
+from .vector_store import DEFAULT_TENANT, tenant_paths
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class IngestJobQueue:
+    """
+    Single-writer queue for re-indexing runs. Requests that arrive while a
+    run is in progress are merged into the next run, so concurrent
+    /retrieve calls never start overlapping rebuilds of the same store.
+    Jobs are persisted to disk and unfinished ones are re-queued on start.
+    Each tenant shard has its own queue, so one tenant's bulk ingest never
+    delays another's.
+    """
+
+    def __init__(self, path: str, history: int = 200, tenant: Optional[str] = None):
+        self.path = path
+        self.history = history
+        self.tenant = tenant
+        self.jobs: Dict[str, dict] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    async def start(self) -> None:
+        await self.flush()
+        self._load()
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+        if self._pending():
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Wait until the jobs file reflects every change made so far."""
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def enqueue(self, reason: str) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "reason": reason,
+            "status": QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "run_id": None,
+            "progress": {},
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self._save()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            batch = self._pending()
+            if not batch:
+                continue
+
+            # One run serves every job queued so far
+            run_id = uuid.uuid4().hex
+            progress: dict = {}
+            for job in batch:
+                job.update(status=RUNNING, started_at=time.time(), run_id=run_id, progress=progress)
+            self._save()
+            logger.info(f"Ingestion run {run_id} started for {len(batch)} job(s)")
+
+            # populate_db reports from a worker thread; apply updates on the
+            # loop so they never race with _flush serializing the same dict.
+            loop = asyncio.get_running_loop()
+
+            def report(values: dict, progress=progress):
+                loop.call_soon_threadsafe(progress.update, values)
+
+            try:
+                await update_database(progress=report, tenant=self.tenant)
+                status, error = SUCCEEDED, None
+            except Exception as e:
+                logger.error(f"Ingestion run {run_id} failed: {str(e)}", exc_info=True)
+                status, error = FAILED, str(e)
+
+            for job in batch:
+                job.update(status=status, finished_at=time.time(), error=error)
+            self._trim()
+            self._save()
+
+    def _pending(self) -> List[dict]:
+        return [job for job in self.jobs.values() if job["status"] == QUEUED]
+
+    def _trim(self) -> None:
+        finished = [job for job in self.jobs.values() if job["status"] in (SUCCEEDED, FAILED)]
+        finished.sort(key=lambda job: job["finished_at"])
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job["id"]]
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.jobs = {job["id"]: job for job in json.load(f)["jobs"]}
+        except (OSError, ValueError, KeyError):
+            self.jobs = {}
+        # A run interrupted by a restart never finished; queue it again
+        for job in self.jobs.values():
+            if job["status"] == RUNNING:
+                job.update(status=QUEUED, started_at=None, run_id=None, progress={})
+
+    def _save(self) -> None:
+        """
+        Schedule a write of the jobs file. The JSON is built on the loop,
+        where the jobs are mutated, and written by the executor; saves
+        requested while a write is in flight are folded into one more write.
+        """
+        self._dirty = True
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            self._dirty = False
+            data = json.dumps({"jobs": list(self.jobs.values())})
+            try:
+                await loop.run_in_executor(None, self._write, data)
+            except OSError as e:
+                logger.error(f"Could not save ingest jobs to {self.path}: {e}")
+
+    def _write(self, data: str) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+ingest_queue = IngestJobQueue(settings.INGEST_JOBS_PATH)
+_tenant_queues: Dict[str, IngestJobQueue] = {}
+
+
+def _tenant_jobs_path(tenant: str) -> str:
+    return os.path.join(os.path.dirname(tenant_paths(tenant)[0]), os.path.basename(settings.INGEST_JOBS_PATH))
+
+
+async def get_ingest_queue(tenant: Optional[str] = None) -> IngestJobQueue:
+    """The tenant's queue, started on first use."""
+    if not tenant or tenant == DEFAULT_TENANT:
+        return ingest_queue
+    queue = _tenant_queues.get(tenant)
+    if queue is None:
+        queue = _tenant_queues[tenant] = IngestJobQueue(_tenant_jobs_path(tenant), tenant=tenant)
+        await queue.start()
+    return queue
+
+
+async def start_ingest_queues() -> None:
+    """Start the default queue, plus any tenant queue left with persisted jobs."""
+    await ingest_queue.start()
+    if not os.path.isdir(settings.TENANTS_PATH):
+        return
+    for tenant in sorted(os.listdir(settings.TENANTS_PATH)):
+        try:
+            jobs_path = _tenant_jobs_path(tenant)
+        except ValueError:
+            continue
+        if os.path.exists(jobs_path):
+            await get_ingest_queue(tenant)
+
+
+async def stop_ingest_queues() -> None:
+    await ingest_queue.stop()
+    queues = list(_tenant_queues.values())
+    _tenant_queues.clear()
+    for queue in queues:
+        await queue.stop()
@@ -1,9 +1,24 @@
-from langchain_chroma import Chroma
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
 from langchain.prompts import ChatPromptTemplate
+from langchain.schema.document import Document
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import aiohttp
+import asyncio
+import json
+import time
+
+import numpy as np
 
 from ..core.config import settings
-from ..utils.embedding import get_embedding_function
+from ..utils.embedding_cache import normalize_query, normalize_text
+from ..utils.lexical_index import FACET_FIELDS, get_lexical_index
+from ..utils.single_flight import SingleFlight
+from ..utils.tokens import count_tokens, truncate_to_tokens
+from .http_client import get_vm_session
+from .semantic_cache import config_fingerprint, identifier_tokens, semantic_cache
+from .vector_store import chroma_collection, get_vector_store
 
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
@@ -53,51 +68,537 @@ def generate_system_prompt(config: dict) -> str:
     
     return prompt
 
-async def query_rag(query_text: str, config: dict = None) -> str:
+async def embed_query(query_text: str, tenant: Optional[str] = None) -> List[float]:
+    # A cache miss is a blocking OpenAI call and a hit still reads and
+    # writes the embedding cache's SQLite file; keep both off the event loop
+    embeddings = get_vector_store(tenant).get().embeddings
+    return await asyncio.get_running_loop().run_in_executor(None, embeddings.embed_query, query_text)
+
+RERANK_STRATEGIES = ("mmr", "none")
+
+def _clamp(value, default: int, low: int, high: int) -> int:
+    try:
+        value = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        value = default
+    return min(high, max(low, value))
+
+@dataclass
+class Candidate:
+    id: str
+    document: Document
+    embedding: Optional[np.ndarray]
+    score: float = 0.0
+
+@dataclass
+class RetrievalParams:
+    """Per-request retrieval knobs, read from the query ``config`` dict."""
+    fan_out: int
+    final_k: int
+    rerank: str
+    mmr_lambda: float
+    max_per_page: int
+    filters: Optional[dict] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "RetrievalParams":
+        config = config or {}
+        final_k = _clamp(config.get("finalK"), settings.RETRIEVAL_K, 1, settings.RETRIEVAL_MAX_FANOUT)
+        fan_out = _clamp(config.get("fanOut"), settings.RETRIEVAL_FANOUT, final_k, settings.RETRIEVAL_MAX_FANOUT)
+        rerank = config.get("rerank", settings.RERANK_STRATEGY)
+        if rerank is False:
+            rerank = "none"
+        if rerank not in RERANK_STRATEGIES:
+            rerank = settings.RERANK_STRATEGY
+        mmr_lambda = config.get("mmrLambda", settings.MMR_LAMBDA)
+        try:
+            mmr_lambda = min(1.0, max(0.0, float(mmr_lambda)))
+        except (TypeError, ValueError):
+            mmr_lambda = settings.MMR_LAMBDA
+        max_per_page = _clamp(config.get("maxPerPage"), settings.RETRIEVAL_MAX_PER_PAGE, 0, fan_out)
+        filters = parse_filters(config.get("filters"))
+        return cls(fan_out, final_k, rerank, mmr_lambda, max_per_page, filters)
+
+def parse_filters(raw: Optional[dict]) -> Optional[dict]:
+    """
+    Normalize ``config["filters"]``: "source", "type" and "cid" take a value
+    or a list of values; "ingestedAfter"/"ingestedBefore" take unix seconds
+    or an ISO-8601 timestamp. Raises ValueError on anything else.
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(raw) - {*FACET_FIELDS, "ingestedAfter", "ingestedBefore"}
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+    filters = {}
+    for field in FACET_FIELDS:
+        values = raw.get(field)
+        if values is None:
+            continue
+        values = values if isinstance(values, list) else [values]
+        if not values or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"Filter {field} must be a string or a non-empty list of strings")
+        filters[field] = sorted(set(values))
+    low, high = _timestamp(raw.get("ingestedAfter")), _timestamp(raw.get("ingestedBefore"))
+    if low is not None or high is not None:
+        filters["ingested_at"] = (low, high)
+    return filters or None
+
+def _timestamp(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid timestamp: {value!r}")
+
+def chroma_where(filters: Optional[dict]) -> Optional[dict]:
+    """Translate normalized filters into a Chroma ``where`` clause."""
+    if not filters:
+        return None
+    conditions = []
+    for field in FACET_FIELDS:
+        values = filters.get(field)
+        if values:
+            conditions.append({field: values[0]} if len(values) == 1 else {field: {"$in": values}})
+    low, high = filters.get("ingested_at") or (None, None)
+    if low is not None:
+        conditions.append({"ingested_at": {"$gte": low}})
+    if high is not None:
+        conditions.append({"ingested_at": {"$lte": high}})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    """Record the wall time of a pipeline stage in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+def vector_search(
+    query_embedding: List[float],
+    k: int,
+    where: Optional[dict] = None,
+    tenant: Optional[str] = None
+) -> List[Candidate]:
+    """Nearest chunks by embedding, in rank order, restricted by ``where``."""
+    db = get_vector_store(tenant).get()
+    result = chroma_collection(db).query(
+        query_embeddings=[query_embedding],
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "embeddings"]
+    )
+    return [
+        Candidate(chunk_id, Document(page_content=text, metadata=metadata or {}, id=chunk_id), np.asarray(embedding))
+        for chunk_id, text, metadata, embedding in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["embeddings"][0]
+        )
+    ]
+
+def lexical_search(
+    query_text: str,
+    k: int,
+    filters: Optional[dict] = None,
+    tenant: Optional[str] = None
+) -> List[str]:
+    """Chunk IDs ranked by BM25 over the lexical index."""
+    index = get_lexical_index(get_vector_store(tenant).persist_directory)
+    return [chunk_id for chunk_id, _score in index.search(query_text, k, filters)]
+
+def fetch_candidates(chunk_ids: List[str], tenant: Optional[str] = None) -> List[Candidate]:
+    db = get_vector_store(tenant).get()
+    fetched = chroma_collection(db).get(ids=chunk_ids, include=["documents", "metadatas", "embeddings"])
+    return [
+        Candidate(chunk_id, Document(page_content=text, metadata=metadata or {}, id=chunk_id), np.asarray(embedding))
+        for chunk_id, text, metadata, embedding in zip(
+            fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]
+        )
+    ]
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> List[Tuple[str, float]]:
+    """
+    Merge ranked ID lists: each list contributes 1 / (k + rank) per ID, so
+    chunks ranked well by both retrievers rise to the top without having to
+    calibrate cosine distances against BM25 scores.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def dedupe_by_page(candidates: List[Candidate], max_per_page: int) -> List[Candidate]:
+    """
+    Keep at most ``max_per_page`` chunks per (source, page), best first.
+    Neighbouring chunks of one page overlap heavily and would otherwise
+    crowd out other sources. Chunks without a page (search results) are
+    kept as-is; 0 disables the cap.
+    """
+    if not max_per_page:
+        return candidates
+    kept = []
+    per_page: Dict[tuple, int] = {}
+    for candidate in candidates:
+        metadata = candidate.document.metadata
+        if "page" not in metadata:
+            kept.append(candidate)
+            continue
+        key = (metadata.get("source"), metadata["page"])
+        if per_page.get(key, 0) < max_per_page:
+            per_page[key] = per_page.get(key, 0) + 1
+            kept.append(candidate)
+    return kept
+
+def mmr(candidates: List[Candidate], k: int, mmr_lambda: float) -> List[Candidate]:
+    """
+    Maximal marginal relevance: repeatedly take the candidate with the best
+    ``lambda * relevance - (1 - lambda) * max similarity to those already
+    taken``. Relevance is the upstream (fused) score scaled to [0, 1], so
+    lexical-only hits keep the boost fusion gave them.
+    """
+    if len(candidates) <= 1:
+        return candidates[:k]
+    vectors = np.stack([candidate.embedding for candidate in candidates]).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    scores = np.array([candidate.score for candidate in candidates], dtype=np.float32)
+    relevance = scores / scores.max() if scores.max() > 0 else scores
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    remaining = np.ones(len(candidates), dtype=bool)
+    remaining[selected[0]] = False
+    while len(selected) < min(k, len(candidates)):
+        objective = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        objective[~remaining] = -np.inf
+        best = int(np.argmax(objective))
+        selected.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return [candidates[index] for index in selected]
+
+async def retrieve(
+    query_text: str,
+    query_embedding: List[float],
+    config: Optional[dict] = None,
+    timings: Optional[Dict[str, float]] = None,
+    tenant: Optional[str] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Retrieval pipeline over ``tenant``'s shard: gather ``fanOut`` candidates
+    matching the request's ``filters`` (vector and, with hybrid search on,
+    BM25 lookups run concurrently off the event loop and are merged by
+    reciprocal-rank fusion), cap chunks per source page, then rerank down to
+    ``finalK`` with MMR. Stage durations in ms are written to ``timings``.
+    Scores are fused rank scores.
+    """
+    params = RetrievalParams.from_config(config)
+    timings = {} if timings is None else timings
+    loop = asyncio.get_running_loop()
+    # Page dedupe drops candidates, so each retriever digs a bit deeper
+    depth = max(settings.HYBRID_CANDIDATES, params.fan_out)
+    # Filters are pushed down into both retrievers rather than applied to
+    # the merged candidates, so a narrow query only searches its slice
+    where = chroma_where(params.filters)
+
+    async def run_timed(stage, func, *args):
+        with timed(timings, stage):
+            return await loop.run_in_executor(None, func, *args)
+
+    with timed(timings, "candidates"):
+        if settings.HYBRID_SEARCH_ENABLED:
+            vector_hits, lexical_ids = await asyncio.gather(
+                run_timed("vector", vector_search, query_embedding, depth, where, tenant),
+                run_timed("lexical", lexical_search, query_text, depth, params.filters, tenant)
+            )
+        else:
+            vector_hits = await run_timed("vector", vector_search, query_embedding, depth, where, tenant)
+            lexical_ids = []
+        candidates = {candidate.id: candidate for candidate in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [[candidate.id for candidate in vector_hits], lexical_ids], settings.RRF_K
+        )[:depth]
+
+        # Lexical-only hits still need their text and embedding
+        missing = [chunk_id for chunk_id, _score in fused if chunk_id not in candidates]
+        if missing:
+            for candidate in await run_timed("fetch", fetch_candidates, missing, tenant):
+                candidates[candidate.id] = candidate
+
+    # An ID can be missing from Chroma if the index is briefly ahead of it
+    ranked = []
+    for chunk_id, score in fused:
+        if chunk_id in candidates:
+            candidates[chunk_id].score = score
+            ranked.append(candidates[chunk_id])
+
+    with timed(timings, "dedupe"):
+        ranked = dedupe_by_page(ranked, params.max_per_page)[:params.fan_out]
+    with timed(timings, "rerank"):
+        if params.rerank == "mmr":
+            ranked = mmr(ranked, params.final_k, params.mmr_lambda)
+        else:
+            ranked = ranked[:params.final_k]
+    return [(candidate.document, candidate.score) for candidate in ranked]
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Adjacent chunks share up to chunk_overlap (80) characters, cut at a separator
+OVERLAP_SCAN_CHARS = 200
+MIN_OVERLAP_CHARS = 16
+
+def chunk_position(doc: Document) -> Optional[Tuple[str, int]]:
+    """(source:page, index) from a populate_db chunk ID, or None."""
+    page_id, _sep, index = (doc.metadata.get("id") or "").rpartition(":")
+    return (page_id, int(index)) if page_id and index.isdigit() else None
+
+def strip_overlap(text: str, previous: Optional[str] = None, following: Optional[str] = None) -> str:
+    """
+    Remove text duplicated with neighbouring chunks of the same page: a
+    prefix repeating the end of ``previous`` and a suffix repeating the
+    start of ``following``.
+    """
+    if previous:
+        for size in range(min(len(previous), len(text), OVERLAP_SCAN_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+            if previous.endswith(text[:size]):
+                text = text[size:].lstrip()
+                break
+    if following:
+        for size in range(min(len(following), len(text), OVERLAP_SCAN_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+            if text.endswith(following[:size]):
+                text = text[:-size].rstrip()
+                break
+    return text
+
+def pack_context(
+    query_text: str,
+    results: List[Tuple[Document, float]],
+    budget: int
+) -> Tuple[str, List[Tuple[Document, float]], dict]:
+    """
+    Build the prompt from ``results`` (best first) within ``budget`` prompt
+    tokens. Whitespace is collapsed and overlap with already packed
+    neighbours is trimmed before a chunk is costed; chunks that don't fit
+    are skipped in favour of smaller lower-ranked ones, and a chunk is only
+    truncated when nothing smaller can use the remaining room. Returns the
+    prompt, the packed results and a token usage report.
+    """
+    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    overhead = count_tokens(prompt_template.format(context="", question=query_text))
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    remaining = budget - overhead
+
+    packed: List[Tuple[Document, float]] = []
+    texts: List[str] = []
+    by_position: Dict[Tuple[str, int], str] = {}
+    chars_trimmed = 0
+    for doc, score in results:
+        text = normalize_text(doc.page_content)
+        original_length = len(text)
+        position = chunk_position(doc)
+        if position:
+            page_id, index = position
+            text = strip_overlap(
+                text, by_position.get((page_id, index - 1)), by_position.get((page_id, index + 1))
+            )
+        separator = separator_tokens if texts else 0
+        cost = count_tokens(text) + separator
+        if cost > remaining:
+            if remaining - separator < settings.CONTEXT_MIN_TRUNCATE_TOKENS:
+                continue
+            text = truncate_to_tokens(text, remaining - separator)
+            cost = remaining
+        if not text:
+            continue
+        chars_trimmed += original_length - len(text)
+        if position:
+            by_position[position] = text
+        texts.append(text)
+        packed.append((doc, score))
+        remaining -= cost
+        if remaining <= separator_tokens:
+            break
+
+    context_text = CONTEXT_SEPARATOR.join(texts)
+    prompt = prompt_template.format(context=context_text, question=query_text)
+    usage = {
+        "budget": budget,
+        "prompt_tokens": count_tokens(prompt),
+        "context_tokens": count_tokens(context_text),
+        "chunks": len(packed),
+        "chunks_dropped": len(results) - len(packed),
+        "chars_trimmed": chars_trimmed,
+    }
+    return prompt, packed, usage
+
+async def retrieve_context(
+    query_text: str,
+    query_embedding: List[float],
+    config: Optional[dict] = None,
+    tenant: Optional[str] = None
+):
     """
-    Process the query using RAG with configuration settings.
+    Search the shared store and pack the TEE prompt for a query. Returns
+    (prompt, packed results, token usage).
+    """
+    # Search the DB, reusing the embedding already computed for the cache lookup.
+    timings: Dict[str, float] = {}
+    with timed(timings, "total"):
+        results = await retrieve(query_text, query_embedding, config, timings, tenant)
+    budget = _clamp(
+        (config or {}).get("promptTokens"), settings.PROMPT_TOKEN_BUDGET, 128, settings.PROMPT_TOKEN_BUDGET_MAX
+    )
+    with timed(timings, "pack"):
+        prompt, results, usage = await asyncio.get_running_loop().run_in_executor(
+            None, pack_context, query_text, results, budget
+        )
+    print(f"Retrieval timings (ms): {timings}\nPrompt tokens: {usage}")
+    return prompt, results, usage
+
+def generation_payload(prompt: str, stream: bool = False) -> dict:
+    payload = {
+        "prompt": prompt,
+        "model": "llama3.2-vision",
+        "max_tokens": 200
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+# Identical /query calls in flight at the same time share one run
+query_flights = SingleFlight()
+
+
+async def query_rag(query_text: str, config: dict = None, tenant: Optional[str] = None) -> str:
+    """
+    Process the query using RAG with configuration settings, against
+    ``tenant``'s shard (the default one if None).
+
+    Concurrent calls for the same normalized query, config and tenant are
+    coalesced: one embeds, retrieves and calls the TEE, the rest await its
+    answer (or its error). A caller that disconnects doesn't cancel the
+    run for the others. The semantic cache covers repeats that arrive
+    after the answer is ready.
     """
     if config is None:
         config = {}
-    
+    if not settings.QUERY_COALESCING_ENABLED:
+        return await _query_rag(query_text, config, tenant)
+    key = (normalize_query(query_text), config_fingerprint(config, tenant))
+    return await query_flights.do(key, lambda: _query_rag(query_text, config, tenant))
+
+
+async def _query_rag(query_text: str, config: dict, tenant: Optional[str]) -> str:
     try:
-        # Prepare the DB.
-        embedding_function = get_embedding_function()
-        db = Chroma(persist_directory=settings.CHROMA_PATH, embedding_function=embedding_function)
-
-        # Search the DB.
-        results = db.similarity_search_with_score(query_text, k=5)
-
-        context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-        prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-        prompt = prompt_template.format(context=context_text, question=query_text)
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    f"{settings.VM_ENDPOINT}/generate",
-                    headers={"Content-Type": "application/json"},
-                    json={
-                        "prompt": prompt,
-                        "model": "llama3.2-vision",
-                        "max_tokens": 200
-                    },
-                    timeout=30  # Add timeout
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"TEE endpoint returned status {response.status}: {error_text}")
-                    
-                    response_data = await response.json()
-                    response_text = response_data.get("response", "")
-            except aiohttp.ClientError as e:
-                raise Exception(f"Network error while calling TEE endpoint: {str(e)}")
+        generation = semantic_cache.generation(tenant)
+        query_embedding = await embed_query(query_text, tenant)
+        identifiers = identifier_tokens(query_text)
+        if settings.SEMANTIC_CACHE_ENABLED:
+            cached = semantic_cache.lookup(query_embedding, config, tenant, identifiers)
+            if cached is not None:
+                print(f"Semantic cache hit\nSources: {cached.sources}")
+                return cached.response
+
+        prompt, results, _usage = await retrieve_context(query_text, query_embedding, config, tenant)
+
+        try:
+            async with get_vm_session().post(
+                f"{settings.VM_ENDPOINT}/generate",
+                headers={"Content-Type": "application/json"},
+                json=generation_payload(prompt),
+                timeout=aiohttp.ClientTimeout(total=30)  # Add timeout
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"TEE endpoint returned status {response.status}: {error_text}")
+                
+                response_data = await response.json()
+                response_text = response_data.get("response", "")
+        except aiohttp.ClientError as e:
+            raise Exception(f"Network error while calling TEE endpoint: {str(e)}")
 
         sources = [doc.metadata.get("id", None) for doc, _score in results]
         formatted_response = f"Response: {response_text}\nSources: {sources}"
         print(formatted_response)
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.store(query_embedding, config, response_text, sources, generation, tenant, identifiers)
         return response_text
         
     except Exception as e:
         print(f"Error in query_rag: {str(e)}")
         raise  # Re-raise the exception instead of returning an error message
+
+async def query_rag_stream(
+    query_text: str,
+    config: dict = None,
+    tenant: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Streaming variant of query_rag. Yields a "sources" event with the
+    packed chunk IDs and prompt token usage, then one "token" event per fragment read from the
+    TEE generation endpoint as it arrives, then a final "done" event.
+    """
+    if config is None:
+        config = {}
+
+    try:
+        generation = semantic_cache.generation(tenant)
+        query_embedding = await embed_query(query_text, tenant)
+        identifiers = identifier_tokens(query_text)
+        if settings.SEMANTIC_CACHE_ENABLED:
+            cached = semantic_cache.lookup(query_embedding, config, tenant, identifiers)
+            if cached is not None:
+                yield {"event": "sources", "data": {"sources": cached.sources}}
+                yield {"event": "token", "data": {"token": cached.response}}
+                yield {"event": "done", "data": {}}
+                return
+
+        prompt, results, usage = await retrieve_context(query_text, query_embedding, config, tenant)
+        sources = [doc.metadata.get("id", None) for doc, _score in results]
+        yield {"event": "sources", "data": {"sources": sources, "usage": usage}}
+        tokens = []
+
+        # The VM session bounds connects and per-read stalls only; a long
+        # answer may take well over 30s in total while still making progress.
+        try:
+            async with get_vm_session().post(
+                f"{settings.VM_ENDPOINT}/generate",
+                headers={"Content-Type": "application/json"},
+                json=generation_payload(prompt, stream=True)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"TEE endpoint returned status {response.status}: {error_text}")
+
+                # The endpoint answers with newline-delimited JSON objects
+                # ({"response": "...", "done": false}); a non-streaming
+                # server sends a single object, which is handled the same way.
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response", "")
+                    if token:
+                        tokens.append(token)
+                        yield {"event": "token", "data": {"token": token}}
+                    if chunk.get("done"):
+                        break
+        except aiohttp.ClientError as e:
+            raise Exception(f"Network error while calling TEE endpoint: {str(e)}")
+
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.store(query_embedding, config, "".join(tokens), sources, generation, tenant, identifiers)
+        yield {"event": "done", "data": {}}
+
+    except Exception as e:
+        print(f"Error in query_rag_stream: {str(e)}")
+        raise
@@ -1,11 +1,19 @@
-from langchain_google_community import GoogleSearchAPIWrapper
-from langchain.chains import LLMChain
+from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional
-import os
+import asyncio
+import threading
+import time
+import uuid
 
 from ..core.config import settings
+from ..utils.embedding_cache import normalize_query
+from ..utils.single_flight import SingleFlight
+from .http_client import get_google_session
 
 if not settings.GOOGLE_API_KEY or not settings.GOOGLE_CSE_ID:
     raise ValueError(
@@ -13,10 +21,7 @@ if not settings.GOOGLE_API_KEY or not settings.GOOGLE_CSE_ID:
         "are set in your .env file"
     )
 
-search = GoogleSearchAPIWrapper(
-    google_api_key=settings.GOOGLE_API_KEY,
-    google_cse_id=settings.GOOGLE_CSE_ID,
-)
+NO_RESULTS = "No good Google Search Result was found"
 
 SEARCH_PROMPT = """
 You are a helpful assistant that provides clear and concise summaries of search results.
@@ -27,37 +32,144 @@ Based on the following search results, provide a comprehensive but concise answe
 Please synthesize this information into a clear and helpful response.
 """
 
+
+class SearchError(Exception):
+    """Non-success response from the Custom Search API."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class SearchResultCache:
+    """Bounded LRU + TTL cache of raw search snippets, keyed by normalized query."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, results: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+search_cache = SearchResultCache(settings.SEARCH_CACHE_TTL, settings.SEARCH_CACHE_MAX_ENTRIES)
+# Identical concurrent searches share one upstream request, and one summary
+search_flights = SingleFlight()
+summary_flights = SingleFlight()
+# /chat/context writes
+_context_executor = ThreadPoolExecutor(max_workers=settings.CONTEXT_WRITE_WORKERS, thread_name_prefix="chat-context")
+
+
+@lru_cache(maxsize=None)
+def get_summary_chain():
+    """Prompt -> gpt-4o -> text, built once so the OpenAI client and its connection pool are reused."""
+    # Ollama
+    # llm = OllamaLLM(model=settings.MODEL_NAME)
+    llm = ChatOpenAI(
+        model="gpt-4o",
+        api_key=settings.OPENAI_API_KEY,
+        temperature=0.9
+    )
+    prompt = PromptTemplate(
+        template=SEARCH_PROMPT,
+        input_variables=["search_results"]
+    )
+    return prompt | llm | StrOutputParser()
+
+
+async def fetch_search_results(query: str) -> str:
+    """
+    Query the Custom Search JSON API and join the result snippets, as
+    GoogleSearchAPIWrapper.run did, without blocking the event loop.
+    """
+    params = {
+        "key": settings.GOOGLE_API_KEY,
+        "cx": settings.GOOGLE_CSE_ID,
+        "q": query,
+        "num": str(settings.SEARCH_RESULTS),
+    }
+    async with get_google_session().get(settings.GOOGLE_SEARCH_URL, params=params) as response:
+        if response.status != 200:
+            raise SearchError(response.status, f"Google search failed: {await response.text()}")
+        items = (await response.json()).get("items", [])
+    if not items:
+        return NO_RESULTS
+    return " ".join(item["snippet"] for item in items if "snippet" in item)
+
+
+async def search_results(query: str) -> str:
+    """Raw search snippets for ``query``, from the cache when fresh."""
+    key = normalize_query(query)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        results = await fetch_search_results(query)
+        search_cache.put(key, results)
+        return results
+
+    return await search_flights.do(key, fetch)
+
+
+async def summarize(query: str) -> str:
+    results = await search_results(query)
+    response = await get_summary_chain().ainvoke({"search_results": results})
+    return response.strip()
+
+
 async def google_search(query: str) -> str:
     try:
-        search_results = search.run(query)
-        
-        # Ollama
-        # llm = OllamaLLM(model=settings.MODEL_NAME)
-        llm = ChatOpenAI(
-            model="gpt-4o",
-            api_key=settings.OPENAI_API_KEY,
-            temperature=0.9
-        )
-        prompt = PromptTemplate(
-            template=SEARCH_PROMPT,
-            input_variables=["search_results"]
-        )
-        
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = chain.run(search_results=search_results)
-        
-        return response.strip()
+        return await summary_flights.do(normalize_query(query), lambda: summarize(query))
     except Exception as e:
         print(f"Error in google_search: {str(e)}")
         raise
 
-async def store_search_context(context: str) -> None:
+async def store_search_context(context: str, tenant: Optional[str] = None) -> None:
     """
-    Store the search context in the vector database for future RAG queries
+    Store the search context in the vector database (``tenant``'s shard)
+    for future RAG queries
     """
-    from langchain_chroma import Chroma
     from langchain.schema.document import Document
-    from ..utils.embedding import get_embedding_function
+    from ..utils.lexical_index import get_lexical_index
+    from .semantic_cache import semantic_cache
+    from .vector_store import acquire_write_lock, chroma_collection, get_vector_store
     
     try:
         print(f"Attempting to store context: {context[:100]}...")  # Add logging
@@ -65,19 +177,28 @@ async def store_search_context(context: str) -> None:
         # Create a document from the search context
         doc = Document(
             page_content=context,
-            metadata={"source": "google_search", "type": "search_result"}
+            metadata={"source": "google_search", "type": "search_result", "ingested_at": time.time()}
         )
         
-        print("Created document, initializing Chroma...")  # Add logging
+        print("Created document, fetching shared Chroma handle...")  # Add logging
         
         # Store in Chroma
-        db = Chroma(
-            persist_directory=settings.CHROMA_PATH,
-            embedding_function=get_embedding_function()
-        )
+        store = get_vector_store(tenant)
+        db = store.get()
         
         print("Adding document to Chroma...")  # Add logging
-        db.add_documents([doc])
+        # Off the event loop, on a pool of its own: a write waiting for the
+        # lock must not take a thread from the one queries embed and
+        # retrieve on. Only the commit holds the lock, not the embedding call.
+        def add_document():
+            embeddings = db.embeddings.embed_documents([doc.page_content])
+            ids = [str(uuid.uuid4())]
+            with acquire_write_lock(store.persist_directory, settings.STORE_WRITE_LOCK_TIMEOUT):
+                chroma_collection(db).upsert(ids=ids, embeddings=embeddings, metadatas=[doc.metadata], documents=[doc.page_content])
+                get_lexical_index(store.persist_directory).upsert(ids, [doc.page_content], [doc.metadata])
+        await asyncio.get_running_loop().run_in_executor(_context_executor, add_document)
+        # Cached answers may no longer reflect the corpus
+        semantic_cache.invalidate(tenant)
         print("Successfully stored context")  # Add logging
         
     except Exception as e:
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from ..utils.lexical_index import TOKEN_PATTERN
+from .vector_store import DEFAULT_TENANT
+
+
+@dataclass
+class CachedAnswer:
+    vector: np.ndarray
+    config_key: str
+    response: str
+    sources: List[Optional[str]]
+    created_at: float
+    identifiers: FrozenSet[str] = frozenset()
+    tenant: str = DEFAULT_TENANT
+
+
+def _tenant_key(tenant: Optional[str]) -> str:
+    return tenant or DEFAULT_TENANT
+
+
+def config_fingerprint(config: Optional[dict], tenant: Optional[str] = None) -> str:
+    """
+    Stable key for a query config; answers are only shared between equal
+    configs of the same tenant. The tenant sits outside the JSON so no
+    config value can collide with another tenant's key.
+    """
+    return f"{_tenant_key(tenant)}\x00" + json.dumps(config or {}, sort_keys=True, default=str)
+
+
+def identifier_tokens(query: str) -> FrozenSet[str]:
+    """
+    Lexical-index tokens of ``query`` that look like identifiers: tickers, product names,
+    versions and numbers ("$ai3", "gpt-4o", "v2.1", "2024", "NVDA"). Query
+    embeddings barely separate these, so "price of AAPL" and "price of
+    MSFT" can clear the similarity threshold; cached answers are only
+    shared between queries with the same set.
+    """
+    return frozenset(
+        token.lower() for token in TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", query))
+        if sum(char.isupper() for char in token) >= 2
+        or any(char.isdigit() or char in "$.-" for char in token)
+    )
+
+
+class SemanticCache:
+    """
+    Bounded LRU + TTL cache of generated answers, looked up by cosine
+    similarity between query embeddings rather than exact query text.
+    A hit also requires the same identifier tokens (identifier_tokens).
+    Entries and generations are per tenant, so one tenant's writes don't
+    flush the others' answers.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        # Per tenant, bumped on every invalidation so answers computed
+        # against the old corpus are not stored once they finish.
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(
+        self,
+        embedding: List[float],
+        config: Optional[dict],
+        tenant: Optional[str] = None,
+        identifiers: FrozenSet[str] = frozenset()
+    ) -> Optional[CachedAnswer]:
+        vector = _normalize(embedding)
+        key = config_fingerprint(config, tenant)
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self._entries.items()
+                if entry.config_key == key and entry.identifiers == identifiers
+            ]
+            if candidates:
+                matrix = np.stack([entry.vector for _, entry in candidates])
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        embedding: List[float],
+        config: Optional[dict],
+        response: str,
+        sources: List[Optional[str]],
+        generation: int,
+        tenant: Optional[str] = None,
+        identifiers: FrozenSet[str] = frozenset()
+    ) -> None:
+        with self._lock:
+            if generation != self._generations.get(_tenant_key(tenant), 0):
+                return
+            self._entries[self._next_id] = CachedAnswer(
+                vector=_normalize(embedding),
+                config_key=config_fingerprint(config, tenant),
+                response=response,
+                sources=sources,
+                created_at=time.monotonic(),
+                identifiers=identifiers,
+                tenant=_tenant_key(tenant)
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, tenant: Optional[str] = None) -> int:
+        """Read before computing an answer and pass to ``store``."""
+        with self._lock:
+            return self._generations.get(_tenant_key(tenant), 0)
+
+    def invalidate(self, tenant: Optional[str] = None) -> None:
+        """Drop ``tenant``'s cached answers; call whenever its corpus changes."""
+        key = _tenant_key(tenant)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.tenant == key]
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _expire(self, now: float) -> None:
+        # Entries are in LRU order, not insertion order, so scan them all
+        expired = [
+            entry_id for entry_id, entry in self._entries.items()
+            if now - entry.created_at > self.ttl
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+            self.evictions += 1
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+semantic_cache = SemanticCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl=settings.SEMANTIC_CACHE_TTL
+)
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import BinaryIO, Optional, Tuple
+
+import aiohttp
+
+from ..core.config import settings
+from ..utils.encryption import encrypt_stream_for_tee, load_public_key
+from ..utils.stream_pipe import PipeAborted, StreamPipe
+from .dsn import upload_path, upload_stream
+
+logger = logging.getLogger(__name__)
+
+ENCRYPTED_MIME_TYPE = "application/octet-stream"
+BUNDLE_SUFFIX = ".bundle"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def write_encrypted(source: BinaryIO, pipe: StreamPipe) -> None:
+    """Encrypt ``source`` into ``pipe`` frame by frame. Runs in a worker thread."""
+    try:
+        size = encrypt_stream_for_tee(source, pipe, settings.PUBLIC_KEY_PATH, settings.UPLOAD_FRAME_SIZE)
+    except PipeAborted:
+        return
+    except BaseException as e:
+        try:
+            pipe.finish(e)
+        except PipeAborted:
+            pass
+        return
+    logger.info(f"Encrypted {size} bytes for upload")
+    try:
+        pipe.finish()
+    except PipeAborted:
+        pass
+
+
+async def upload_encrypted(
+    source: BinaryIO,
+    filename: str,
+    session: Optional[aiohttp.ClientSession] = None
+) -> Tuple[str, dict]:
+    """
+    Encrypt ``source`` for the TEE and upload it to DSN. Returns
+    (upload_id, completion data).
+
+    With UPLOAD_RESUMABLE the bundle is written to DSN_UPLOAD_STATE_DIR and
+    uploaded with upload_path, so retrying the same file after a failure
+    resumes from the chunks DSN already has. Otherwise it is encrypted in a
+    worker thread and streamed into the upload as it is produced: nothing
+    touches disk, but a failed upload starts over.
+    """
+    # Fail before creating the DSN upload if the key is missing or invalid;
+    # the parsed key is cached, so this costs a stat() after the first call
+    load_public_key(settings.PUBLIC_KEY_PATH)
+    if settings.UPLOAD_RESUMABLE:
+        return await _upload_via_file(source, filename, session)
+    return await _upload_streaming(source, filename, session)
+
+
+async def _upload_streaming(
+    source: BinaryIO,
+    filename: str,
+    session: Optional[aiohttp.ClientSession]
+) -> Tuple[str, dict]:
+    # At most DSN_UPLOAD_CONCURRENCY chunks are buffered, so neither the
+    # plaintext nor the bundle is ever held whole in memory
+    loop = asyncio.get_running_loop()
+    pipe = StreamPipe(loop, settings.DSN_UPLOAD_CHUNK_SIZE, settings.DSN_UPLOAD_CONCURRENCY)
+    writer = loop.run_in_executor(None, write_encrypted, source, pipe)
+    try:
+        return await upload_stream(pipe.chunks(), filename, ENCRYPTED_MIME_TYPE, session)
+    finally:
+        # Unblocks the writer if the upload failed before draining the pipe
+        pipe.aborted.set()
+        await writer
+
+
+async def _upload_via_file(
+    source: BinaryIO,
+    filename: str,
+    session: Optional[aiohttp.ClientSession]
+) -> Tuple[str, dict]:
+    loop = asyncio.get_running_loop()
+    bundle_path = await loop.run_in_executor(None, spool_encrypted, source, filename)
+    result = await upload_path(bundle_path, filename, ENCRYPTED_MIME_TYPE, session)
+    # Kept on failure, for the retry to resume from
+    _remove(bundle_path)
+    return result
+
+
+def spool_encrypted(source: BinaryIO, filename: str) -> str:
+    """
+    Path of a bundle of ``source`` under DSN_UPLOAD_STATE_DIR, named after
+    the plaintext's hash. Each bundle has a random key, so a retry must
+    reuse the one its failed attempt uploaded from for upload_path to find
+    its progress; a new one is only written when none is left from the
+    last DSN_UPLOAD_STATE_TTL. Blocking; run it off the event loop.
+    """
+    os.makedirs(settings.DSN_UPLOAD_STATE_DIR, exist_ok=True)
+    _discard_expired_bundles()
+    start = source.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    source.seek(start)
+    key = hashlib.sha256(f"{digest.hexdigest()}:{filename}".encode()).hexdigest()
+    bundle_path = os.path.join(settings.DSN_UPLOAD_STATE_DIR, f"{key}{BUNDLE_SUFFIX}")
+    if os.path.exists(bundle_path):
+        logger.info(f"Reusing the encrypted bundle of an earlier upload of {filename}")
+        return bundle_path
+
+    tmp_path = f"{bundle_path}.{os.getpid()}.{id(source)}.tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            size = encrypt_stream_for_tee(source, out, settings.PUBLIC_KEY_PATH, settings.UPLOAD_FRAME_SIZE)
+        # Link rather than replace: a concurrent upload of the same file may
+        # already be reading the bundle that won
+        try:
+            os.link(tmp_path, bundle_path)
+        except FileExistsError:
+            pass
+    finally:
+        _remove(tmp_path)
+    logger.info(f"Encrypted {size} bytes for upload")
+    return bundle_path
+
+
+def _discard_expired_bundles() -> None:
+    cutoff = time.time() - settings.DSN_UPLOAD_STATE_TTL
+    for name in os.listdir(settings.DSN_UPLOAD_STATE_DIR):
+        path = os.path.join(settings.DSN_UPLOAD_STATE_DIR, name)
+        try:
+            if name.endswith(BUNDLE_SUFFIX) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,322 @@
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from chromadb.api import ServerAPI
+from chromadb.api.client import Client
+from chromadb.api.models.Collection import Collection
+from chromadb.config import Settings as ChromaSettings, System
+from chromadb.telemetry.product import ProductTelemetryClient
+from langchain_chroma import Chroma
+
+from ..core.config import settings
+from ..utils.embedding import get_embedding_function
+
+DEFAULT_TENANT = "default"
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def tenant_paths(tenant: Optional[str] = None) -> Tuple[str, str]:
+    """
+    (Chroma directory, data directory) of a tenant's shard. The default
+    tenant keeps CHROMA_PATH/DATA_PATH; others live under TENANTS_PATH.
+    """
+    if not tenant or tenant == DEFAULT_TENANT:
+        return settings.CHROMA_PATH, settings.DATA_PATH
+    if not TENANT_ID_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant ID: {tenant!r}")
+    root = os.path.join(settings.TENANTS_PATH, tenant)
+    return os.path.join(root, "chroma"), os.path.join(root, "data")
+
+
+class StoreBusyError(Exception):
+    """A store's write lock couldn't be taken in time."""
+
+
+_write_locks: Dict[str, threading.RLock] = {}
+_ingest_locks: Dict[str, threading.RLock] = {}
+_locks_lock = threading.Lock()
+
+
+def _directory_lock(locks: Dict[str, threading.RLock], persist_directory: str) -> threading.RLock:
+    key = os.path.abspath(persist_directory)
+    with _locks_lock:
+        lock = locks.get(key)
+        if lock is None:
+            lock = locks[key] = threading.RLock()
+        return lock
+
+
+def get_write_lock(persist_directory: str) -> threading.RLock:
+    """
+    Held around each write to a store directory (an ingestion batch, its
+    final cleanup, a search context) and by backups while they copy it, so
+    a snapshot never sees a half-applied write. Never held across remote
+    calls, so short writers only wait for the batch in progress.
+    Re-entrant because populate_db's reset path nests writers. One per
+    directory, so tenants never wait on each other.
+    """
+    return _directory_lock(_write_locks, persist_directory)
+
+
+def get_ingest_lock(persist_directory: str) -> threading.RLock:
+    """
+    Held by a populate_db run from start to finish and by a restore while
+    it swaps the directory, so a store is never replaced under a running
+    ingestion. Take it before the write lock, never while holding it.
+    """
+    return _directory_lock(_ingest_locks, persist_directory)
+
+
+@contextmanager
+def acquire_write_lock(persist_directory: str, timeout: float):
+    """``get_write_lock`` with a bound on the wait; raises StoreBusyError past ``timeout``."""
+    lock = get_write_lock(persist_directory)
+    if not lock.acquire(timeout=timeout):
+        raise StoreBusyError("The vector store is busy; try again shortly")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# The default tenant's locks
+store_write_lock = get_write_lock(settings.CHROMA_PATH)
+store_ingest_lock = get_ingest_lock(settings.CHROMA_PATH)
+
+
+class _ChromaSystem:
+    """A started chromadb system for one directory and the number of handles on it."""
+
+    def __init__(self, persist_directory: str):
+        # The settings langchain_chroma would build for persist_directory
+        chroma_settings = ChromaSettings(is_persistent=True)
+        chroma_settings.persist_directory = persist_directory
+        self.system = System(chroma_settings)
+        self.system.instance(ProductTelemetryClient)
+        self.system.instance(ServerAPI)
+        self.system.start()
+        self.handles = 0
+        self.retired = False
+
+
+_systems: Dict[str, _ChromaSystem] = {}
+_systems_lock = threading.Lock()
+
+
+def open_chroma(persist_directory: str, embedding_function) -> Chroma:
+    """
+    Chroma handle on ``persist_directory``. All handles for a directory
+    share one chromadb system (SQLite connection and in-memory HNSW index),
+    so writes through one are seen by the others without reopening. The
+    system is stopped once its last handle has been garbage collected.
+    """
+    return _open_handle(persist_directory, embedding_function)[0]
+
+
+def _open_handle(persist_directory: str, embedding_function) -> Tuple[Chroma, _ChromaSystem]:
+    with _systems_lock:
+        entry = _systems.get(persist_directory)
+        if entry is None:
+            entry = _systems[persist_directory] = _ChromaSystem(persist_directory)
+        entry.handles += 1
+    try:
+        db = Chroma(
+            client=Client.from_system(entry.system),
+            persist_directory=persist_directory,
+            embedding_function=embedding_function
+        )
+    except BaseException:
+        _drop_handle(persist_directory, entry)
+        raise
+    weakref.finalize(db, _drop_handle, persist_directory, entry)
+    return db, entry
+
+
+def _drop_handle(persist_directory: str, entry: _ChromaSystem) -> None:
+    with _systems_lock:
+        entry.handles -= 1
+        if entry.handles:
+            return
+        if _systems.get(persist_directory) is entry:
+            del _systems[persist_directory]
+    entry.system.stop()
+
+
+def retire_chroma_system(persist_directory: str) -> None:
+    """
+    Call after ``persist_directory`` was deleted or replaced on disk.
+    Handles opened from now on get a fresh system; the old one keeps
+    serving the handles still reading from it and is stopped once they are
+    gone. Other directories are left alone.
+    """
+    with _systems_lock:
+        entry = _systems.pop(persist_directory, None)
+        if entry is not None:
+            entry.retired = True
+
+
+def chroma_collection(db: Chroma) -> Collection:
+    """
+    The chromadb collection behind ``db``, for what the langchain wrapper
+    doesn't offer: upserts and queries of precomputed embeddings, counts
+    and metadata-only updates. langchain_chroma only keeps it in a private
+    attribute, so this is the one place that reaches for it.
+    """
+    return db._collection
+
+
+class VectorStoreManager:
+    """
+    Owns a single Chroma handle for the lifetime of the application so that
+    requests don't re-open the SQLite/HNSW store and rebuild the embedding
+    client on every call.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function=None):
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self._lock = threading.Lock()
+        self._db: Optional[Chroma] = None
+        self._system: Optional[_ChromaSystem] = None
+        self.generation = 0
+        self.write_lock = get_write_lock(persist_directory)
+
+    def get(self) -> Chroma:
+        """
+        Return the shared Chroma handle, opening it on first use and again
+        after the store was replaced on disk (retire_chroma_system).
+        """
+        db, system = self._db, self._system
+        if db is not None and not system.retired:
+            return db
+        with self._lock:
+            if self._db is None or self._system.retired:
+                if self._db is not None:
+                    self.generation += 1
+                self._db, self._system = _open_handle(self.persist_directory, self.embedding_function)
+            return self._db
+
+    def reload(self) -> None:
+        """
+        Switch to a fresh handle after the store was deleted or replaced on
+        disk (a reset or a restore). Writes by populate_db need no reload:
+        its handles share this one's chromadb system. In-flight readers keep
+        the handle they already hold; its system stops once they drop it.
+        """
+        retire_chroma_system(self.persist_directory)
+        with self._lock:
+            self._db = self._system = None
+            self.generation += 1
+
+    @property
+    def embedding_function(self):
+        # Resolved lazily so the app can start without OpenAI credentials
+        return self._embedding_function or get_embedding_function()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db = self._system = None
+
+
+class TenantStores:
+    """
+    Store managers for non-default tenants, opened on first use and kept in
+    LRU order. Past ``max_open`` the least recently used one is closed, and
+    its chromadb system stops once no reader or ingestion is using it, so
+    idle tenants don't hold their HNSW index and SQLite connections in
+    memory.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._managers: "OrderedDict[str, VectorStoreManager]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, tenant: str) -> VectorStoreManager:
+        with self._lock:
+            manager = self._managers.get(tenant)
+            if manager is not None:
+                self._managers.move_to_end(tenant)
+                return manager
+            manager = self._managers[tenant] = VectorStoreManager(tenant_paths(tenant)[0])
+            while len(self._managers) > self.max_open:
+                _tenant, evicted = self._managers.popitem(last=False)
+                self._close(evicted)
+                self.evictions += 1
+            return manager
+
+    def peek(self, tenant: str) -> Optional[VectorStoreManager]:
+        """The tenant's manager if it is open, without opening or touching it."""
+        with self._lock:
+            return self._managers.get(tenant)
+
+    def close(self) -> None:
+        with self._lock:
+            managers, self._managers = list(self._managers.values()), OrderedDict()
+        for manager in managers:
+            self._close(manager)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open": list(self._managers), "max_open": self.max_open, "evictions": self.evictions}
+
+    @staticmethod
+    def _close(manager: VectorStoreManager) -> None:
+        # Readers still holding the handle finish normally; the store is
+        # freed once they drop it
+        manager.close()
+
+
+_manager: Optional[VectorStoreManager] = None
+_manager_lock = threading.Lock()
+_tenant_stores = TenantStores(settings.TENANT_MAX_OPEN_STORES)
+
+
+def init_vector_store() -> VectorStoreManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = VectorStoreManager(settings.CHROMA_PATH)
+        return _manager
+
+
+def get_vector_store(tenant: Optional[str] = None) -> VectorStoreManager:
+    """
+    Return the manager for ``tenant``'s shard: the process-wide default one
+    (created here if the app lifespan hasn't), or a tenant's LRU-cached one.
+    """
+    if not tenant or tenant == DEFAULT_TENANT:
+        return _manager or init_vector_store()
+    return _tenant_stores.get(tenant)
+
+
+def close_vector_store() -> None:
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+        _manager = None
+    _tenant_stores.close()
+
+
+def reload_vector_store(tenant: Optional[str] = None) -> None:
+    """Reopen a shard after its store was deleted or replaced on disk."""
+    if not tenant or tenant == DEFAULT_TENANT:
+        with _manager_lock:
+            manager = _manager
+    else:
+        manager = _tenant_stores.peek(tenant)
+    if manager is not None:
+        manager.reload()
+    else:
+        retire_chroma_system(tenant_paths(tenant)[0])
+
+
+def tenant_store_stats() -> dict:
+    return _tenant_stores.stats()
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+CID_INDEX_FILENAME = "cid_index.json"
+CID_INDEX_VERSION = 2
+
+_lock = threading.Lock()
+
+
+def cid_index_path(data_path: str) -> str:
+    return os.path.join(data_path, CID_INDEX_FILENAME)
+
+
+def _load(data_path: str) -> Dict[str, dict]:
+    """
+    CID -> {"filename", "size", "sha256"} for the files /retrieve saved into
+    ``data_path``. Version 1 files were a flat filename -> CID map.
+    """
+    try:
+        with open(cid_index_path(data_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") == CID_INDEX_VERSION:
+        return index["objects"]
+    return {cid: {"filename": filename} for filename, cid in index.items()}
+
+
+def _save(data_path: str, objects: Dict[str, dict]) -> None:
+    os.makedirs(data_path, exist_ok=True)
+    tmp_path = cid_index_path(data_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": CID_INDEX_VERSION, "objects": objects}, f)
+    os.replace(tmp_path, cid_index_path(data_path))
+
+
+def load_cid_index(data_path: str) -> Dict[str, str]:
+    """Filename -> DSN CID for the files /retrieve saved into ``data_path``."""
+    return {entry["filename"]: cid for cid, entry in _load(data_path).items()}
+
+
+def lookup_cid(data_path: str, cid: str) -> Optional[dict]:
+    """The index entry for ``cid`` in ``data_path``, if it was retrieved before."""
+    return _load(data_path).get(cid)
+
+
+def record_cid(
+    data_path: str,
+    filename: str,
+    cid: str,
+    size: Optional[int] = None,
+    sha256: Optional[str] = None
+) -> None:
+    """
+    Remember which CID ``filename`` came from, so its chunks can be tagged,
+    along with the plaintext's size and hash so a later retrieve can trust
+    the local copy.
+    """
+    with _lock:
+        objects = {
+            other: entry for other, entry in _load(data_path).items()
+            if entry["filename"] != filename
+        }
+        objects[cid] = {"filename": filename, "size": size, "sha256": sha256}
+        _save(data_path, objects)
+
+
+def claim_filename(data_path: str, filename: str, cid: str) -> str:
+    """
+    Name to save ``cid``'s file under. Objects keep their DSN filename
+    unless another CID (or a file /retrieve didn't write) already has it,
+    in which case a CID suffix keeps both.
+    """
+    taken_by = load_cid_index(data_path).get(filename)
+    if taken_by == cid or (taken_by is None and not os.path.exists(os.path.join(data_path, filename))):
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}-{cid[-12:]}{ext}"
@@ -1,9 +1,17 @@
+from functools import lru_cache
+
 from langchain_openai import OpenAIEmbeddings
 from ..core.config import settings
+from .embedding_cache import CachedEmbeddings, get_embedding_cache
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
 
+@lru_cache(maxsize=None)
 def get_embedding_function():
+    # One instance per process so its underlying HTTP client and connection
+    # pool are reused across requests.
     embeddings = OpenAIEmbeddings(
         api_key=settings.OPENAI_API_KEY,
-        model="text-embedding-ada-002"
+        model=EMBEDDING_MODEL
     )
-    return embeddings
+    return CachedEmbeddings(embeddings, EMBEDDING_MODEL, get_embedding_cache())
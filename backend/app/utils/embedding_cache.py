@@ -0,0 +1,221 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..core.config import settings
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def normalize_query(query: str) -> str:
+    """Key for treating user queries that differ only in case or spacing as one."""
+    return normalize_text(query).casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheStore:
+    """
+    On-disk, content-addressed store of embedding vectors, keyed by a hash
+    of (model name, normalized text). Vectors are stored as float32 blobs and
+    the least recently used rows are evicted once ``max_entries`` is exceeded.
+
+    Hits don't write: their ``last_used`` times are buffered and flushed in
+    one transaction every ``touch_flush_interval`` seconds, after
+    ``touch_flush_max`` buffered keys, or before an eviction. The row count
+    is tracked in memory and only recounted when it says the table is over
+    capacity, since other processes (populate_db) share the file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int,
+        touch_flush_interval: float = 30.0,
+        touch_flush_max: int = 1024
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_flush_interval = touch_flush_interval
+        self.touch_flush_max = touch_flush_max
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                for key in found:
+                    self._touched[key] = now
+                if (
+                    len(self._touched) >= self.touch_flush_max
+                    or time.monotonic() - self._last_flush >= self.touch_flush_interval
+                ):
+                    self._flush_touched()
+                    self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, model, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            # Keys are content hashes, so a row that already exists holds the same vector
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._count += cursor.rowcount
+            if self._count > self.max_entries:
+                self._flush_touched()
+                self._evict()
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write buffered ``last_used`` times now."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict(self) -> None:
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            self._count -= cursor.rowcount
+            self.evictions += cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "pending_touches": len(self._touched),
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts the cache hasn't seen to ``underlying``."""
+
+    def __init__(self, underlying: Embeddings, model: str, store: EmbeddingCacheStore):
+        self.underlying = underlying
+        self.model = model
+        self.store = store
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self.store.get_many(keys)
+
+        # Embed each unseen text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.store.put_many(self.model, fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        cached = self.store.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self.underlying.embed_query(text)
+        self.store.put_many(self.model, {key: vector})
+        return vector
+
+
+_store: Optional[EmbeddingCacheStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCacheStore:
+    """Process-wide cache store shared by the ingestion and query paths."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingCacheStore(
+                settings.EMBEDDING_CACHE_PATH,
+                settings.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _store
+
+
+def flush_embedding_cache() -> None:
+    """Persist buffered ``last_used`` times, e.g. at shutdown."""
+    with _store_lock:
+        store = _store
+    if store is not None:
+        store.flush()
@@ -2,15 +2,47 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from os import urandom
+from typing import BinaryIO, Dict, Tuple
+import os
+import struct
+import threading
 import msgpack
 
-def encrypt_file_for_tee(file_data: bytes, public_key_path: str) -> tuple:
-    # Load the TEE's public key
+# Chunked bundle (version 2):
+#   MAGIC | version (1 byte) | header length (uint32) | msgpack header
+#   then frames of: flags (1 byte) | ciphertext length (uint32) | ciphertext | tag (16 bytes)
+# Each frame is sealed with its own nonce (nonce_prefix + frame index) and
+# the frame header and index as associated data, so frames can't be
+# reordered, and a bundle that doesn't end with a FINAL frame is truncated.
+BUNDLE_MAGIC = b"TEEB"
+BUNDLE_VERSION = 2
+FRAME_HEADER = struct.Struct(">BI")
+FRAME_FINAL = 0x01
+TAG_SIZE = 16
+
+_public_keys: Dict[str, Tuple[int, ec.EllipticCurvePublicKey]] = {}
+_public_keys_lock = threading.Lock()
+
+
+def load_public_key(public_key_path: str) -> ec.EllipticCurvePublicKey:
+    """Parsed TEE public key, cached until the file on disk changes."""
+    mtime = os.stat(public_key_path).st_mtime_ns
+    with _public_keys_lock:
+        cached = _public_keys.get(public_key_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
     with open(public_key_path, "rb") as f:
         public_key = load_pem_public_key(f.read())
+    with _public_keys_lock:
+        _public_keys[public_key_path] = (mtime, public_key)
+    return public_key
 
+
+def wrap_key(aes_key: bytes, public_key) -> dict:
+    """ECIES-wrap ``aes_key`` for the TEE: ephemeral ECDH, HKDF, then AES-GCM."""
     # Generate an ephemeral private key for ECDH
     ephemeral_private_key = ec.generate_private_key(ec.SECP256R1())
 
@@ -25,13 +57,74 @@ def encrypt_file_for_tee(file_data: bytes, public_key_path: str) -> tuple:
         info=b"ecies encryption"
     ).derive(shared_key)
 
-    # Generate and encrypt AES key
-    aes_key = urandom(32)
+    # Encrypt AES key
     aes_iv = urandom(12)
     cipher = Cipher(algorithms.AES(derived_key), modes.GCM(aes_iv))
     encryptor = cipher.encryptor()
     encrypted_aes_key = encryptor.update(aes_key) + encryptor.finalize()
-    aes_key_tag = encryptor.tag
+
+    # Get ephemeral public key bytes
+    ephemeral_public_key = ephemeral_private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    return {
+        "ephemeral_public_key": ephemeral_public_key,
+        "encrypted_symmetric_key": encrypted_aes_key,
+        "aes_iv": aes_iv,
+        "aes_key_tag": encryptor.tag,
+    }
+
+
+def frame_nonce(nonce_prefix: bytes, index: int) -> bytes:
+    return nonce_prefix + struct.pack(">I", index)
+
+
+def frame_aad(flags: int, length: int, index: int) -> bytes:
+    return FRAME_HEADER.pack(flags, length) + struct.pack(">Q", index)
+
+
+def encrypt_stream_for_tee(source: BinaryIO, out: BinaryIO, public_key_path: str, frame_size: int) -> int:
+    """
+    Encrypt ``source`` into ``out`` as a chunked (version 2) bundle, reading
+    and sealing one frame at a time so memory use doesn't grow with the
+    file. Blocking; run it in a worker thread. Returns the plaintext size.
+    """
+    aes_key = AESGCM.generate_key(bit_length=256)
+    nonce_prefix = urandom(8)
+    header = msgpack.packb({
+        **wrap_key(aes_key, load_public_key(public_key_path)),
+        "nonce_prefix": nonce_prefix,
+        "frame_size": frame_size,
+    })
+    out.write(BUNDLE_MAGIC + bytes([BUNDLE_VERSION]) + struct.pack(">I", len(header)) + header)
+
+    aesgcm = AESGCM(aes_key)
+    total = 0
+    index = 0
+    block = source.read(frame_size)
+    while True:
+        # Read one frame ahead so the last frame can be flagged
+        next_block = source.read(frame_size) if block else b""
+        flags = 0 if next_block else FRAME_FINAL
+        sealed = aesgcm.encrypt(frame_nonce(nonce_prefix, index), block, frame_aad(flags, len(block), index))
+        out.write(FRAME_HEADER.pack(flags, len(block)))
+        out.write(sealed)
+        total += len(block)
+        if flags & FRAME_FINAL:
+            return total
+        block = next_block
+        index += 1
+
+
+def encrypt_file_for_tee(file_data: bytes, public_key_path: str) -> bytes:
+    """
+    Encrypt an in-memory payload as a single-frame (version 1) MessagePack
+    bundle. Uploads now use ``encrypt_stream_for_tee``; this is kept for
+    small payloads and for readers that only understand the old format.
+    """
+    aes_key = urandom(32)
 
     # Encrypt file data
     data_iv = urandom(12)
@@ -40,21 +133,12 @@ def encrypt_file_for_tee(file_data: bytes, public_key_path: str) -> tuple:
     encrypted_file_data = data_encryptor.update(file_data) + data_encryptor.finalize()
     data_tag = data_encryptor.tag
 
-    # Get ephemeral public key bytes
-    ephemeral_public_key = ephemeral_private_key.public_key().public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
-    )
-
     # Create bundle
     bundle = {
-        "ephemeral_public_key": ephemeral_public_key,
-        "encrypted_symmetric_key": encrypted_aes_key,
+        **wrap_key(aes_key, load_public_key(public_key_path)),
         "encrypted_file_data": encrypted_file_data,
-        "aes_iv": aes_iv,
-        "aes_key_tag": aes_key_tag,
         "data_iv": data_iv,
         "data_tag": data_tag,
     }
 
-    return msgpack.packb(bundle)
\ No newline at end of file
+    return msgpack.packb(bundle)
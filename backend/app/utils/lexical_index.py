@@ -0,0 +1,295 @@
+import math
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LEXICAL_INDEX_FILENAME = "lexical_index.sqlite3"
+# Bumped when the schema changes; an index on an older version is dropped
+# and rebuilt from the collection by populate_db
+SCHEMA_VERSION = 2
+# Chunk metadata kept per document for filtering; the first three also
+# have maintained facet counts
+FACET_FIELDS = ("source", "type", "cid")
+FILTER_FIELDS = FACET_FIELDS + ("ingested_at",)
+
+# Keeps product names, versions and tickers ("gpt-4o", "v2.1", "$ai3") whole
+TOKEN_PATTERN = re.compile(r"[\w$]+(?:[.\-][\w$]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens. Compound tokens are indexed both whole and by
+    their parts, so "auto-drive" matches queries for "auto-drive" and "drive".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token or "." in token:
+            tokens.extend(part for part in re.split(r"[.\-]", token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over the chunks in the vector store,
+    kept next to the Chroma files so backups and restores carry it along.
+    It also keeps each chunk's filterable metadata (FILTER_FIELDS) and
+    per-value chunk counts for FACET_FIELDS, updated in the same
+    transaction as the postings, so filtered searches and facet listings
+    never scan the collection. Each call opens its own short-lived SQLite
+    connection, so the index is safe to use from worker threads and
+    survives the store directory being replaced underneath it.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with conn:
+                for table in ("docs", "postings", "stats", "facets"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id TEXT PRIMARY KEY,"
+            " length INTEGER NOT NULL,"
+            " source TEXT, type TEXT, cid TEXT, ingested_at REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, doc_id)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_cid ON docs(cid)")
+        # Corpus size and total length, maintained on every write so queries
+        # don't have to scan the docs table
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            " id INTEGER PRIMARY KEY CHECK (id = 0),"
+            " docs INTEGER NOT NULL,"
+            " total_length INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO stats (id, docs, total_length) VALUES (0, 0, 0)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS facets ("
+            " field TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (field, value)) WITHOUT ROWID"
+        )
+        return conn
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Index (or re-index) the given chunks."""
+        if not ids:
+            return
+        metadatas = metadatas or [{}] * len(ids)
+        conn = self._connect()
+        try:
+            with conn:
+                self._delete(conn, ids)
+                postings = []
+                docs = []
+                facets: Counter = Counter()
+                for doc_id, text, metadata in zip(ids, texts, metadatas):
+                    counts = Counter(tokenize(text or ""))
+                    fields = [_field_value(metadata or {}, field) for field in FILTER_FIELDS]
+                    docs.append((doc_id, sum(counts.values()), *fields))
+                    postings.extend((term, doc_id, tf) for term, tf in counts.items())
+                    for field, value in zip(FACET_FIELDS, fields):
+                        if value is not None:
+                            facets[field, value] += 1
+                conn.executemany(
+                    "INSERT INTO docs (id, length, source, type, cid, ingested_at) VALUES (?, ?, ?, ?, ?, ?)", docs
+                )
+                conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings)
+                conn.execute(
+                    "UPDATE stats SET docs = docs + ?, total_length = total_length + ? WHERE id = 0",
+                    (len(docs), sum(doc[1] for doc in docs))
+                )
+                self._add_facets(conn, facets)
+        finally:
+            conn.close()
+
+    def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                self._delete(conn, ids)
+        finally:
+            conn.close()
+
+    def _delete(self, conn: sqlite3.Connection, ids: List[str]) -> None:
+        unique = list(dict.fromkeys(ids))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT length, source, type, cid FROM docs WHERE id IN ({placeholders})", batch
+            ).fetchall()
+            if not rows:
+                continue
+            facets: Counter = Counter()
+            for _length, *values in rows:
+                for field, value in zip(FACET_FIELDS, values):
+                    if value is not None:
+                        facets[field, value] -= 1
+            conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", batch)
+            conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", batch)
+            conn.execute(
+                "UPDATE stats SET docs = docs - ?, total_length = total_length - ? WHERE id = 0",
+                (len(rows), sum(row[0] for row in rows))
+            )
+            self._add_facets(conn, facets)
+
+    def _add_facets(self, conn: sqlite3.Connection, deltas: Counter) -> None:
+        conn.executemany(
+            "INSERT INTO facets (field, value, count) VALUES (?, ?, ?)"
+            " ON CONFLICT (field, value) DO UPDATE SET count = count + excluded.count",
+            [(field, value, delta) for (field, value), delta in deltas.items() if delta]
+        )
+        conn.execute("DELETE FROM facets WHERE count <= 0")
+
+    def clear(self) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM docs")
+                conn.execute("DELETE FROM facets")
+                conn.execute("UPDATE stats SET docs = 0, total_length = 0 WHERE id = 0")
+        finally:
+            conn.close()
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT docs FROM stats WHERE id = 0").fetchone()[0]
+        finally:
+            conn.close()
+
+    def chunk_ids(self, cid: str) -> List[str]:
+        """IDs of the indexed chunks that came from DSN object ``cid``."""
+        if not os.path.exists(self.path):
+            return []
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute("SELECT id FROM docs WHERE cid = ? ORDER BY id", (cid,))]
+        finally:
+            conn.close()
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        """Chunk counts per value of each FACET_FIELDS field."""
+        result: Dict[str, Dict[str, int]] = {field: {} for field in FACET_FIELDS}
+        if not os.path.exists(self.path):
+            return result
+        conn = self._connect()
+        try:
+            for field, value, count in conn.execute("SELECT field, value, count FROM facets ORDER BY count DESC"):
+                result.setdefault(field, {})[value] = count
+            return result
+        finally:
+            conn.close()
+
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Top ``k`` (chunk id, BM25 score) pairs for ``query``. ``filters`` maps
+        FACET_FIELDS to a list of allowed values and "ingested_at" to a
+        (min, max) pair whose ends may be None.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not os.path.exists(self.path):
+            return []
+        clauses, params = _filter_clauses(filters or {})
+        conn = self._connect()
+        try:
+            docs, total_length = conn.execute(
+                "SELECT docs, total_length FROM stats WHERE id = 0"
+            ).fetchone()
+            if not docs:
+                return []
+            avg_length = total_length / docs
+            scores: Counter = Counter()
+            for term in terms:
+                rows = conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p"
+                    " JOIN docs d ON d.id = p.doc_id WHERE p.term = ?" + "".join(f" AND {c}" for c in clauses),
+                    (term, *params)
+                ).fetchall()
+                if not rows:
+                    continue
+                # Document frequency is corpus-wide even when filtering, so
+                # scores don't depend on the filter
+                df = len(rows) if not clauses else conn.execute(
+                    "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+                ).fetchone()[0]
+                idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            return scores.most_common(k)
+        finally:
+            conn.close()
+
+    def rebuild(self, chunks: Iterable[Tuple[List[str], List[str], List[dict]]]) -> int:
+        """Replace the index with ``chunks``, an iterable of (ids, texts, metadatas) batches."""
+        self.clear()
+        indexed = 0
+        for ids, texts, metadatas in chunks:
+            self.upsert(ids, texts, metadatas)
+            indexed += len(ids)
+        return indexed
+
+
+def _field_value(metadata: Dict[str, Any], field: str):
+    value = metadata.get(field)
+    if value is None:
+        return None
+    if field == "ingested_at":
+        return float(value)
+    return str(value)
+
+
+def _filter_clauses(filters: Dict[str, Any]) -> Tuple[List[str], list]:
+    clauses, params = [], []
+    for field in FACET_FIELDS:
+        values = filters.get(field)
+        if values:
+            clauses.append(f"d.{field} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    low, high = filters.get("ingested_at") or (None, None)
+    if low is not None:
+        clauses.append("d.ingested_at >= ?")
+        params.append(low)
+    if high is not None:
+        clauses.append("d.ingested_at <= ?")
+        params.append(high)
+    return clauses, params
+
+
+def get_lexical_index(chroma_path: Optional[str] = None) -> LexicalIndex:
+    """Index stored inside ``chroma_path`` (default CHROMA_PATH)."""
+    from ..core.config import settings
+    return LexicalIndex(os.path.join(chroma_path or settings.CHROMA_PATH, LEXICAL_INDEX_FILENAME))
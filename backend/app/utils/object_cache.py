@@ -0,0 +1,178 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from ..core.config import settings
+
+# Multibase CIDs are alphanumeric; anything else is never used as a path
+CID_PATTERN = re.compile(r"^[A-Za-z0-9]{1,128}$")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: str, dest: str) -> None:
+    """Hard-link ``source`` to ``dest`` (atomically replacing it), copying across filesystems."""
+    tmp_path = f"{dest}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+class ObjectCache:
+    """
+    Content-addressed store of decrypted DSN objects, one file per CID,
+    with a SQLite index of size, SHA-256 and last use. Objects are checked
+    against their recorded hash before being served, and the least recently
+    used ones are deleted once the total exceeds ``max_bytes``.
+
+    Objects are hard-linked to the data directory copies where possible, so
+    a file rewritten in place (rather than replaced) also invalidates its
+    cached object; verification catches that and it is fetched again.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupt = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "objects.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " cid TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_last_used ON objects(last_used)")
+        self._conn.commit()
+
+    def object_path(self, cid: str) -> str:
+        return os.path.join(self.path, "objects", cid)
+
+    def get(self, cid: str) -> Optional[dict]:
+        """
+        {"path", "filename", "size", "sha256"} of the verified cached object
+        for ``cid``, or None. Blocking (hashes the object); run it off the
+        event loop. The file may be evicted later, so callers should link or
+        copy it promptly.
+        """
+        if not CID_PATTERN.match(cid):
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT filename, size, sha256 FROM objects WHERE cid = ?", (cid,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+        path = self.object_path(cid)
+        filename, size, sha256 = row
+        if not os.path.exists(path) or os.path.getsize(path) != size or file_sha256(path) != sha256:
+            self._forget(cid)
+            with self._lock:
+                self.corrupt += 1
+                self.misses += 1
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE objects SET last_used = ? WHERE cid = ?", (time.time(), cid))
+            self._conn.commit()
+            self.hits += 1
+        return {"path": path, "filename": filename, "size": size, "sha256": sha256}
+
+    def put(self, cid: str, source_path: str, filename: str, sha256: Optional[str] = None) -> bool:
+        """
+        Cache the file at ``source_path`` as ``cid``'s object, remembering
+        the filename it was served under. Objects larger than the whole
+        cache are skipped. Blocking; run it off the event loop.
+        """
+        if not CID_PATTERN.match(cid):
+            return False
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return False
+        sha256 = sha256 or file_sha256(source_path)
+        link_or_copy(source_path, self.object_path(cid))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (cid, filename, size, sha256, last_used) VALUES (?, ?, ?, ?, ?)",
+                (cid, filename, size, sha256, time.time())
+            )
+            evicted = self._evict()
+            self._conn.commit()
+        for evicted_cid in evicted:
+            try:
+                os.remove(self.object_path(evicted_cid))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _evict(self) -> list:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        evicted = []
+        for cid, size in self._conn.execute("SELECT cid, size FROM objects ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append(cid)
+            total -= size
+        if evicted:
+            self._conn.executemany("DELETE FROM objects WHERE cid = ?", [(cid,) for cid in evicted])
+            self.evictions += len(evicted)
+        return evicted
+
+    def _forget(self, cid: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM objects WHERE cid = ?", (cid,))
+            self._conn.commit()
+        try:
+            os.remove(self.object_path(cid))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+            hits, misses, evictions, corrupt = self.hits, self.misses, self.evictions, self.corrupt
+        lookups = hits + misses
+        return {
+            "path": self.path,
+            "entries": count,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": evictions,
+            "corrupt": corrupt,
+        }
+
+
+_cache: Optional[ObjectCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_object_cache() -> ObjectCache:
+    """Process-wide object cache; objects are content-addressed, so tenants share it."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ObjectCache(settings.OBJECT_CACHE_PATH, settings.OBJECT_CACHE_MAX_BYTES)
+        return _cache
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import io
+import threading
+from typing import AsyncIterator, Optional
+
+# Bridges between a blocking worker thread and the event loop, for work
+# (zipping, encrypting, unzipping) that streams to or from an upload or
+# download without holding it in memory.
+
+
+class PipeAborted(Exception):
+    """The other end of a pipe went away (e.g. the upload or download failed)."""
+
+
+class StreamPipe(io.RawIOBase):
+    """
+    Write-only file object that hands fixed-size chunks from a worker thread
+    to an async consumer. At most ``depth`` chunks are queued; the writer
+    blocks until the consumer catches up, so memory stays bounded no matter
+    how much is written.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, chunk_size: int, depth: int):
+        self._loop = loop
+        self._chunk_size = chunk_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self._buffer = bytearray()
+        self.aborted = threading.Event()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buffer += b
+        while len(self._buffer) >= self._chunk_size:
+            self._send(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(b)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Flush the tail and signal end of stream, or pass ``error`` to the consumer."""
+        if error is None and self._buffer:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+        self._send(error)
+
+    def _send(self, item) -> None:
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.aborted.is_set():
+                    future.cancel()
+                    raise PipeAborted()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.aborted.set()
+
+
+class ChunkFeed:
+    """
+    Read side of a download for a worker thread: the event loop ``put``s
+    blocks as they arrive and the thread pulls them with ``read_some`` and
+    ``read_exact``. At most
+    ``depth`` blocks are queued, so a slow consumer throttles the download
+    instead of buffering it.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, depth: int):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self._buffer = b""
+        self._eof = False
+        self.aborted = threading.Event()
+
+    async def put(self, block: bytes) -> None:
+        """Queue ``block``; an empty block marks the end of the stream."""
+        await self._queue.put(block)
+
+    def _next_block(self) -> bytes:
+        if self._eof:
+            return b""
+        future = asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop)
+        while True:
+            try:
+                block = future.result(timeout=0.5)
+                break
+            except concurrent.futures.TimeoutError:
+                if self.aborted.is_set():
+                    future.cancel()
+                    raise PipeAborted()
+        if not block:
+            self._eof = True
+        return block
+
+    def read_some(self, limit: int) -> bytes:
+        """Up to ``limit`` bytes; empty only at end of stream."""
+        if not self._buffer:
+            self._buffer = self._next_block()
+        data, self._buffer = self._buffer[:limit], self._buffer[limit:]
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        parts = []
+        while size:
+            data = self.read_some(size)
+            if not data:
+                raise ValueError("Stream is truncated")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes) -> None:
+        self._buffer = data + self._buffer
@@ -2,68 +2,217 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-import msgpack
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from typing import BinaryIO, Dict, Tuple
 import logging
+import os
+import struct
+import threading
+import msgpack
+
+from .encryption import BUNDLE_MAGIC, BUNDLE_VERSION, FRAME_FINAL, FRAME_HEADER, TAG_SIZE, frame_aad, frame_nonce
 
 logger = logging.getLogger(__name__)
 
+# Values above this size are streamed from disk instead of read into memory
+SMALL_FIELD_LIMIT = 64 * 1024
+DECRYPT_BUFFER_SIZE = 1024 * 1024
+
+
 def decrypt_tee_file(encrypted_file_path: str, private_key_path: str, output_file_path: str) -> bool:
     """
     Decrypt a file that was encrypted for TEE processing
     
+    Reads both the chunked (version 2) bundle and the original MessagePack
+    one. Either way the data is decrypted in bounded blocks, so memory use
+    does not grow with the file size. The plaintext is written to a
+    temporary file and only moved to ``output_file_path`` once every tag
+    has been verified.
+    
     Args:
-        encrypted_file_path: Path to the encrypted MessagePack bundle
+        encrypted_file_path: Path to the encrypted bundle
         private_key_path: Path to the TEE's private key
         output_file_path: Where to save the decrypted file
         
     Returns:
         bool: True if decryption was successful
     """
+    tmp_output_path = output_file_path + ".partial"
     try:
         # Load the TEE's private ECC key
-        with open(private_key_path, "rb") as f:
-            private_key = serialization.load_pem_private_key(f.read(), password=None)
-
-        # Load the encrypted bundle using MessagePack
-        with open(encrypted_file_path, "rb") as f:
-            bundle = msgpack.unpackb(f.read())
-
-        # Extract data from the bundle
-        ephemeral_public_key = serialization.load_pem_public_key(bundle["ephemeral_public_key"])
-        encrypted_symmetric_key = bundle["encrypted_symmetric_key"]
-        aes_iv = bundle["aes_iv"]
-        aes_key_tag = bundle["aes_key_tag"]
-        encrypted_file_data = bundle["encrypted_file_data"]
-        data_iv = bundle["data_iv"]
-        data_tag = bundle["data_tag"]
-
-        # Perform ECDH to derive the shared secret
-        shared_key = private_key.exchange(ec.ECDH(), ephemeral_public_key)
-
-        # Derive the symmetric key from the shared secret using HKDF
-        derived_key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b"ecies encryption"
-        ).derive(shared_key)
-
-        # Decrypt the AES symmetric key
-        aes_cipher = Cipher(algorithms.AES(derived_key), modes.GCM(aes_iv, aes_key_tag))
-        aes_decryptor = aes_cipher.decryptor()
-        aes_symmetric_key = aes_decryptor.update(encrypted_symmetric_key) + aes_decryptor.finalize()
-
-        # Decrypt the file data
-        data_cipher = Cipher(algorithms.AES(aes_symmetric_key), modes.GCM(data_iv, data_tag))
-        data_decryptor = data_cipher.decryptor()
-        decrypted_file_data = data_decryptor.update(encrypted_file_data) + data_decryptor.finalize()
-
-        # Save the decrypted file
-        with open(output_file_path, "wb") as f:
-            f.write(decrypted_file_data)
+        private_key = load_private_key(private_key_path)
+
+        with open(encrypted_file_path, "rb") as f, open(tmp_output_path, "wb") as out:
+            if f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC:
+                decrypt_chunked_bundle(f, private_key, out)
+            else:
+                f.seek(0)
+                decrypt_msgpack_bundle(f, private_key, out)
 
+        os.replace(tmp_output_path, output_file_path)
         return True
 
     except Exception as e:
-        logger.error(f"Error during TEE file decryption: {str(e)}")
-        return False
\ No newline at end of file
+        logger.error(f"Error during TEE file decryption: {str(e) or e.__class__.__name__}")
+        if os.path.exists(tmp_output_path):
+            os.remove(tmp_output_path)
+        return False
+
+
+_private_keys: Dict[str, Tuple[int, ec.EllipticCurvePrivateKey]] = {}
+_private_keys_lock = threading.Lock()
+
+
+def load_private_key(private_key_path: str) -> ec.EllipticCurvePrivateKey:
+    """Parsed TEE private key, cached until the file on disk changes."""
+    mtime = os.stat(private_key_path).st_mtime_ns
+    with _private_keys_lock:
+        cached = _private_keys.get(private_key_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(private_key_path, "rb") as f:
+        private_key = serialization.load_pem_private_key(f.read(), password=None)
+    with _private_keys_lock:
+        _private_keys[private_key_path] = (mtime, private_key)
+    return private_key
+
+
+def unwrap_key(private_key, bundle: dict) -> bytes:
+    """Recover the AES data key from the ECIES-wrapped fields of a bundle."""
+    ephemeral_public_key = serialization.load_pem_public_key(bundle["ephemeral_public_key"])
+
+    # Perform ECDH to derive the shared secret
+    shared_key = private_key.exchange(ec.ECDH(), ephemeral_public_key)
+
+    # Derive the symmetric key from the shared secret using HKDF
+    derived_key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"ecies encryption"
+    ).derive(shared_key)
+
+    # Decrypt the AES symmetric key
+    aes_cipher = Cipher(algorithms.AES(derived_key), modes.GCM(bundle["aes_iv"], bundle["aes_key_tag"]))
+    aes_decryptor = aes_cipher.decryptor()
+    return aes_decryptor.update(bundle["encrypted_symmetric_key"]) + aes_decryptor.finalize()
+
+
+def decrypt_msgpack_bundle(f: BinaryIO, private_key, out: BinaryIO) -> None:
+    """
+    Version 1: a MessagePack map with the whole file as one GCM message. The
+    map is scanned in place and the data decrypted in bounded blocks; the
+    tag is only checked at the end.
+    """
+    # Locate every field of the MessagePack bundle without loading the data
+    fields = scan_bundle(f)
+    bundle = {
+        key: read_field(f, offset, length)
+        for key, (offset, length) in fields.items()
+        if key != "encrypted_file_data"
+    }
+    aes_symmetric_key = unwrap_key(private_key, bundle)
+
+    # Decrypt the file data block by block
+    data_cipher = Cipher(algorithms.AES(aes_symmetric_key), modes.GCM(bundle["data_iv"], bundle["data_tag"]))
+    data_decryptor = data_cipher.decryptor()
+    data_offset, remaining = fields["encrypted_file_data"]
+    f.seek(data_offset)
+    while remaining:
+        block = f.read(min(DECRYPT_BUFFER_SIZE, remaining))
+        if not block:
+            raise ValueError("Encrypted bundle is truncated")
+        remaining -= len(block)
+        out.write(data_decryptor.update(block))
+    # Raises InvalidTag if the data was tampered with
+    out.write(data_decryptor.finalize())
+
+
+def decrypt_chunked_bundle(f: BinaryIO, private_key, out: BinaryIO) -> None:
+    """
+    Version 2 (see ``encrypt_stream_for_tee``): a header followed by
+    independently authenticated frames, each verified before it is written.
+    ``f`` is positioned just after the magic.
+    """
+    version = f.read(1)
+    if version != bytes([BUNDLE_VERSION]):
+        raise ValueError(f"Unsupported bundle version {version.hex() or 'missing'}")
+    (header_length,) = struct.unpack(">I", _read_exact(f, 4))
+    if header_length > SMALL_FIELD_LIMIT:
+        raise ValueError(f"Unexpectedly large bundle header ({header_length} bytes)")
+    header = msgpack.unpackb(_read_exact(f, header_length))
+    frame_size = header["frame_size"]
+    nonce_prefix = header["nonce_prefix"]
+    aesgcm = AESGCM(unwrap_key(private_key, header))
+
+    index = 0
+    while True:
+        flags, length = FRAME_HEADER.unpack(_read_exact(f, FRAME_HEADER.size))
+        if length > frame_size:
+            raise ValueError(f"Frame {index} exceeds the bundle frame size")
+        sealed = _read_exact(f, length + TAG_SIZE)
+        # Raises InvalidTag if the frame was tampered with, moved or re-flagged
+        out.write(aesgcm.decrypt(frame_nonce(nonce_prefix, index), sealed, frame_aad(flags, length, index)))
+        if flags & FRAME_FINAL:
+            break
+        index += 1
+    if f.read(1):
+        raise ValueError("Unexpected data after the final frame")
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Encrypted bundle is truncated")
+    return data
+
+
+def scan_bundle(f: BinaryIO) -> Dict[str, Tuple[int, int]]:
+    """
+    Walk a MessagePack map of string keys to bin/str values and return
+    ``{key: (offset, length)}`` for each value, seeking over the payloads.
+    """
+    count = _read_map_header(f)
+    fields = {}
+    for _ in range(count):
+        key_length = _read_length(f, allow_bin=False)
+        key = f.read(key_length).decode("utf-8")
+        length = _read_length(f, allow_bin=True)
+        fields[key] = (f.tell(), length)
+        f.seek(length, os.SEEK_CUR)
+    return fields
+
+
+def read_field(f: BinaryIO, offset: int, length: int) -> bytes:
+    if length > SMALL_FIELD_LIMIT:
+        raise ValueError(f"Unexpectedly large bundle field ({length} bytes)")
+    f.seek(offset)
+    return f.read(length)
+
+
+# MessagePack type byte -> size of the big-endian length that follows it
+_BIN_TYPES = ((0xc4, 1), (0xc5, 2), (0xc6, 4))
+_STR_TYPES = ((0xd9, 1), (0xda, 2), (0xdb, 4))
+
+
+def _read_map_header(f: BinaryIO) -> int:
+    marker = f.read(1)[0]
+    if 0x80 <= marker <= 0x8f:
+        return marker & 0x0f
+    if marker == 0xde:
+        return struct.unpack(">H", f.read(2))[0]
+    if marker == 0xdf:
+        return struct.unpack(">I", f.read(4))[0]
+    raise ValueError("Encrypted bundle is not a MessagePack map")
+
+
+def _read_length(f: BinaryIO, allow_bin: bool) -> int:
+    """Read a str (or, if allowed, bin) header and return the payload length."""
+    marker = f.read(1)[0]
+    # fixstr: length is in the low five bits
+    if 0xa0 <= marker <= 0xbf:
+        return marker & 0x1f
+    for type_byte, size in (_BIN_TYPES if allow_bin else ()) + _STR_TYPES:
+        if marker == type_byte:
+            return int.from_bytes(f.read(size), "big")
+    raise ValueError(f"Unexpected MessagePack type 0x{marker:02x} in encrypted bundle")
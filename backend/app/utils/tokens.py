@@ -0,0 +1,53 @@
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Callable
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough BPE stand-in: common English words are one or two tokens (about
+# one per six letters), every punctuation mark is one.
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(math.ceil(len(piece) / 6) for piece in _PIECES.findall(text))
+
+
+@lru_cache(maxsize=None)
+def get_token_counter() -> Callable[[str], int]:
+    """
+    Token counter for prompts sent to the TEE model. Llama 3's tokenizer is
+    a tiktoken BPE that extends cl100k_base, so that encoding is a close
+    local proxy. tiktoken downloads encodings on first use; when that isn't
+    possible (offline hosts) fall back to a character-based estimate.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"Tokenizer {settings.TOKENIZER_ENCODING} unavailable ({e.__class__.__name__}), estimating token counts")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter()(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of ``text`` that fits ``max_tokens``, cut at a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text.rfind(" ", 0, low)
+    return text[:cut if cut > 0 else low].rstrip()
@@ -0,0 +1,4 @@
+import os
+
+# chromadb phones home on client creation; keep benchmark runs offline
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -0,0 +1,89 @@
+"""
+Prompt size of the old fixed top-5 concatenation versus the token-budgeted
+packer (whitespace collapse, neighbour overlap trimming, budget fill), on
+the bench_rerank fixture. Generation prefill time on the TEE VM scales with
+the prompt token count reported here.
+
+    cd backend && python -m benchmarks.bench_context_packing --pages 600 --queries 100
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+from langchain.prompts import ChatPromptTemplate
+
+from app.core.config import settings
+from app.services import rag
+from app.services.vector_store import VectorStoreManager, chroma_collection
+from app.utils.lexical_index import get_lexical_index
+from app.utils.tokens import count_tokens
+from benchmarks.bench_hybrid_search import TrigramEmbeddings
+from benchmarks.bench_query_store import percentile
+from benchmarks.bench_rerank import build_pages
+
+CONFIGS = {
+    # Neighbouring chunks allowed, so overlap trimming has work to do
+    "neighbours": {"maxPerPage": 0, "rerank": "none", "finalK": 5},
+    "default": {},
+}
+
+
+async def evaluate(name: str, config: dict, budget: int, queries, embeddings):
+    legacy, packed, pack_ms, trimmed = [], [], [], []
+    template = ChatPromptTemplate.from_template(rag.PROMPT_TEMPLATE)
+    for question in queries:
+        results = await rag.retrieve(question, embeddings.embed_query(question), config)
+        context = "\n\n---\n\n".join(doc.page_content for doc, _score in results)
+        legacy.append(count_tokens(template.format(context=context, question=question)))
+        start = time.perf_counter()
+        _prompt, _results, usage = rag.pack_context(question, results, budget)
+        pack_ms.append((time.perf_counter() - start) * 1000)
+        packed.append(usage["prompt_tokens"])
+        trimmed.append(usage["chars_trimmed"])
+    print(
+        f"{name:>10} budget={budget}: prompt tokens mean {statistics.mean(legacy):.0f} -> "
+        f"{statistics.mean(packed):.0f} (max {max(legacy)} -> {max(packed)}), "
+        f"chars trimmed/query {statistics.mean(trimmed):.0f}, pack p50 {percentile(pack_ms, 50):.1f}ms"
+    )
+
+
+async def main(args):
+    subjects, chunks = build_pages(args.pages)
+    # PDF text is full of hard line breaks and runs of spaces
+    for chunk in chunks:
+        chunk.page_content = chunk.page_content.replace(". ", ".\n  ")
+    embeddings = TrigramEmbeddings()
+    rng = random.Random(3)
+    queries = [f"what do we know about {rng.choice(subjects)}?" for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        manager = VectorStoreManager(chroma_dir, embeddings)
+        rag.get_vector_store = lambda tenant=None: manager
+        collection = chroma_collection(manager.get())
+        lexical_index = get_lexical_index(chroma_dir)
+        for start in range(0, len(chunks), 1000):
+            batch = chunks[start:start + 1000]
+            ids = [chunk.metadata["id"] for chunk in batch]
+            texts = [chunk.page_content for chunk in batch]
+            collection.upsert(
+                ids=ids,
+                embeddings=embeddings.embed_documents(texts),
+                documents=texts,
+                metadatas=[chunk.metadata for chunk in batch]
+            )
+            lexical_index.upsert(ids, texts)
+        print(f"corpus: {len(chunks)} chunks")
+
+        for name, config in CONFIGS.items():
+            for budget in (settings.PROMPT_TOKEN_BUDGET, 512):
+                await evaluate(name, config, budget, queries, embeddings)
+        manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+/upload-db against the local Auto-Drive stand-in: the old make_archive on
+the event loop + whole-file read + single chunk, versus the temp-file and
+streaming snapshot modes. Reports wall time, peak Python heap, the
+worst event-loop stall seen by a 10 ms ticker while the backup runs, and
+the longest a writer (probing the store write lock every 50 ms) waited.
+
+    cd backend && python -m benchmarks.bench_db_backup --docs 20000
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+
+import aiohttp
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.core.config import settings
+from app.services.backup import backup_database
+from app.services.http_client import close_http_clients
+from app.services.vector_store import open_chroma, store_write_lock
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+def build_store(path: str, docs: int, dim: int) -> None:
+    db = open_chroma(path, DeterministicFakeEmbedding(size=dim))
+    for start in range(0, docs, 1000):
+        db.add_texts([f"document {i} about topic {i % 97}" for i in range(start, min(docs, start + 1000))])
+
+
+async def legacy_backup(base_url: str) -> dict:
+    """The previous /upload-db body."""
+    shutil.make_archive("chroma_backup", "zip", settings.CHROMA_PATH)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{base_url}/uploads/file", json={"filename": "chroma_backup.zip"}) as response:
+                upload_id = (await response.json())["id"]
+            with open("chroma_backup.zip", "rb") as f:
+                file_data = f.read()
+            form_data = aiohttp.FormData()
+            form_data.add_field("file", file_data, filename="chroma_backup.zip", content_type="application/zip")
+            form_data.add_field("index", "0")
+            async with session.post(f"{base_url}/uploads/file/{upload_id}/chunk", data=form_data) as response:
+                response.raise_for_status()
+            async with session.post(f"{base_url}/uploads/{upload_id}/complete") as response:
+                return await response.json()
+    finally:
+        os.remove("chroma_backup.zip")
+
+
+async def current_backup() -> dict:
+    _upload_id, completion = await backup_database()
+    return completion
+
+
+def probe_writer(stop: threading.Event, waits: list) -> None:
+    """Stands in for ingestion or /chat/context writes during the backup."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        with store_write_lock:
+            waits.append(time.perf_counter() - start)
+        stop.wait(0.05)
+
+
+async def measure(label: str, coro_factory, objects_dir: str):
+    stalls = []
+    waits = []
+    stop = threading.Event()
+    writer = threading.Thread(target=probe_writer, args=(stop, waits))
+
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - start - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)  # let the ticker start before the backup can block the loop
+    tracemalloc.start()
+    writer.start()
+    start = time.perf_counter()
+    completion = await coro_factory()
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tick.cancel()
+    stop.set()
+    writer.join()
+
+    # The uploaded object must be a complete archive of the store
+    with open(os.path.join(objects_dir, completion["cid"]), "rb") as f:
+        names = zipfile.ZipFile(io.BytesIO(f.read())).namelist()
+    assert "chroma.sqlite3" in names, names
+    print(
+        f"{label:>10}: time={elapsed:6.2f}s  peak={peak / 1024 ** 2:7.1f} MiB  "
+        f"max loop stall={max(stalls, default=0) * 1000:7.1f}ms  max writer wait={max(waits, default=0) * 1000:7.1f}ms  "
+        f"size={completion['size'] / 1024 ** 2:.1f} MiB"
+    )
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        settings.CHROMA_PATH = os.path.join(workdir, "chroma")
+        settings.DSN_UPLOAD_STATE_DIR = os.path.join(workdir, "state")
+        objects_dir = os.path.join(workdir, "objects")
+        os.makedirs(objects_dir)
+        build_store(settings.CHROMA_PATH, args.docs, args.dim)
+
+        app = create_stub_app(objects_dir=objects_dir, upload_latency=args.upload_latency)
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            await measure("legacy", lambda: legacy_backup(stub.base_url), objects_dir)
+            settings.DB_BACKUP_STREAMING = False
+            await measure("temp file", current_backup, objects_dir)
+            settings.DB_BACKUP_STREAMING = True
+            await measure("streaming", current_backup, objects_dir)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--upload-latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
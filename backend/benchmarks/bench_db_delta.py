@@ -0,0 +1,88 @@
+"""
+Incremental /upload-db against the local Auto-Drive stand-in: a first
+(full) block backup, then a backup after adding a handful of documents,
+compared with re-uploading the full zip; then /restore-db from the second
+manifest, checking the restored store holds the same documents.
+
+    cd backend && python -m benchmarks.bench_db_delta --docs 20000 --added 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.core.config import settings
+from app.services import vector_store
+from app.services.backup import backup_database, backup_database_incremental, restore_backup
+from app.services.http_client import close_http_clients
+from app.services.vector_store import VectorStoreManager, chroma_collection, open_chroma
+from benchmarks.bench_db_backup import build_store
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+async def timed(label: str, coro):
+    start = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def report(label: str, elapsed: float, stats: dict = None, size: int = None):
+    if stats is not None:
+        detail = (
+            f"blocks uploaded={stats['blocks_uploaded']}/{stats['blocks_total']}  "
+            f"changed={stats['bytes_changed'] / 1024 ** 2:.1f} MiB"
+        )
+    else:
+        detail = f"bytes={size / 1024 ** 2:.1f} MiB"
+    print(f"{label:>22}: time={elapsed:6.2f}s  {detail}")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        settings.CHROMA_PATH = os.path.join(workdir, "chroma")
+        settings.DB_BACKUP_STATE_PATH = os.path.join(workdir, "backup_state.json")
+        objects_dir = os.path.join(workdir, "objects")
+        os.makedirs(objects_dir)
+        embeddings = DeterministicFakeEmbedding(size=args.dim)
+        build_store(settings.CHROMA_PATH, args.docs, args.dim)
+        vector_store._manager = VectorStoreManager(settings.CHROMA_PATH, embeddings)
+
+        app = create_stub_app(objects_dir=objects_dir, upload_latency=args.upload_latency)
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+
+            (_id, _completion, stats), elapsed = await timed("first", backup_database_incremental())
+            report("first block backup", elapsed, stats)
+
+            vector_store.get_vector_store().get().add_texts(
+                [f"new context document {i}" for i in range(args.added)]
+            )
+
+            (_id, completion, stats), elapsed = await timed("delta", backup_database_incremental())
+            report(f"after +{args.added} docs", elapsed, stats)
+            (_id, full), elapsed = await timed("full", backup_database())
+            report("full zip (same state)", elapsed, size=full["size"])
+
+            expected = chroma_collection(vector_store.get_vector_store().get()).count()
+            restore_stats, elapsed = await timed("restore", restore_backup(completion["cid"]))
+            restored = open_chroma(settings.CHROMA_PATH, embeddings)
+            count = chroma_collection(restored).count()
+            print(
+                f"{'restore':>22}: time={elapsed:6.2f}s  blocks fetched={restore_stats['blocks_downloaded']}  "
+                f"documents={count} (expected {expected})"
+            )
+            assert count == expected
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--added", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--upload-latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+Cold start of a new replica: re-embedding the corpus through populate_db
+versus restoring the same store from a DSN backup, either a full zip
+(unpacked while it downloads) or an incremental manifest (blocks fetched in
+parallel), against the local embedding and Auto-Drive stand-ins.
+
+    cd backend && python -m benchmarks.bench_db_restore --chunks 4000 --embedding-item-latency 0.01
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.core.config import settings
+from app.services.backup import backup_database, backup_database_incremental, restore_backup
+from app.services.http_client import close_http_clients
+from app.services.vector_store import chroma_collection, open_chroma
+from benchmarks.bench_ingest import synthetic_chunks
+from benchmarks.bench_query_store import make_embeddings
+from benchmarks.stub_servers import StubServer, create_stub_app
+from vdb import populate_db
+
+
+def count_documents(path: str, base_url: str) -> int:
+    return chroma_collection(open_chroma(path, make_embeddings(base_url))).count()
+
+
+async def timed_restore(label: str, cid: str, target: str, base_url: str, expected: int):
+    settings.CHROMA_PATH = target
+    tracemalloc.start()
+    start = time.perf_counter()
+    await restore_backup(cid)
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = count_documents(target, base_url)
+    assert count == expected, (count, expected)
+    print(f"{label:>22}: {elapsed:7.2f}s  peak={peak / 1024 ** 2:6.1f} MiB  documents={count}")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        objects_dir = os.path.join(workdir, "objects")
+        os.makedirs(objects_dir)
+        settings.DB_BACKUP_STATE_PATH = os.path.join(workdir, "backup_state.json")
+        app = create_stub_app(
+            embedding_latency=args.embedding_latency,
+            embedding_item_latency=args.embedding_item_latency,
+            objects_dir=objects_dir,
+            upload_latency=args.upload_latency
+        )
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            source = os.path.join(workdir, "source")
+            settings.CHROMA_PATH = source
+            populate_db.get_embedding_function = lambda: make_embeddings(stub.base_url)
+
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            await loop.run_in_executor(None, populate_db.add_to_chroma, synthetic_chunks(args.chunks))
+            print(f"{'re-embed corpus':>22}: {time.perf_counter() - start:7.2f}s")
+            expected = count_documents(source, stub.base_url)
+
+            _id, full = await backup_database()
+            _id, manifest, _stats = await backup_database_incremental()
+
+            await timed_restore("restore full zip", full["cid"], os.path.join(workdir, "from_zip"), stub.base_url, expected)
+            await timed_restore("restore manifest", manifest["cid"], os.path.join(workdir, "from_manifest"), stub.base_url, expected)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--embedding-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-item-latency", type=float, default=0.01)
+    parser.add_argument("--upload-latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,153 @@
+"""
+Peak Python heap (tracemalloc) and wall time of /retrieve's download +
+decrypt step: the old read-everything path versus streaming to disk and
+decrypting in bounded blocks, against the local DSN stand-in.
+
+    cd backend && python -m benchmarks.bench_dsn_download --size-mb 500
+"""
+import argparse
+import asyncio
+import os
+import struct
+import tempfile
+import time
+import tracemalloc
+
+import aiohttp
+import msgpack
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.core.config import settings
+from app.services.http_client import close_http_clients
+from app.services.dsn import download_object
+from app.utils.tee_decryption import decrypt_tee_file
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+BLOCK = 1024 * 1024
+
+
+def write_keys(directory: str):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_path = os.path.join(directory, "private_key.pem")
+    with open(private_path, "wb") as f:
+        f.write(private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    return private_key.public_key(), private_path
+
+
+def write_bundle(path: str, size: int, public_key):
+    """Write an encrypt_file_for_tee-compatible bundle of ``size`` random bytes without holding it in memory."""
+    ephemeral = ec.generate_private_key(ec.SECP256R1())
+    derived_key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b"ecies encryption"
+    ).derive(ephemeral.exchange(ec.ECDH(), public_key))
+    aes_key, aes_iv, data_iv = os.urandom(32), os.urandom(12), os.urandom(12)
+    key_encryptor = Cipher(algorithms.AES(derived_key), modes.GCM(aes_iv)).encryptor()
+    encrypted_aes_key = key_encryptor.update(aes_key) + key_encryptor.finalize()
+    data_encryptor = Cipher(algorithms.AES(aes_key), modes.GCM(data_iv)).encryptor()
+
+    packer = msgpack.Packer()
+    with open(path, "wb") as f:
+        f.write(packer.pack_map_header(7))
+        f.write(packer.pack("ephemeral_public_key"))
+        f.write(packer.pack(ephemeral.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )))
+        f.write(packer.pack("encrypted_symmetric_key") + packer.pack(encrypted_aes_key))
+        f.write(packer.pack("encrypted_file_data") + b"\xc6" + struct.pack(">I", size))
+        remaining = size
+        while remaining:
+            block = os.urandom(min(BLOCK, remaining))
+            remaining -= len(block)
+            f.write(data_encryptor.update(block))
+        f.write(data_encryptor.finalize())
+        for key, value in (
+            ("aes_iv", aes_iv),
+            ("aes_key_tag", key_encryptor.tag),
+            ("data_iv", data_iv),
+            ("data_tag", data_encryptor.tag),
+        ):
+            f.write(packer.pack(key) + packer.pack(value))
+
+
+def legacy_decrypt(encrypted_file_path, private_key_path, output_file_path):
+    """The previous decrypt_tee_file: whole bundle and plaintext in memory."""
+    with open(private_key_path, "rb") as f:
+        private_key = serialization.load_pem_private_key(f.read(), password=None)
+    with open(encrypted_file_path, "rb") as f:
+        bundle = msgpack.unpackb(f.read())
+    ephemeral_public_key = serialization.load_pem_public_key(bundle["ephemeral_public_key"])
+    derived_key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b"ecies encryption"
+    ).derive(private_key.exchange(ec.ECDH(), ephemeral_public_key))
+    key_decryptor = Cipher(
+        algorithms.AES(derived_key), modes.GCM(bundle["aes_iv"], bundle["aes_key_tag"])
+    ).decryptor()
+    aes_key = key_decryptor.update(bundle["encrypted_symmetric_key"]) + key_decryptor.finalize()
+    data_decryptor = Cipher(
+        algorithms.AES(aes_key), modes.GCM(bundle["data_iv"], bundle["data_tag"])
+    ).decryptor()
+    plaintext = data_decryptor.update(bundle["encrypted_file_data"]) + data_decryptor.finalize()
+    with open(output_file_path, "wb") as f:
+        f.write(plaintext)
+
+
+async def legacy_retrieve(base_url, cid, dest_dir, private_key_path):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/objects/{cid}/download") as response:
+            path = os.path.join(dest_dir, f"{cid}.msgpack")
+            with open(path, "wb") as f:
+                f.write(await response.read())
+    legacy_decrypt(path, private_key_path, os.path.join(dest_dir, cid))
+    os.remove(path)
+
+
+async def streaming_retrieve(cid, dest_dir, private_key_path):
+    path = await download_object(cid, dest_dir)
+    loop = asyncio.get_running_loop()
+    ok = await loop.run_in_executor(
+        None, decrypt_tee_file, path, private_key_path, os.path.join(dest_dir, cid)
+    )
+    assert ok, "decryption failed"
+    os.remove(path)
+
+
+async def measure(label, coro_factory):
+    tracemalloc.start()
+    start = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>10}: peak={peak / 1024 ** 2:8.1f} MiB  time={elapsed:6.2f}s")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        objects_dir = os.path.join(workdir, "objects")
+        dest_dir = os.path.join(workdir, "data")
+        os.makedirs(objects_dir)
+        os.makedirs(dest_dir)
+
+        public_key, private_key_path = write_keys(workdir)
+        write_bundle(os.path.join(objects_dir, "bench"), args.size_mb * 1024 * 1024, public_key)
+
+        with StubServer(create_stub_app(objects_dir=objects_dir)) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            if not args.skip_legacy:
+                await measure("legacy", lambda: legacy_retrieve(stub.base_url, "bench", dest_dir, private_key_path))
+            await measure("streaming", lambda: streaming_retrieve("bench", dest_dir, private_key_path))
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the ~3x-payload in-memory path.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Upload throughput to the local Auto-Drive stand-in: the old single-request
+upload versus chunked uploads at several concurrency levels. The stub adds
+a per-request delay and a per-connection throughput cap to stand in for
+the WAN round trip and TCP window.
+
+    cd backend && python -m benchmarks.bench_dsn_upload --size-mb 64 --bandwidth-mbps 20
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import aiohttp
+
+from app.core.config import settings
+from app.services.http_client import close_http_clients
+from app.services.dsn import upload_path
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+async def single_request_upload(base_url: str, path: str) -> dict:
+    """The previous /upload-db flow: whole file in memory, one chunk with index 0."""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{base_url}/uploads/file", json={"filename": "bench.bin", "mimeType": "application/zip"}) as response:
+            upload_id = (await response.json())["id"]
+        with open(path, "rb") as f:
+            form_data = aiohttp.FormData()
+            form_data.add_field("file", f.read(), filename="bench.bin", content_type="application/zip")
+            form_data.add_field("index", "0")
+        async with session.post(f"{base_url}/uploads/file/{upload_id}/chunk", data=form_data) as response:
+            response.raise_for_status()
+        async with session.post(f"{base_url}/uploads/{upload_id}/complete") as response:
+            return await response.json()
+
+
+async def chunked_upload(path: str) -> dict:
+    _upload_id, completion = await upload_path(path, "bench.bin", "application/zip")
+    return completion
+
+
+async def measure(label: str, size: int, coro_factory, expected_cid: str):
+    start = time.perf_counter()
+    completion = await coro_factory()
+    elapsed = time.perf_counter() - start
+    assert completion["cid"] == expected_cid, "uploaded content does not match"
+    print(f"{label:>22}: {elapsed:6.2f}s  {size / 1024 ** 2 / elapsed:7.1f} MB/s")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "payload.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            expected_cid = hashlib.sha256(f.read()).hexdigest()
+
+        app = create_stub_app(
+            upload_latency=args.upload_latency,
+            upload_failure_rate=args.failure_rate,
+            upload_bandwidth=args.bandwidth_mbps * 1024 * 1024
+        )
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            settings.DSN_UPLOAD_STATE_DIR = os.path.join(workdir, "state")
+            settings.DSN_UPLOAD_CHUNK_SIZE = args.chunk_kb * 1024
+            if args.failure_rate == 0:
+                await measure("single request", size, lambda: single_request_upload(stub.base_url, path), expected_cid)
+            for concurrency in args.concurrency:
+                settings.DSN_UPLOAD_CONCURRENCY = concurrency
+                app["stats"]["chunk_requests"] = 0
+                await measure(
+                    f"chunked x{concurrency}", size,
+                    lambda: chunked_upload(path),
+                    expected_cid
+                )
+                print(f"{'':>22}  chunk requests: {app['stats']['chunk_requests']}")
+            shutil.rmtree(settings.DSN_UPLOAD_STATE_DIR, ignore_errors=True)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--upload-latency", type=float, default=0.05)
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="Per-connection MB/s cap, 0 = unlimited.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of chunk requests answered with 503.")
+    asyncio.run(main(parser.parse_args()))
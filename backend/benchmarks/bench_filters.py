@@ -0,0 +1,75 @@
+"""
+Latency of source-scoped versus whole-store retrieval, and of the facet
+count index versus aggregating ``db.get()`` metadata, on a synthetic store.
+
+    cd backend && python -m benchmarks.bench_filters --docs 20000 --sources 200
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from collections import Counter
+
+from app.services import rag
+from app.services.vector_store import VectorStoreManager, chroma_collection
+from app.utils.lexical_index import get_lexical_index
+from benchmarks.bench_hybrid_search import PHRASES, TOPICS, TrigramEmbeddings
+from benchmarks.bench_query_store import percentile
+
+
+async def timed_queries(label: str, queries, embeddings, config: dict):
+    latencies = []
+    for question in queries:
+        query_embedding = embeddings.embed_query(question)
+        start = time.perf_counter()
+        await rag.retrieve(question, query_embedding, config)
+        latencies.append(time.perf_counter() - start)
+    print(f"{label:>22}: p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+
+async def main(args):
+    rng = random.Random(5)
+    embeddings = TrigramEmbeddings()
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        manager = VectorStoreManager(chroma_dir, embeddings)
+        rag.get_vector_store = lambda tenant=None: manager
+        db = manager.get()
+        lexical_index = get_lexical_index(chroma_dir)
+        for start in range(0, args.docs, 1000):
+            ids = [f"chunk-{i}" for i in range(start, min(args.docs, start + 1000))]
+            texts = [
+                ". ".join(rng.choice(PHRASES).format(topic=rng.choice(TOPICS)) for _ in range(5))
+                for _ in ids
+            ]
+            metadatas = [
+                {"source": f"data/file-{rng.randrange(args.sources)}.pdf", "type": "pdf", "ingested_at": time.time()}
+                for _ in ids
+            ]
+            chroma_collection(db).upsert(
+                ids=ids, embeddings=embeddings.embed_documents(texts), documents=texts, metadatas=metadatas
+            )
+            lexical_index.upsert(ids, texts, metadatas)
+        print(f"store: {args.docs} chunks over {args.sources} sources")
+
+        queries = [f"{rng.choice(PHRASES).format(topic=rng.choice(TOPICS))}?" for _ in range(args.queries)]
+        await timed_queries("whole store", queries, embeddings, {})
+        await timed_queries("one source", queries, embeddings, {"filters": {"source": "data/file-7.pdf"}})
+
+        start = time.perf_counter()
+        scanned = Counter(metadata.get("source") for metadata in db.get(include=["metadatas"])["metadatas"])
+        scan_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        indexed = lexical_index.facets()["source"]
+        index_ms = (time.perf_counter() - start) * 1000
+        assert dict(scanned) == indexed
+        print(f"facets: db.get() scan {scan_ms:.1f}ms, count index {index_ms:.1f}ms")
+        manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--sources", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""
+Latency of TEE /generate calls with a new aiohttp session per request (the
+old query_rag behaviour) versus the shared pooled VM session. The stub
+delays the first request on every new connection to stand in for the
+TCP + TLS handshake to a remote VM.
+
+    cd backend && python -m benchmarks.bench_http_pool --requests 300 --concurrency 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+from app.core.config import settings
+from app.services.http_client import close_http_clients, get_vm_session
+from benchmarks.bench_query_store import percentile
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+PAYLOAD = {"model": "llama3.2", "prompt": "benchmark prompt", "stream": False}
+
+
+async def per_request_call() -> None:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{settings.VM_ENDPOINT}/generate", json=PAYLOAD, timeout=30) as response:
+            await response.json()
+
+
+async def pooled_call() -> None:
+    async with get_vm_session().post(f"{settings.VM_ENDPOINT}/generate", json=PAYLOAD) as response:
+        await response.json()
+
+
+async def run(label: str, call, requests: int, concurrency: int, app) -> None:
+    app["stats"]["connections"] = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>12}: p50={percentile(latencies, 50) * 1000:6.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:6.1f}ms "
+        f"mean={statistics.mean(latencies) * 1000:6.1f}ms "
+        f"throughput={requests / elapsed:6.1f} req/s "
+        f"connections={app['stats']['connections']}"
+    )
+
+
+async def main(args):
+    app = create_stub_app(generate_latency=args.generate_latency, connection_latency=args.connection_latency)
+    with StubServer(app) as stub:
+        settings.VM_ENDPOINT = stub.base_url
+        await run("per-request", per_request_call, args.requests, args.concurrency, app)
+        await run("pooled", pooled_call, args.requests, args.concurrency, app)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--generate-latency", type=float, default=0.02)
+    parser.add_argument("--connection-latency", type=float, default=0.06, help="Simulated handshake cost per new connection.")
+    asyncio.run(main(parser.parse_args()))
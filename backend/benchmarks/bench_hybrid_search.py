@@ -0,0 +1,149 @@
+"""
+Recall@k and latency of vector-only retrieval versus hybrid (vector + BM25,
+reciprocal-rank fusion) on a fixture corpus of generic marketing copy with
+a sprinkling of chunks that mention product codes and tickers.
+
+The vector side uses a local hashed character-trigram embedding so the run
+needs no API key. Like a dense model it captures topical overlap but blurs
+rare identifiers ("AX-4410" vs "AX-4401"), which is the case BM25 covers;
+absolute recall numbers are not representative of ada-002.
+
+    cd backend && python -m benchmarks.bench_hybrid_search --docs 5000 --queries 200
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.services import rag
+from app.services.vector_store import VectorStoreManager, chroma_collection
+from app.utils.lexical_index import get_lexical_index
+from benchmarks.bench_query_store import percentile
+
+TOPICS = [
+    "decentralized storage", "content marketing", "social media growth", "email campaigns",
+    "search engine optimization", "brand voice", "community building", "token economics",
+    "developer relations", "product launches", "customer retention", "data availability",
+]
+PHRASES = [
+    "teams are rethinking how they approach {topic}",
+    "a practical guide to {topic} for small teams",
+    "why {topic} matters more than ever this year",
+    "lessons learned from a year of {topic}",
+    "how to measure the impact of {topic}",
+    "common mistakes to avoid with {topic}",
+    "the future of {topic} and what comes next",
+]
+NEEDLES = [
+    "the {code} release was announced alongside {ticker} listings",
+    "early adopters of {code} reported faster onboarding",
+    "{ticker} holders get priority access to {code}",
+    "pricing for {code} starts at the community tier",
+    "the {code} integration ships with a migration guide",
+]
+TICKERS = ["$NOVA", "$QRX", "$ZEPH", "$LUMA", "$ORBT", "$KITE", "$VANT", "$HALO"]
+
+
+class TrigramEmbeddings(Embeddings):
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f"  {text.lower()}  "
+        for i in range(len(padded) - 2):
+            bucket = int.from_bytes(hashlib.md5(padded[i:i + 3].encode()).digest()[:4], "little")
+            vector[bucket % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def build_corpus(docs: int, needles: int, seed: int = 7):
+    """Return (ids, texts, queries) where queries are (question, relevant id)."""
+    rng = random.Random(seed)
+    ids, texts, queries = [], [], []
+    codes = rng.sample(range(1000, 10000), needles)
+    needle_at = set(rng.sample(range(docs), needles))
+    for i in range(docs):
+        topic = rng.choice(TOPICS)
+        sentences = [rng.choice(PHRASES).format(topic=topic) for _ in range(rng.randint(4, 8))]
+        chunk_id = f"fixture.pdf:{i // 10}:{i % 10}"
+        if i in needle_at:
+            code = f"AX-{codes[len(queries)]}"
+            ticker = rng.choice(TICKERS)
+            sentences.insert(
+                rng.randrange(len(sentences)),
+                rng.choice(NEEDLES).format(code=code, ticker=ticker)
+            )
+            queries.append((f"what do we know about {code} and {topic}?", chunk_id))
+        ids.append(chunk_id)
+        texts.append(". ".join(sentences) + ".")
+    return ids, texts, queries
+
+
+async def evaluate(mode: str, queries, embeddings: Embeddings, k: int):
+    loop = asyncio.get_running_loop()
+    hits = 0
+    latencies = []
+    for question, relevant in queries:
+        query_embedding = embeddings.embed_query(question)
+        start = time.perf_counter()
+        if mode == "vector":
+            results = await loop.run_in_executor(None, rag.vector_search, query_embedding, k)
+            found = [candidate.id for candidate in results]
+        else:
+            results = await rag.retrieve(question, query_embedding)
+            found = [doc.id for doc, _score in results]
+        latencies.append(time.perf_counter() - start)
+        hits += relevant in found
+    print(
+        f"{mode:>7}: recall@{k}={hits / len(queries):.3f} "
+        f"p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms"
+    )
+
+
+async def main(args):
+    ids, texts, queries = build_corpus(args.docs, args.queries)
+    embeddings = TrigramEmbeddings()
+    settings.RETRIEVAL_K = args.k
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        manager = VectorStoreManager(chroma_dir, embeddings)
+        rag.get_vector_store = lambda tenant=None: manager
+        collection = chroma_collection(manager.get())
+        lexical_index = get_lexical_index(chroma_dir)
+        for start in range(0, len(ids), 1000):
+            batch_ids, batch_texts = ids[start:start + 1000], texts[start:start + 1000]
+            collection.upsert(
+                ids=batch_ids,
+                embeddings=embeddings.embed_documents(batch_texts),
+                documents=batch_texts,
+                metadatas=[{"id": chunk_id} for chunk_id in batch_ids]
+            )
+            lexical_index.upsert(batch_ids, batch_texts)
+        print(f"corpus: {len(ids)} chunks, {len(queries)} identifier queries")
+
+        for mode in ("vector", "hybrid"):
+            await evaluate(mode, queries, embeddings, args.k)
+        manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""
+Ingestion throughput (chunks/sec) of a single add_documents call versus the
+batched, bounded-concurrency add_to_chroma pipeline, against the local fake
+embedding server.
+
+    cd backend && python -m benchmarks.bench_ingest --chunks 4000 --embedding-latency 0.3
+"""
+import argparse
+import tempfile
+import time
+
+from langchain.schema.document import Document
+from langchain_chroma import Chroma
+
+from app.core.config import settings
+from benchmarks.bench_query_store import make_embeddings
+from benchmarks.stub_servers import StubServer, create_stub_app
+from vdb import populate_db
+
+
+def synthetic_chunks(count: int):
+    return [
+        Document(
+            page_content=f"chunk {i} of the synthetic corpus about topic {i % 97}",
+            metadata={"source": f"data/doc_{i // 40}.pdf", "page": (i // 4) % 10}
+        )
+        for i in range(count)
+    ]
+
+
+def run_single_call(chunks, base_url):
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        db = Chroma(persist_directory=chroma_dir, embedding_function=make_embeddings(base_url))
+        chunks = populate_db.calculate_chunk_ids(chunks)
+        start = time.perf_counter()
+        db.add_documents(chunks, ids=[chunk.metadata["id"] for chunk in chunks])
+        return time.perf_counter() - start
+
+
+def run_pipeline(chunks, base_url, batch_size, concurrency):
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        settings.CHROMA_PATH = chroma_dir
+        populate_db.get_embedding_function = lambda: make_embeddings(base_url)
+        start = time.perf_counter()
+        populate_db.add_to_chroma(chunks, batch_size=batch_size, max_concurrency=concurrency)
+        return time.perf_counter() - start
+
+
+def main(args):
+    stub_app = create_stub_app(
+        embedding_latency=args.embedding_latency,
+        embedding_item_latency=args.embedding_item_latency
+    )
+    with StubServer(stub_app) as stub:
+        elapsed = run_single_call(synthetic_chunks(args.chunks), stub.base_url)
+        print(f"{'single add_documents':>28}: {args.chunks / elapsed:8.1f} chunks/sec")
+
+        for concurrency in args.concurrency:
+            elapsed = run_pipeline(
+                synthetic_chunks(args.chunks), stub.base_url, args.batch_size, concurrency
+            )
+            label = f"batch={args.batch_size} concurrency={concurrency}"
+            print(f"{label:>28}: {args.chunks / elapsed:8.1f} chunks/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--embedding-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-item-latency", type=float, default=0.01)
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+"""
+A launch-day burst on /query: many concurrent requests spread over a few
+distinct questions (with case and spacing variants), against the stub TEE
+/generate and embedding servers. Compares TEE calls, embedding calls and
+latency with single-flight coalescing off and on, then cancels half of
+the callers mid-flight to show the rest still get their answer from one
+shared run. The semantic cache is off so only in-flight coalescing counts.
+
+    cd backend && python -m benchmarks.bench_query_coalescing --requests 64 --distinct 4
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from app.core.config import settings
+from app.services import rag
+from app.services.http_client import close_http_clients
+from app.services.vector_store import VectorStoreManager
+from benchmarks.bench_query_store import make_embeddings, percentile
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+def burst(requests: int, distinct: int) -> list:
+    variants = ["{q}", "{Q}", " {q} "]
+    return [
+        variants[i % len(variants)].format(
+            q=f"what should we post about launch {i % distinct}?",
+            Q=f"What should we post about Launch {i % distinct}?"
+        )
+        for i in range(requests)
+    ]
+
+
+async def timed(query: str) -> float:
+    start = time.perf_counter()
+    await rag.query_rag(query, {"tone": "friendly"})
+    return time.perf_counter() - start
+
+
+async def run(label: str, queries, app) -> None:
+    generations, embeddings = app["stats"]["generations"], app["embedding_calls"]
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>14}: {elapsed:5.2f}s  p50={percentile(latencies, 50) * 1000:6.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:6.1f}ms  "
+        f"TEE calls={app['stats']['generations'] - generations:>3} "
+        f"embedding calls={app['embedding_calls'] - embeddings:>3}"
+    )
+
+
+async def run_with_cancellations(queries, app) -> None:
+    """Cancel every other caller: with an even number of distinct questions,
+    half the questions lose all their callers and their runs are dropped."""
+    generations = app["stats"]["generations"]
+    tasks = [asyncio.create_task(rag.query_rag(query, {"tone": "friendly"})) for query in queries]
+    await asyncio.sleep(0.05)
+    for task in tasks[::2]:
+        task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    cancelled = sum(isinstance(result, asyncio.CancelledError) for result in results)
+    answered = sum(isinstance(result, str) for result in results)
+    print(
+        f"{'cancel half':>14}: {cancelled} cancelled, {answered} answered, "
+        f"TEE calls={app['stats']['generations'] - generations} (abandoned questions never reach the TEE)"
+    )
+
+
+async def main(args):
+    stub_app = create_stub_app(
+        embedding_latency=args.embedding_latency,
+        generate_latency=args.generate_latency
+    )
+    with StubServer(stub_app) as stub, tempfile.TemporaryDirectory() as chroma_dir:
+        settings.VM_ENDPOINT = stub.base_url
+        settings.SEMANTIC_CACHE_ENABLED = False
+        store = VectorStoreManager(chroma_dir, make_embeddings(stub.base_url))
+        store.get().add_texts([f"document {i} about launch {i % 20}" for i in range(args.docs)])
+        rag.get_vector_store = lambda tenant=None: store
+        queries = burst(args.requests, args.distinct)
+
+        settings.QUERY_COALESCING_ENABLED = False
+        await run("no coalescing", queries, stub_app)
+        settings.QUERY_COALESCING_ENABLED = True
+        await run("single-flight", queries, stub_app)
+        await run_with_cancellations(queries, stub_app)
+        print(f"query_flights: {rag.query_flights.stats()}")
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=4)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--generate-latency", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
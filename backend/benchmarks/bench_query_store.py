@@ -0,0 +1,85 @@
+"""
+p50/p99 latency of query_rag with a per-request Chroma/embedding client
+versus the shared VectorStoreManager.
+
+    cd backend && python -m benchmarks.bench_query_store --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import settings
+from app.services.http_client import close_http_clients
+from app.services import rag
+from app.services.vector_store import VectorStoreManager
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+def make_embeddings(base_url: str) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(
+        api_key="sk-bench",
+        base_url=f"{base_url}/v1",
+        model="text-embedding-ada-002",
+        check_embedding_ctx_length=False
+    )
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(mode: str, requests: int, concurrency: int, base_url: str, shared: VectorStoreManager):
+    if mode == "shared":
+        rag.get_vector_store = lambda tenant=None: shared
+    else:
+        # What query_rag used to do: a new embedding client and Chroma handle per call
+        rag.get_vector_store = lambda tenant=None: VectorStoreManager(
+            settings.CHROMA_PATH, make_embeddings(base_url)
+        )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await rag.query_rag(f"benchmark question {i % 17}", {})
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    print(
+        f"{mode:>12}: n={len(latencies)} "
+        f"p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+        f"mean={statistics.mean(latencies) * 1000:.1f}ms"
+    )
+
+
+async def main(args):
+    with StubServer(create_stub_app()) as stub, tempfile.TemporaryDirectory() as chroma_dir:
+        base_url = stub.base_url
+        settings.VM_ENDPOINT = base_url
+        # Measure the uncached path; repeated questions would hit the answer cache
+        settings.SEMANTIC_CACHE_ENABLED = False
+        settings.CHROMA_PATH = chroma_dir
+        shared = VectorStoreManager(chroma_dir, make_embeddings(base_url))
+        shared.get().add_texts([f"document {i} about topic {i % 50}" for i in range(args.docs)])
+
+        for mode in ("per-request", "shared"):
+            await run(mode, args.requests, args.concurrency, base_url, shared)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--docs", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args))
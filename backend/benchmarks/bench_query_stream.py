@@ -0,0 +1,83 @@
+"""
+Time-to-first-token of the streaming /query path versus the time the
+blocking path needs to return anything, against the stub /generate server.
+
+    cd backend && python -m benchmarks.bench_query_stream --token-latency 0.02
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from app.core.config import settings
+from app.services.http_client import close_http_clients
+from app.services import rag
+from app.services.vector_store import VectorStoreManager
+from benchmarks.bench_query_store import make_embeddings, percentile
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+async def time_blocking(query: str) -> float:
+    start = time.perf_counter()
+    await rag.query_rag(query, {})
+    return time.perf_counter() - start
+
+
+async def time_streaming(query: str):
+    start = time.perf_counter()
+    first_event = first_token = None
+    async for event in rag.query_rag_stream(query, {}):
+        now = time.perf_counter() - start
+        if first_event is None:
+            first_event = now
+        if event["event"] == "token" and first_token is None:
+            first_token = now
+    return first_event, first_token, time.perf_counter() - start
+
+
+def report(label, samples):
+    print(
+        f"{label:>26}: p50={percentile(samples, 50) * 1000:.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:.1f}ms "
+        f"mean={statistics.mean(samples) * 1000:.1f}ms"
+    )
+
+
+async def main(args):
+    stub_app = create_stub_app(
+        generate_latency=args.prefill_latency,
+        token_latency=args.token_latency
+    )
+    with StubServer(stub_app) as stub, tempfile.TemporaryDirectory() as chroma_dir:
+        settings.VM_ENDPOINT = stub.base_url
+        # Measure the uncached path; repeated questions would hit the answer cache
+        settings.SEMANTIC_CACHE_ENABLED = False
+        store = VectorStoreManager(chroma_dir, make_embeddings(stub.base_url))
+        store.get().add_texts([f"document {i} about topic {i % 50}" for i in range(args.docs)])
+        rag.get_vector_store = lambda tenant=None: store
+
+        blocking, sources, tokens, totals = [], [], [], []
+        for i in range(args.requests):
+            query = f"benchmark question {i}"
+            blocking.append(await time_blocking(query))
+            first_event, first_token, total = await time_streaming(query)
+            sources.append(first_event)
+            tokens.append(first_token)
+            totals.append(total)
+
+        report("blocking: full response", blocking)
+        report("streaming: sources event", sources)
+        report("streaming: first token", tokens)
+        report("streaming: last token", totals)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--prefill-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    asyncio.run(main(args))
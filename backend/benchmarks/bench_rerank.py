@@ -0,0 +1,95 @@
+"""
+Page diversity and per-stage latency of the retrieval pipeline: the old
+top-5 by rank versus fan-out, per-page dedupe and MMR reranking. The fixture
+splits synthetic pages with the ingestion splitter (800 chars, 80 overlap),
+so neighbouring chunks of a page are near-duplicates as in a real store.
+
+    cd backend && python -m benchmarks.bench_rerank --pages 1500 --queries 100
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+
+from langchain.schema.document import Document
+
+from app.core.config import settings
+from app.services import rag
+from app.services.vector_store import VectorStoreManager, chroma_collection
+from app.utils.lexical_index import get_lexical_index
+from benchmarks.bench_hybrid_search import PHRASES, TICKERS, TOPICS, TrigramEmbeddings
+from benchmarks.bench_query_store import percentile
+from vdb.populate_db import assign_chunk_ids, split_documents
+
+MODES = {
+    "top-k": {"fanOut": 5, "maxPerPage": 0, "rerank": "none"},
+    "dedupe": {"fanOut": 20, "maxPerPage": 1, "rerank": "none"},
+    "dedupe+mmr": {"fanOut": 20, "maxPerPage": 1, "rerank": "mmr"},
+}
+
+
+def build_pages(pages: int, seed: int = 11):
+    """
+    Pages about one of ``pages // 5`` subjects; every sentence of a page
+    names its subject, so a page's chunks look alike and a query about a
+    subject matches five pages spread over different files.
+    """
+    rng = random.Random(seed)
+    subjects = [f"{rng.choice(TOPICS)} for {rng.choice(TICKERS)} project {i}" for i in range(max(1, pages // 5))]
+    documents = []
+    for page in range(pages):
+        subject = subjects[page % len(subjects)]
+        text = ". ".join(rng.choice(PHRASES).format(topic=subject) for _ in range(rng.randint(30, 50)))
+        documents.append(Document(
+            page_content=text + ".",
+            metadata={"source": f"data/fixture-{page // 20}.pdf", "page": page % 20}
+        ))
+    return subjects, list(assign_chunk_ids(split_documents(documents)))
+
+
+async def evaluate(mode: str, config: dict, queries, embeddings):
+    pages, stages = [], {}
+    for question in queries:
+        timings = {}
+        results = await rag.retrieve(question, embeddings.embed_query(question), config, timings)
+        pages.append(len({(doc.metadata["source"], doc.metadata["page"]) for doc, _score in results}))
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+    summary = " ".join(f"{stage}={percentile(samples, 50):.1f}" for stage, samples in stages.items())
+    print(f"{mode:>11}: distinct pages in top-5={statistics.mean(pages):.2f}  p50 ms: {summary}")
+
+
+async def main(args):
+    subjects, chunks = build_pages(args.pages)
+    embeddings = TrigramEmbeddings()
+    rng = random.Random(3)
+    queries = [f"what do we know about {rng.choice(subjects)}?" for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        manager = VectorStoreManager(chroma_dir, embeddings)
+        rag.get_vector_store = lambda tenant=None: manager
+        collection = chroma_collection(manager.get())
+        lexical_index = get_lexical_index(chroma_dir)
+        for start in range(0, len(chunks), 1000):
+            batch = chunks[start:start + 1000]
+            ids = [chunk.metadata["id"] for chunk in batch]
+            texts = [chunk.page_content for chunk in batch]
+            collection.upsert(
+                ids=ids,
+                embeddings=embeddings.embed_documents(texts),
+                documents=texts,
+                metadatas=[chunk.metadata for chunk in batch]
+            )
+            lexical_index.upsert(ids, texts)
+        print(f"corpus: {len(chunks)} chunks from {args.pages} pages")
+
+        for mode, config in MODES.items():
+            await evaluate(mode, {**config, "finalK": settings.RETRIEVAL_K}, queries, embeddings)
+        manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1500)
+    parser.add_argument("--queries", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
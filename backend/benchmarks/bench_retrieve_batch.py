@@ -0,0 +1,112 @@
+"""
+Onboarding-style retrieval of many CIDs against the local DSN stand-in:
+one /retrieve/{cid} call after another (each queueing its own ingestion
+job) versus a single batch with bounded concurrent download + decrypt and
+one ingestion job. The batch is then repeated once the files are local
+and indexed, and into an empty data directory (a new tenant, or a wiped
+one) served from the local object cache. Ingestion itself is not run, only
+its lexical index entries are faked; the job counts show how many runs
+each path asks for.
+
+    cd backend && python -m benchmarks.bench_retrieve_batch --cids 40 --size-kb 2048 --download-latency 0.15
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from collections import Counter
+
+from cryptography.hazmat.primitives import serialization
+
+from app.core.config import settings
+from app.services.cid_retrieval import FAILED, needs_ingest, retrieve_cid, retrieve_cids
+from app.services.http_client import close_http_clients
+from app.utils import object_cache
+from app.utils.lexical_index import get_lexical_index
+from app.utils.encryption import encrypt_stream_for_tee
+from benchmarks.bench_dsn_download import write_keys
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+def write_objects(objects_dir: str, names: dict, count: int, size: int) -> list:
+    cids = []
+    for i in range(count):
+        cid = f"bafy{i:04d}"
+        with open(os.path.join(objects_dir, cid), "wb") as out:
+            encrypt_stream_for_tee(io.BytesIO(os.urandom(size)), out, settings.PUBLIC_KEY_PATH, settings.UPLOAD_FRAME_SIZE)
+        names[cid] = f"doc-{i}.pdf.msgpack"
+        cids.append(cid)
+    return cids
+
+
+def fresh_object_cache(workdir: str, name: str) -> None:
+    settings.OBJECT_CACHE_PATH = os.path.join(workdir, name)
+    object_cache._cache = None
+
+
+async def sequential(cids, data_path: str) -> Counter:
+    """The previous flow: one request per CID, each queueing an ingestion job."""
+    sources = Counter()
+    for cid in cids:
+        result = await retrieve_cid(cid, data_path)
+        sources[result["source"]] += 1
+    sources["jobs"] = len(cids)
+    return sources
+
+
+async def batch(cids, data_path: str) -> Counter:
+    results = await retrieve_cids(cids, data_path)
+    assert all(result["status"] != FAILED for result in results), results
+    sources = Counter(result["source"] for result in results)
+    sources["jobs"] = int(any(needs_ingest(result) for result in results))
+    return sources
+
+
+async def measure(label: str, coro_factory):
+    start = time.perf_counter()
+    sources = await coro_factory()
+    jobs = sources.pop("jobs")
+    print(f"{label:>22}: {time.perf_counter() - start:6.2f}s  jobs queued: {jobs:>2}  sources: {dict(sources)}")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        objects_dir = os.path.join(workdir, "objects")
+        os.makedirs(objects_dir)
+        public_key, settings.PRIVATE_KEY_PATH = write_keys(workdir)
+        settings.PUBLIC_KEY_PATH = os.path.join(workdir, "public_key.pem")
+        with open(settings.PUBLIC_KEY_PATH, "wb") as f:
+            f.write(public_key.public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ))
+        settings.CHROMA_PATH = os.path.join(workdir, "chroma")
+
+        app = create_stub_app(objects_dir=objects_dir, download_latency=args.download_latency)
+        cids = write_objects(objects_dir, app["object_names"], args.cids, args.size_kb * 1024)
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            fresh_object_cache(workdir, "cache-sequential")
+            await measure("sequential", lambda: sequential(cids, os.path.join(workdir, "data-sequential")))
+            fresh_object_cache(workdir, "cache")
+            data_path = os.path.join(workdir, "data")
+            # Duplicates in the request are fetched once
+            await measure(f"batch x{settings.DSN_DOWNLOAD_CONCURRENCY}", lambda: batch(cids + cids[:5], data_path))
+            # Stand in for the ingestion run: one indexed chunk per CID
+            get_lexical_index().upsert(
+                [f"{cid}:0:0" for cid in cids], ["retrieved document"] * len(cids), [{"cid": cid} for cid in cids]
+            )
+            await measure("batch, files local", lambda: batch(cids, data_path))
+            await measure("batch, object cache", lambda: batch(cids, os.path.join(workdir, "data-empty")))
+            print(f"downloads from DSN: {app['stats']['downloads']} for {len(cids)} distinct CIDs, fetched 4 times")
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cids", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    parser.add_argument("--download-latency", type=float, default=0.15)
+    asyncio.run(main(parser.parse_args()))
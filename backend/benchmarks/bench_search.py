@@ -0,0 +1,94 @@
+"""
+Concurrent /search calls against local Google Custom Search and OpenAI
+stand-ins: the old google_search (blocking search request and
+LLMChain.run, new ChatOpenAI per call) versus the async path with shared
+clients, a TTL cache of raw results and single-flight coalescing. A burst
+repeats a handful of queries with case and whitespace variants, then runs
+again once the results are cached. Also reports the longest event-loop
+stall a 10ms ticker saw, which is what every concurrent /query waits out.
+
+    cd backend && python -m benchmarks.bench_search --requests 40 --distinct 8 --search-latency 0.3 --chat-latency 0.8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import requests
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.services import search
+from app.services.http_client import close_http_clients
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+async def old_google_search(query: str) -> str:
+    """The previous implementation, with the search wrapper's HTTP call inlined."""
+    items = requests.get(settings.GOOGLE_SEARCH_URL, params={
+        "key": settings.GOOGLE_API_KEY, "cx": settings.GOOGLE_CSE_ID, "q": query, "num": 10
+    }).json().get("items", [])
+    search_results = " ".join(item["snippet"] for item in items if "snippet" in item)
+    llm = ChatOpenAI(model="gpt-4o", api_key=settings.OPENAI_API_KEY, temperature=0.9)
+    prompt = PromptTemplate(template=search.SEARCH_PROMPT, input_variables=["search_results"])
+    chain = LLMChain(llm=llm, prompt=prompt)
+    return chain.run(search_results=search_results).strip()
+
+
+def burst(requests_count: int, distinct: int) -> list:
+    variants = ["{q}", "{Q}", "  {q} ", "{q}  "]
+    return [
+        variants[i % len(variants)].format(q=f"onboarding topic {i % distinct}", Q=f"Onboarding Topic {i % distinct}")
+        for i in range(requests_count)
+    ]
+
+
+async def run(label: str, google_search, queries, app) -> None:
+    app["stats"]["searches"] = app["stats"]["chat_completions"] = 0
+    stalls = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stalls.append(now - last - 0.01)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*(google_search(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    print(
+        f"{label:>16}: {elapsed:6.2f}s for {len(queries)} requests  "
+        f"searches={app['stats']['searches']:>3} summaries={app['stats']['chat_completions']:>3}  "
+        f"max loop stall {max(stalls) * 1000:7.1f}ms"
+    )
+
+
+async def main(args):
+    app = create_stub_app(search_latency=args.search_latency, chat_latency=args.chat_latency)
+    with StubServer(app) as stub:
+        settings.GOOGLE_SEARCH_URL = f"{stub.base_url}/customsearch/v1"
+        settings.OPENAI_API_KEY = "sk-stub"
+        os.environ["OPENAI_API_BASE"] = f"{stub.base_url}/v1"
+        queries = burst(args.requests, args.distinct)
+        await run("old", old_google_search, queries, app)
+        await run("async", search.google_search, queries, app)
+        await run("async, cached", search.google_search, queries, app)
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--distinct", type=int, default=8)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--chat-latency", type=float, default=0.8)
+    asyncio.run(main(parser.parse_args()))
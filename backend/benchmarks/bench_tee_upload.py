@@ -0,0 +1,124 @@
+"""
+/upload's encrypt + upload step against the local DSN stand-in: the old
+path (read the whole upload, encrypt on the event loop into a single-frame
+bundle, upload from memory) versus streaming frame-by-frame encryption in
+a worker thread into the chunked uploader, and versus the resumable default
+(UPLOAD_RESUMABLE) that spools the bundle to disk first. Reports wall time, peak Python
+heap (tracemalloc) and the longest event-loop stall seen by a 10ms ticker,
+then decrypts each stored bundle and checks it matches the source.
+
+    cd backend && python -m benchmarks.bench_tee_upload --size-mb 200
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.core.config import settings
+from app.services.dsn import upload_bytes
+from app.services.http_client import close_http_clients
+from app.services.uploads import upload_encrypted
+from app.utils.encryption import encrypt_file_for_tee
+from app.utils.tee_decryption import decrypt_tee_file
+from benchmarks.bench_dsn_download import BLOCK, write_keys
+from benchmarks.stub_servers import StubServer, create_stub_app
+from cryptography.hazmat.primitives import serialization
+
+
+async def old_upload(path: str) -> dict:
+    """The previous /upload: whole file in memory, encrypted on the event loop."""
+    with open(path, "rb") as f:
+        file_data = f.read()
+    bundle = encrypt_file_for_tee(file_data, settings.PUBLIC_KEY_PATH)
+    _upload_id, completion = await upload_bytes(bundle, "bench.bin.msgpack", "application/octet-stream")
+    return completion
+
+
+async def streaming_upload(path: str) -> dict:
+    settings.UPLOAD_RESUMABLE = False
+    with open(path, "rb") as f:
+        _upload_id, completion = await upload_encrypted(f, "bench.bin.msgpack")
+    return completion
+
+
+async def resumable_upload(path: str) -> dict:
+    settings.UPLOAD_RESUMABLE = True
+    with open(path, "rb") as f:
+        _upload_id, completion = await upload_encrypted(f, "bench.bin.msgpack")
+    return completion
+
+
+async def measure(label: str, size: int, coro_factory):
+    stalls = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stalls.append(now - last - 0.01)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    tracemalloc.start()
+    start = time.perf_counter()
+    completion = await coro_factory()
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    await tick
+    print(
+        f"{label:>10}: {elapsed:6.2f}s  {size / 1024 ** 2 / elapsed:6.1f} MB/s  "
+        f"peak heap {peak / 1024 ** 2:7.1f}MB  max loop stall {max(stalls) * 1000:7.1f}ms"
+    )
+    return completion
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        objects_dir = os.path.join(workdir, "objects")
+        os.makedirs(objects_dir)
+        public_key, private_key_path = write_keys(workdir)
+        settings.PUBLIC_KEY_PATH = os.path.join(workdir, "public_key.pem")
+        with open(settings.PUBLIC_KEY_PATH, "wb") as f:
+            f.write(public_key.public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ))
+
+        path = os.path.join(workdir, "payload.bin")
+        digest = hashlib.sha256()
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                block = os.urandom(BLOCK)
+                digest.update(block)
+                f.write(block)
+        size = os.path.getsize(path)
+
+        app = create_stub_app(objects_dir=objects_dir, upload_latency=args.upload_latency)
+        with StubServer(app) as stub:
+            settings.DSN_BASE_URL = stub.base_url
+            settings.DSN_UPLOAD_STATE_DIR = os.path.join(workdir, "state")
+            for label, factory in (("old", old_upload), ("streaming", streaming_upload), ("resumable", resumable_upload)):
+                completion = await measure(label, size, lambda: factory(path))
+                output_path = os.path.join(workdir, f"{label}.out")
+                assert decrypt_tee_file(os.path.join(objects_dir, completion["cid"]), private_key_path, output_path)
+                with open(output_path, "rb") as f:
+                    restored = hashlib.file_digest(f, "sha256")
+                assert restored.digest() == digest.digest(), f"{label}: decrypted payload does not match"
+                os.remove(output_path)
+        await close_http_clients()
+        print("every bundle decrypts to the original payload")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--upload-latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,114 @@
+"""
+Per-tenant shards versus one shared store: query latency for a single
+tenant, how many of its top-k results belong to other tenants when
+everything shares a collection, and resident memory after touching every
+tenant with and without LRU eviction of store handles (process RSS is
+noisy because freed pages go back to the allocator, so the chromadb
+systems still cached, each holding an HNSW index, are reported too).
+
+    cd backend && python -m benchmarks.bench_tenants --tenants 10 --docs 2000 --max-open 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from chromadb.api.client import SharedSystemClient
+
+from app.core.config import settings
+from app.services import rag
+from app.services import vector_store
+from app.services.vector_store import TenantStores, VectorStoreManager, chroma_collection
+from app.utils.lexical_index import get_lexical_index
+from benchmarks.bench_hybrid_search import PHRASES, TOPICS, TrigramEmbeddings
+from benchmarks.bench_query_store import percentile
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def fill(manager: VectorStoreManager, embeddings, tenant: str, docs: int, rng: random.Random):
+    collection = chroma_collection(manager.get())
+    lexical_index = get_lexical_index(manager.persist_directory)
+    for start in range(0, docs, 1000):
+        ids = [f"{tenant}:{i}" for i in range(start, min(docs, start + 1000))]
+        texts = [
+            ". ".join(rng.choice(PHRASES).format(topic=rng.choice(TOPICS)) for _ in range(5))
+            for _ in ids
+        ]
+        metadatas = [{"source": f"data/{tenant}.pdf", "type": "pdf"} for _ in ids]
+        collection.upsert(ids=ids, embeddings=embeddings.embed_documents(texts), documents=texts, metadatas=metadatas)
+        lexical_index.upsert(ids, texts, metadatas)
+
+
+async def timed_queries(label: str, manager: VectorStoreManager, tenant: str, queries, embeddings):
+    rag.get_vector_store = lambda _tenant=None: manager
+    latencies, foreign, total = [], 0, 0
+    for question in queries:
+        query_embedding = embeddings.embed_query(question)
+        start = time.perf_counter()
+        results = await rag.retrieve(question, query_embedding)
+        latencies.append(time.perf_counter() - start)
+        foreign += sum(not doc.id.startswith(f"{tenant}:") for doc, _score in results)
+        total += len(results)
+    print(
+        f"{label:>14}: p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+        f"other tenants' chunks in top-k={foreign / max(total, 1):.0%}"
+    )
+
+
+def touch_all(tenants, max_open: int, query_embedding):
+    stores = TenantStores(max_open)
+    before = rss_mb()
+    for tenant in tenants:
+        # A query loads the shard's HNSW index, a count() would not
+        chroma_collection(stores.get(tenant).get()).query(query_embeddings=[query_embedding], n_results=1)
+    grown = rss_mb() - before
+    print(
+        f"max_open={max_open:>3}: {len(stores.stats()['open'])} handles open, "
+        f"{len(SharedSystemClient._identifier_to_system)} chromadb systems cached, RSS +{grown:.0f}MB"
+    )
+    stores.close()
+
+
+async def main(args):
+    rng = random.Random(11)
+    embeddings = TrigramEmbeddings()
+    vector_store.get_embedding_function = lambda: embeddings
+    tenants = [f"tenant-{i}" for i in range(args.tenants)]
+    with tempfile.TemporaryDirectory() as root:
+        settings.TENANTS_PATH = os.path.join(root, "tenants")
+        shared = VectorStoreManager(os.path.join(root, "shared"), embeddings)
+        for tenant in tenants:
+            fill(shared, embeddings, tenant, args.docs, rng)
+            shard = VectorStoreManager(vector_store.tenant_paths(tenant)[0], embeddings)
+            fill(shard, embeddings, tenant, args.docs, rng)
+            shard.close()
+        print(f"{args.tenants} tenants x {args.docs} chunks")
+
+        queries = [f"{rng.choice(PHRASES).format(topic=rng.choice(TOPICS))}?" for _ in range(args.queries)]
+        shard = VectorStoreManager(vector_store.tenant_paths(tenants[0])[0], embeddings)
+        await timed_queries("shared store", shared, tenants[0], queries, embeddings)
+        await timed_queries("tenant shard", shard, tenants[0], queries, embeddings)
+        for manager in (shard, shared):
+            manager.close()
+
+        # Closed handles return their pages to the allocator rather than the
+        # OS, so measure the bounded case first
+        query_embedding = embeddings.embed_query(queries[0])
+        touch_all(tenants, args.max_open, query_embedding)
+        touch_all(tenants, len(tenants), query_embedding)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--max-open", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
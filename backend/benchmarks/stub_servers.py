@@ -0,0 +1,335 @@
+"""
+Local stand-ins for the external services the backend talks to (OpenAI
+embeddings and chat, the TEE /generate endpoint, Google Custom Search and
+Auto-Drive), so the benchmarks
+can run without credentials, the TEE VM or network access.
+
+    python -m benchmarks.stub_servers --port 9000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_DIM = 1536
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    """Deterministic pseudo-embedding so identical text maps to identical vectors."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    return (np.random.default_rng(seed).random(dim, dtype=np.float32) - 0.5).tolist()
+
+
+async def embeddings_handler(request: web.Request) -> web.Response:
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    # Fixed per-request overhead plus a per-input cost, so large batches
+    # are not unrealistically cheap
+    latency = request.app["embedding_latency"] + request.app["embedding_item_latency"] * len(inputs)
+    if latency:
+        await asyncio.sleep(latency)
+
+    data = [
+        {"object": "embedding", "index": i, "embedding": fake_embedding(str(item))}
+        for i, item in enumerate(inputs)
+    ]
+    request.app["embedding_calls"] += 1
+    return web.json_response({
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    })
+
+
+async def chat_completions_handler(request: web.Request) -> web.Response:
+    """OpenAI ``/v1/chat/completions`` (non-streaming): a canned summary after ``chat_latency``."""
+    body = await request.json()
+    request.app["stats"]["chat_completions"] += 1
+    if request.app["chat_latency"]:
+        await asyncio.sleep(request.app["chat_latency"])
+    prompt = body["messages"][-1]["content"]
+    return web.json_response({
+        "id": uuid.uuid4().hex,
+        "object": "chat.completion",
+        "created": 0,
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": f"Summary of {len(prompt)} characters of results."},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    })
+
+
+async def custom_search_handler(request: web.Request) -> web.Response:
+    """Google ``/customsearch/v1``: ``num`` fabricated results after ``search_latency``."""
+    request.app["stats"]["searches"] += 1
+    if request.app["search_latency"]:
+        await asyncio.sleep(request.app["search_latency"])
+    query = request.query["q"]
+    items = [
+        {"title": f"{query} #{i}", "link": f"https://example.com/{i}", "snippet": f"Result {i} about {query}."}
+        for i in range(int(request.query.get("num", 10)))
+    ]
+    return web.json_response({"items": items})
+
+
+async def generate_handler(request: web.Request) -> web.StreamResponse:
+    """
+    Echo the prompt back as the "generated" answer. ``generate_latency`` is
+    the prefill delay before the first token and ``token_latency`` the delay
+    between tokens; with ``"stream": true`` tokens are sent as NDJSON lines.
+    """
+    body = await request.json()
+    request.app["stats"]["generations"] += 1
+    words = body.get("prompt", "").split()[: body.get("max_tokens", 200)]
+    token_latency = request.app["token_latency"]
+
+    latency = request.app["generate_latency"]
+    if latency:
+        await asyncio.sleep(latency)
+
+    if not body.get("stream"):
+        await asyncio.sleep(token_latency * len(words))
+        return web.json_response({"response": " ".join(words)})
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    for i, word in enumerate(words):
+        token = word if i == 0 else f" {word}"
+        await response.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+        if token_latency:
+            await asyncio.sleep(token_latency)
+    await response.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+    await response.write_eof()
+    return response
+
+
+async def download_handler(request: web.Request) -> web.StreamResponse:
+    """
+    Auto-Drive ``/objects/{cid}/download``: serve ``<objects_dir>/<cid>`` as a
+    stream after ``download_latency`` (the gateway's time to first byte).
+    """
+    cid = request.match_info["cid"]
+    path = os.path.join(request.app["objects_dir"] or "", cid)
+    if not request.app["objects_dir"] or not os.path.exists(path):
+        return web.json_response({"error": "not found"}, status=404)
+    filename = request.app["object_names"].get(cid, f"{cid}.msgpack")
+    request.app["stats"]["downloads"] += 1
+    if request.app["download_latency"]:
+        await asyncio.sleep(request.app["download_latency"])
+    return web.FileResponse(path, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+async def create_upload_handler(request: web.Request) -> web.Response:
+    """Auto-Drive ``POST /uploads/file``."""
+    body = await request.json()
+    upload_id = uuid.uuid4().hex
+    # Chunks are spooled to disk so the stub doesn't skew heap measurements
+    # of a client running in the same process
+    request.app["uploads"][upload_id] = {
+        "filename": body["filename"],
+        "spool": tempfile.mkdtemp(prefix="stub_upload_"),
+        "chunks": set()
+    }
+    return web.json_response({"id": upload_id})
+
+
+async def upload_chunk_handler(request: web.Request) -> web.Response:
+    """
+    Auto-Drive ``POST /uploads/file/{id}/chunk`` (multipart ``file`` + ``index``).
+    ``upload_latency`` models the per-request round trip and ``upload_bandwidth``
+    (bytes/s, 0 = unlimited) a single connection's throughput cap;
+    ``upload_failure_rate`` answers a fraction of chunks with 503 to exercise
+    client retries.
+    """
+    upload = request.app["uploads"].get(request.match_info["upload_id"])
+    if upload is None:
+        return web.json_response({"error": "unknown upload"}, status=404)
+    form = await request.post()
+    data = form["file"].file.read()
+    delay = request.app["upload_latency"]
+    if request.app["upload_bandwidth"]:
+        delay += len(data) / request.app["upload_bandwidth"]
+    await asyncio.sleep(delay)
+    request.app["stats"]["chunk_requests"] += 1
+    if random.random() < request.app["upload_failure_rate"]:
+        return web.json_response({"error": "try again"}, status=503)
+    index = int(form["index"])
+    with open(os.path.join(upload["spool"], str(index)), "wb") as f:
+        f.write(data)
+    upload["chunks"].add(index)
+    return web.json_response({"status": "ok"})
+
+
+async def complete_upload_handler(request: web.Request) -> web.Response:
+    """Auto-Drive ``POST /uploads/{id}/complete``: join chunks in index order, return a content CID."""
+    upload = request.app["uploads"].pop(request.match_info["upload_id"], None)
+    if upload is None:
+        return web.json_response({"error": "unknown upload"}, status=404)
+    try:
+        chunks = upload["chunks"]
+        if sorted(chunks) != list(range(len(chunks))):
+            return web.json_response({"error": "missing chunks"}, status=400)
+        digest, size = hashlib.sha256(), 0
+        joined_path = os.path.join(upload["spool"], "joined")
+        with open(joined_path, "wb") as out:
+            for index in range(len(chunks)):
+                with open(os.path.join(upload["spool"], str(index)), "rb") as f:
+                    data = f.read()
+                digest.update(data)
+                size += len(data)
+                out.write(data)
+        cid = digest.hexdigest()
+        if request.app["objects_dir"]:
+            shutil.move(joined_path, os.path.join(request.app["objects_dir"], cid))
+            request.app["object_names"][cid] = upload["filename"]
+        return web.json_response({"cid": cid, "size": size})
+    finally:
+        shutil.rmtree(upload["spool"], ignore_errors=True)
+
+
+@web.middleware
+async def connection_latency_middleware(request: web.Request, handler):
+    """
+    Delay the first request on each new connection by ``connection_latency``,
+    standing in for the TCP + TLS handshake round trips to a remote host.
+    Requests on a reused keep-alive connection are not delayed.
+    """
+    seen = request.app["seen_connections"]
+    if request.transport not in seen:
+        seen.add(request.transport)
+        request.app["stats"]["connections"] += 1
+        await asyncio.sleep(request.app["connection_latency"])
+    return await handler(request)
+
+
+def create_stub_app(
+    embedding_latency: float = 0.0,
+    generate_latency: float = 0.0,
+    token_latency: float = 0.0,
+    embedding_item_latency: float = 0.0,
+    objects_dir: str = None,
+    upload_latency: float = 0.0,
+    upload_failure_rate: float = 0.0,
+    upload_bandwidth: float = 0.0,
+    connection_latency: float = 0.0,
+    download_latency: float = 0.0,
+    chat_latency: float = 0.0,
+    search_latency: float = 0.0
+) -> web.Application:
+    app = web.Application(client_max_size=1024 ** 3, middlewares=[connection_latency_middleware])
+    app["embedding_latency"] = embedding_latency
+    app["embedding_item_latency"] = embedding_item_latency
+    app["generate_latency"] = generate_latency
+    app["token_latency"] = token_latency
+    app["embedding_calls"] = 0
+    app["objects_dir"] = objects_dir
+    app["object_names"] = {}
+    app["uploads"] = {}
+    app["upload_latency"] = upload_latency
+    app["upload_failure_rate"] = upload_failure_rate
+    app["upload_bandwidth"] = upload_bandwidth
+    app["connection_latency"] = connection_latency
+    app["download_latency"] = download_latency
+    app["chat_latency"] = chat_latency
+    app["search_latency"] = search_latency
+    app["seen_connections"] = weakref.WeakSet()
+    app["stats"] = {"chunk_requests": 0, "connections": 0, "downloads": 0, "chat_completions": 0, "searches": 0, "generations": 0}
+    app.router.add_post("/v1/embeddings", embeddings_handler)
+    app.router.add_post("/v1/chat/completions", chat_completions_handler)
+    app.router.add_get("/customsearch/v1", custom_search_handler)
+    app.router.add_post("/generate", generate_handler)
+    app.router.add_get("/objects/{cid}/download", download_handler)
+    app.router.add_post("/uploads/file", create_upload_handler)
+    app.router.add_post("/uploads/file/{upload_id}/chunk", upload_chunk_handler)
+    app.router.add_post("/uploads/{upload_id}/complete", complete_upload_handler)
+    return app
+
+
+class StubServer:
+    """
+    Runs an aiohttp app on its own thread and event loop. The backend makes
+    blocking calls (Chroma -> OpenAIEmbeddings) from async code, so the stub
+    must not share the caller's loop.
+    """
+
+    def __init__(self, app: web.Application, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.base_url = None
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{self.host}:{bound_port}"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-item-latency", type=float, default=0.0)
+    parser.add_argument("--objects-dir", default=None, help="Directory served as DSN objects, one file per CID.")
+    parser.add_argument("--generate-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--upload-latency", type=float, default=0.0)
+    parser.add_argument("--upload-failure-rate", type=float, default=0.0)
+    parser.add_argument("--upload-bandwidth", type=float, default=0.0, help="Per-request bytes/s cap, 0 = unlimited.")
+    parser.add_argument("--connection-latency", type=float, default=0.0, help="Extra delay on each new connection.")
+    args = parser.parse_args()
+    web.run_app(
+        create_stub_app(
+            args.embedding_latency,
+            args.generate_latency,
+            args.token_latency,
+            args.embedding_item_latency,
+            args.objects_dir,
+            args.upload_latency,
+            args.upload_failure_rate,
+            args.upload_bandwidth,
+            args.connection_latency
+        ),
+        host=args.host,
+        port=args.port
+    )
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# app.services.search refuses to import without Google credentials
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("GOOGLE_CSE_ID", "test-cse")
+
+from app.core.config import settings  # noqa: E402
+from benchmarks.stub_servers import StubServer, create_stub_app  # noqa: E402
+
+
+@pytest.fixture
+def stub_dsn(tmp_path, monkeypatch):
+    """Local Auto-Drive stand-in; uploaded objects land in its ``objects_dir``."""
+    objects_dir = tmp_path / "objects"
+    objects_dir.mkdir()
+    app = create_stub_app(objects_dir=str(objects_dir))
+    with StubServer(app) as stub:
+        monkeypatch.setattr(settings, "DSN_BASE_URL", stub.base_url)
+        monkeypatch.setattr(settings, "DSN_UPLOAD_STATE_DIR", str(tmp_path / "state"))
+        monkeypatch.setattr(settings, "DSN_UPLOAD_CHUNK_SIZE", 1024)
+        yield app
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import zipfile
+
+import aiohttp
+import pytest
+
+from app.core.config import settings
+from app.services import backup
+from app.services.backup import BlockIndex, _staged_path, backup_database_incremental, restore_backup
+
+BLOCK_SIZE = 1024
+
+
+@pytest.fixture
+def store(stub_dsn, tmp_path, monkeypatch):
+    """A store directory of plain files, backed up in 1 KiB blocks to the DSN stand-in."""
+    chroma_path = tmp_path / "chroma"
+    (chroma_path / "segment").mkdir(parents=True)
+    (chroma_path / "segment" / "data_level0.bin").write_bytes(os.urandom(3 * BLOCK_SIZE))
+    # Two identical blocks are stored once
+    (chroma_path / "header.bin").write_bytes(b"h" * BLOCK_SIZE * 2 + b"tail")
+    monkeypatch.setattr(settings, "CHROMA_PATH", str(chroma_path))
+    monkeypatch.setattr(settings, "DB_BACKUP_STATE_PATH", str(tmp_path / "backup_state.json"))
+    monkeypatch.setattr(settings, "DB_BACKUP_BLOCK_SIZE", BLOCK_SIZE)
+    return chroma_path
+
+
+def run(coro_factory):
+    async def scenario():
+        async with aiohttp.ClientSession() as session:
+            return await coro_factory(session)
+    return asyncio.run(scenario())
+
+
+def read_tree(directory) -> dict:
+    tree = {}
+    for path, arcname in backup.snapshot_files(str(directory)):
+        with open(path, "rb") as f:
+            tree[arcname] = f.read()
+    return tree
+
+
+def test_second_backup_reuses_unchanged_blocks(store, stub_dsn):
+    _upload_id, first, stats = run(backup_database_incremental)
+    assert stats == {"files": 2, "blocks_total": 6, "blocks_uploaded": 5, "bytes_changed": 4 * BLOCK_SIZE + 4}
+    with open(os.path.join(stub_dsn["objects_dir"], first["cid"])) as f:
+        manifest = json.load(f)
+    assert [entry["path"] for entry in manifest["files"]] == ["header.bin", os.path.join("segment", "data_level0.bin")]
+    assert BlockIndex.load(settings.DB_BACKUP_STATE_PATH).blocks == manifest["blocks"]
+
+    # Rewrite one block in place
+    with open(store / "segment" / "data_level0.bin", "r+b") as f:
+        f.seek(BLOCK_SIZE)
+        f.write(os.urandom(BLOCK_SIZE))
+    _upload_id, second, stats = run(backup_database_incremental)
+    assert (stats["blocks_total"], stats["blocks_uploaded"], stats["bytes_changed"]) == (6, 1, BLOCK_SIZE)
+    assert second["cid"] != first["cid"]
+
+
+def test_manifest_backup_round_trips(store, tmp_path):
+    original = read_tree(store)
+    _upload_id, completion, _stats = run(backup_database_incremental)
+    (store / "header.bin").write_bytes(b"changed after the backup")
+    (store / "extra.bin").write_bytes(b"not in the backup")
+    os.remove(settings.DB_BACKUP_STATE_PATH)
+
+    result = run(lambda session: restore_backup(completion["cid"], session))
+    assert result == {"format": "manifest", "files": 2, "blocks_downloaded": 5}
+    assert read_tree(store) == original
+    # The block index now points at the restored blocks, so the next backup sends nothing
+    _upload_id, _completion, stats = run(backup_database_incremental)
+    assert stats["blocks_uploaded"] == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".chroma_")]
+
+
+def test_staged_path_rejects_entries_outside_the_store(tmp_path):
+    staging_dir = str(tmp_path / "staging")
+    assert _staged_path(staging_dir, "segment/data.bin") == os.path.join(staging_dir, "segment", "data.bin")
+    for arcname in ("../outside", "segment/../../outside", "/etc/passwd", ".."):
+        with pytest.raises(ValueError):
+            _staged_path(staging_dir, arcname)
+
+
+def test_manifest_with_an_escaping_path_leaves_the_store_alone(store, stub_dsn, tmp_path):
+    original = read_tree(store)
+    manifest = {
+        "version": backup.MANIFEST_VERSION, "block_size": BLOCK_SIZE, "compression": "zlib",
+        "files": [{"path": "../evil.bin", "size": 4, "blocks": []}], "blocks": {},
+    }
+    (tmp_path / "objects" / "evilmanifest").write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        run(lambda session: restore_backup("evilmanifest", session))
+    assert read_tree(store) == original
+    assert not os.path.exists(tmp_path / "evil.bin")
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".chroma_")]
+
+
+def trickle(monkeypatch, objects_dir):
+    """Serve objects a few bytes at a time, as a slow gateway might."""
+    async def iter_object(cid, session=None):
+        with open(os.path.join(objects_dir, cid), "rb") as f:
+            data = f.read()
+        for size in (1, 2, 3):
+            yield data[:size]
+            data = data[size:]
+        yield data
+
+    monkeypatch.setattr(backup, "iter_object", iter_object)
+
+
+def test_zip_backup_is_recognised_when_its_signature_is_split(store, stub_dsn, tmp_path, monkeypatch):
+    original = read_tree(store)
+    with zipfile.ZipFile(tmp_path / "objects" / "zipbackup", "w") as archive:
+        for path, arcname in backup.snapshot_files(str(store)):
+            archive.write(path, arcname)
+    (store / "header.bin").write_bytes(b"changed after the backup")
+
+    trickle(monkeypatch, stub_dsn["objects_dir"])
+    result = asyncio.run(restore_backup("zipbackup"))
+    assert result == {"format": "zip", "files": 2}
+    assert read_tree(store) == original
+
+
+def test_manifest_is_recognised_when_served_in_small_chunks(store, stub_dsn, monkeypatch):
+    _upload_id, completion, _stats = run(backup_database_incremental)
+    trickle(monkeypatch, stub_dsn["objects_dir"])
+    result = run(lambda session: restore_backup(completion["cid"], session))
+    assert result["format"] == "manifest"
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import shutil
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes import query
+from app.api.routes.query import RetrieveBatchRequest, retrieve_file, retrieve_files
+from app.services import cid_retrieval
+from app.services.dsn import DSNError
+from app.utils.lexical_index import get_lexical_index
+from app.utils.object_cache import ObjectCache
+
+
+class FakeQueue:
+    def __init__(self):
+        self.reasons = []
+
+    def enqueue(self, reason):
+        self.reasons.append(reason)
+        return {"id": f"job-{len(self.reasons)}"}
+
+
+@pytest.fixture
+def dsn(tmp_path, monkeypatch):
+    """DSN downloads and decryption stand-ins; records the CIDs fetched."""
+    downloads = []
+    queue = FakeQueue()
+    paths = (str(tmp_path / "chroma"), str(tmp_path / "data"))
+
+    async def download_object(cid, dest_dir, session=None):
+        downloads.append(cid)
+        if cid == "gone":
+            raise DSNError(404, "Object not found")
+        path = os.path.join(dest_dir, f"{cid}.pdf.msgpack")
+        with open(path, "w") as f:
+            f.write(f"contents of {cid}")
+        return path
+
+    def decrypt_tee_file(encrypted_file_path, private_key_path, output_file_path):
+        shutil.copyfile(encrypted_file_path, output_file_path)
+        return True
+
+    async def get_ingest_queue(tenant=None):
+        return queue
+
+    cache = ObjectCache(str(tmp_path / "objects"), 1024 * 1024)
+    monkeypatch.setattr(cid_retrieval, "download_object", download_object)
+    monkeypatch.setattr(cid_retrieval, "decrypt_tee_file", decrypt_tee_file)
+    monkeypatch.setattr(cid_retrieval, "get_object_cache", lambda: cache)
+    monkeypatch.setattr(cid_retrieval, "get_dsn_session", lambda: None)
+    monkeypatch.setattr(query, "tenant_paths", lambda tenant: paths)
+    monkeypatch.setattr(query, "get_ingest_queue", get_ingest_queue)
+    yield downloads, queue, paths
+
+
+def test_batch_dedupes_reports_each_cid_and_queues_one_ingest(dsn):
+    downloads, queue, (_chroma_path, data_path) = dsn
+    response = asyncio.run(retrieve_files(
+        RetrieveBatchRequest(cids=["abc", "abc", "../etc", "def", "gone"]), tenant="default"
+    ))
+
+    results = {result["cid"]: result for result in response["results"]}
+    assert [result["cid"] for result in response["results"]] == ["abc", "../etc", "def", "gone"]
+    assert results["abc"]["status"] == results["def"]["status"] == "retrieved"
+    assert results["../etc"] == {"cid": "../etc", "status": "failed", "error": "Invalid CID: '../etc'", "http_status": 400}
+    assert results["gone"]["dsn_status"] == 404
+    assert (response["retrieved"], response["present"], response["failed"]) == (2, 0, 2)
+    # Each valid CID is downloaded once; the malformed one never reaches DSN
+    assert sorted(downloads) == ["abc", "def", "gone"]
+    assert sorted(os.listdir(data_path)) == ["abc.pdf", "cid_index.json", "def.pdf"]
+    assert queue.reasons == ["retrieve-batch:2"]
+    assert response["job_id"] == "job-1"
+
+
+def test_present_cids_only_queue_an_ingest_when_unindexed(dsn):
+    downloads, queue, (chroma_path, _data_path) = dsn
+    asyncio.run(retrieve_files(RetrieveBatchRequest(cids=["abc", "def"]), tenant="default"))
+    get_lexical_index(chroma_path).upsert(["abc.pdf:0:0"], ["indexed"], [{"cid": "abc"}])
+
+    response = asyncio.run(retrieve_files(RetrieveBatchRequest(cids=["abc", "def"]), tenant="default"))
+    assert [result["status"] for result in response["results"]] == ["present", "present"]
+    assert [result["chunks"] for result in response["results"]] == [1, 0]
+    assert downloads == ["abc", "def"]
+    assert queue.reasons == ["retrieve-batch:2", "retrieve-batch:1"]
+
+    response = asyncio.run(retrieve_files(RetrieveBatchRequest(cids=["abc"]), tenant="default"))
+    assert response["job_id"] is None
+    assert len(queue.reasons) == 2
+
+
+def test_single_retrieve_rejects_a_malformed_cid(dsn):
+    downloads, queue, _paths = dsn
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(retrieve_file("abc%2F..", tenant="default"))
+    assert excinfo.value.status_code == 400
+    assert downloads == [] and queue.reasons == []
@@ -0,0 +1,112 @@
+import sys
+
+import pytest
+from langchain.schema.document import Document
+
+from app.core.config import settings
+from app.services.rag import CONTEXT_SEPARATOR, pack_context, strip_overlap
+from app.utils import tokens
+from app.utils.tokens import count_tokens, estimate_tokens, get_token_counter, truncate_to_tokens
+from vdb.populate_db import calculate_chunk_ids, split_documents
+
+WORDS = "rover battery thermal limit terrain camera sample drill orbit relay".split()
+
+
+def page_text(words: int, seed: int = 0) -> str:
+    # Sentences of varying length so the splitter cuts at different places
+    sentences, i = [], seed
+    while words > 0:
+        length = min(words, 5 + i % 7)
+        sentences.append(" ".join(WORDS[(i + j) % len(WORDS)] + str(i) for j in range(length)) + ".")
+        words -= length
+        i += 1
+    return " ".join(sentences)
+
+
+def split_page(source: str, page: int, text: str):
+    return calculate_chunk_ids(split_documents([Document(page_content=text, metadata={"source": source, "page": page})]))
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Count with the local estimate so budgets don't depend on a tiktoken download."""
+    monkeypatch.setattr(tokens, "get_token_counter", lambda: estimate_tokens)
+
+
+def context_of(prompt: str) -> str:
+    return prompt.split("following context:\n\n", 1)[1].split("\n\n---\n\nAnswer the question", 1)[0]
+
+
+@pytest.mark.parametrize("budget", [128, 300, 1024, 4096])
+def test_packed_prompt_never_exceeds_the_budget(budget):
+    results = [(chunk, 1.0 - i / 100) for i, chunk in enumerate(
+        split_page("a.pdf", 0, page_text(600)) + split_page("b.pdf", 3, page_text(400, seed=3))
+    )]
+    prompt, packed, usage = pack_context("what limits the rover?", results, budget)
+    assert count_tokens(prompt) == usage["prompt_tokens"] <= budget
+    assert usage["chunks"] == len(packed) and usage["chunks_dropped"] == len(results) - len(packed)
+    assert packed
+
+
+def test_splitter_overlap_between_adjacent_chunks_is_removed():
+    text = page_text(400)
+    chunks = split_page("a.pdf", 0, text)
+    assert len(chunks) > 2
+    # The splitter repeats up to 80 characters at the start of each chunk
+    assert chunks[1].page_content[:20] in chunks[0].page_content
+
+    # Packed out of order, as reranking would leave them
+    results = [(chunk, 1.0) for chunk in [chunks[1], chunks[0]] + chunks[2:]]
+    prompt, packed, usage = pack_context("q", results, 8192)
+    assert len(packed) == len(chunks)
+    assert usage["chars_trimmed"] > 0
+    texts = dict(zip((doc.metadata["id"] for doc, _ in packed), context_of(prompt).split(CONTEXT_SEPARATOR)))
+    assert " ".join(texts[chunk.metadata["id"]] for chunk in chunks) == text
+
+
+def test_strip_overlap_leaves_unrelated_text_alone():
+    previous = "alpha beta gamma delta epsilon zeta eta theta"
+    assert strip_overlap("epsilon zeta eta theta iota kappa", previous) == "iota kappa"
+    # Shared text shorter than MIN_OVERLAP_CHARS is a coincidence, not overlap
+    assert strip_overlap("theta iota kappa", previous) == "theta iota kappa"
+    assert strip_overlap("one two three four five six", following="three four five six seven") == "one two"
+
+
+def test_oversized_chunk_is_truncated_rather_than_dropped():
+    big = Document(page_content=page_text(2000), metadata={"source": "big.pdf", "page": 0})
+    prompt, packed, usage = pack_context("q", [(big, 1.0)], 512)
+    assert packed == [(big, 1.0)]
+    assert usage["prompt_tokens"] <= 512
+    context = context_of(prompt)
+    assert context and big.page_content.startswith(context)
+    assert usage["chars_trimmed"] == len(big.page_content) - len(context)
+
+
+def test_chunk_is_skipped_when_too_little_room_is_left_to_truncate():
+    first = Document(page_content=page_text(300), metadata={"source": "a.pdf", "page": 0})
+    second = Document(page_content=page_text(2000, seed=5), metadata={"source": "b.pdf", "page": 0})
+    overhead = count_tokens(pack_context("q", [], 8192)[0])
+    budget = overhead + count_tokens(first.page_content) + settings.CONTEXT_MIN_TRUNCATE_TOKENS // 2
+    _prompt, packed, usage = pack_context("q", [(first, 1.0), (second, 0.5)], budget)
+    assert packed == [(first, 1.0)]
+    assert usage["chunks_dropped"] == 1
+
+
+def test_truncate_to_tokens_cuts_at_a_word_boundary():
+    text = "alpha beta gamma delta epsilon"
+    assert truncate_to_tokens(text, 100) == text
+    # "epsilon" alone is two estimated tokens
+    assert truncate_to_tokens(text, 5) == "alpha beta gamma delta"
+    assert truncate_to_tokens(text, 3) == "alpha beta gamma"
+
+
+def test_token_counter_falls_back_to_an_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.undo()
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    get_token_counter.cache_clear()
+    try:
+        assert get_token_counter() is estimate_tokens
+        assert count_tokens("Rover thermal limits, v2.1") == estimate_tokens("Rover thermal limits, v2.1") == 8
+        assert count_tokens(truncate_to_tokens(page_text(500), 100)) <= 100
+    finally:
+        get_token_counter.cache_clear()
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app.core.config import settings
+from app.services import dsn, uploads
+from app.utils.tee_decryption import decrypt_tee_file
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+def upload(path: str):
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await dsn.upload_path(path, "payload.bin", "application/octet-stream", session)
+    return asyncio.run(run())
+
+
+def state_files() -> list:
+    if not os.path.isdir(settings.DSN_UPLOAD_STATE_DIR):
+        return []
+    return [os.path.join(settings.DSN_UPLOAD_STATE_DIR, name) for name in os.listdir(settings.DSN_UPLOAD_STATE_DIR)]
+
+
+def leave_state(path: str, **overrides) -> str:
+    """Fail an upload after its state file is written and return that file."""
+    async def fail(*args, **kwargs):
+        raise dsn.DSNError(500, "interrupted")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(dsn, "complete_upload", fail)
+        with pytest.raises(dsn.DSNError):
+            upload(path)
+    [state_path] = state_files()
+    with open(state_path) as f:
+        state = json.load(f)
+    state.update(overrides)
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    return state_path
+
+
+@pytest.fixture
+def payload(tmp_path):
+    path = tmp_path / "payload.bin"
+    path.write_bytes(os.urandom(5000))
+    return str(path)
+
+
+def test_upload_round_trip(stub_dsn, payload):
+    _upload_id, completion = upload(payload)
+    with open(payload, "rb") as f, open(os.path.join(stub_dsn["objects_dir"], completion["cid"]), "rb") as uploaded:
+        assert uploaded.read() == f.read()
+    assert state_files() == []
+
+
+def test_resume_reuses_the_stored_upload(stub_dsn, payload):
+    leave_state(payload)
+    stub_dsn["stats"]["chunk_requests"] = 0
+    _upload_id, completion = upload(payload)
+    # Every chunk was already sent before the interruption
+    assert stub_dsn["stats"]["chunk_requests"] == 0
+    assert completion["size"] == 5000
+    assert state_files() == []
+
+
+def test_upload_the_server_forgot_is_restarted(stub_dsn, payload):
+    leave_state(payload)
+    stub_dsn["uploads"].clear()
+    _upload_id, completion = upload(payload)
+    assert completion["size"] == 5000
+    assert state_files() == []
+
+
+def test_expired_state_is_discarded(stub_dsn, payload):
+    state_path = leave_state(payload, created_at=time.time() - settings.DSN_UPLOAD_STATE_TTL - 1)
+    with open(state_path) as f:
+        stale_id = json.load(f)["upload_id"]
+    upload_id, _completion = upload(payload)
+    assert upload_id != stale_id
+    assert state_files() == []
+
+
+def test_failed_chunk_cancels_and_awaits_the_others(monkeypatch):
+    started = []
+
+    async def upload_chunk(session, upload_id, index, data, filename, mime_type):
+        started.append(asyncio.current_task())
+        if index == 1:
+            raise dsn.DSNError(400, "bad chunk")
+        if index == 2:
+            raise dsn.DSNError(400, "also bad")
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(dsn, "upload_chunk", upload_chunk)
+    monkeypatch.setattr(settings, "DSN_UPLOAD_CONCURRENCY", 4)
+
+    async def chunks():
+        for index in range(4):
+            yield index, b"x"
+
+    async def run():
+        with pytest.raises(dsn.DSNError):
+            await dsn.upload_chunks(None, "upload", chunks(), "f", "application/octet-stream")
+        # Nothing is left running or holding an unretrieved exception
+        assert all(task.done() for task in started)
+        assert started[0].cancelled() and started[3].cancelled()
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def tee_keys(tmp_path, monkeypatch):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_path = tmp_path / "tee_private.pem"
+    private_path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    public_path = tmp_path / "tee_public.pem"
+    public_path.write_bytes(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    monkeypatch.setattr(settings, "PUBLIC_KEY_PATH", str(public_path))
+    return str(private_path)
+
+
+def upload_encrypted(path: str):
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            with open(path, "rb") as f:
+                return await uploads.upload_encrypted(f, "payload.bin.msgpack", session)
+    return asyncio.run(run())
+
+
+def decrypted(stub_dsn, completion, private_path, tmp_path) -> bytes:
+    output_path = str(tmp_path / "decrypted")
+    assert decrypt_tee_file(os.path.join(stub_dsn["objects_dir"], completion["cid"]), private_path, output_path)
+    with open(output_path, "rb") as f:
+        return f.read()
+
+
+def test_encrypted_upload_resumes_with_the_same_bundle(stub_dsn, payload, tee_keys, tmp_path):
+    async def fail(*args, **kwargs):
+        raise dsn.DSNError(500, "interrupted")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(dsn, "complete_upload", fail)
+        with pytest.raises(dsn.DSNError):
+            upload_encrypted(payload)
+    # The bundle stays next to the upload's state for the retry
+    assert sorted(os.path.splitext(path)[1] for path in state_files()) == [".bundle", ".json"]
+
+    stub_dsn["stats"]["chunk_requests"] = 0
+    _upload_id, completion = upload_encrypted(payload)
+    assert stub_dsn["stats"]["chunk_requests"] == 0
+    assert state_files() == []
+    with open(payload, "rb") as f:
+        assert decrypted(stub_dsn, completion, tee_keys, tmp_path) == f.read()
+
+
+def test_expired_bundles_are_discarded(stub_dsn, payload, tee_keys):
+    os.makedirs(settings.DSN_UPLOAD_STATE_DIR)
+    stale = os.path.join(settings.DSN_UPLOAD_STATE_DIR, f"stale{uploads.BUNDLE_SUFFIX}")
+    with open(stale, "wb") as f:
+        f.write(b"left by a crashed upload")
+    os.utime(stale, (0, time.time() - settings.DSN_UPLOAD_STATE_TTL - 1))
+    upload_encrypted(payload)
+    assert state_files() == []
+
+
+def test_streamed_encrypted_upload_retries_failed_chunks(stub_dsn, payload, tee_keys, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_RESUMABLE", False)
+    monkeypatch.setattr(settings, "DSN_UPLOAD_RETRIES", 10)
+    flaky = create_stub_app(objects_dir=stub_dsn["objects_dir"], upload_failure_rate=0.2)
+    with StubServer(flaky) as stub:
+        monkeypatch.setattr(settings, "DSN_BASE_URL", stub.base_url)
+        _upload_id, completion = upload_encrypted(payload)
+    assert state_files() == []
+    with open(payload, "rb") as f:
+        assert decrypted(stub_dsn, completion, tee_keys, tmp_path) == f.read()
@@ -0,0 +1,66 @@
+import sqlite3
+import time
+
+from app.utils.embedding_cache import EmbeddingCacheStore
+
+
+def make_store(tmp_path, max_entries=3, **kwargs) -> EmbeddingCacheStore:
+    return EmbeddingCacheStore(str(tmp_path / "cache.sqlite3"), max_entries, **kwargs)
+
+
+def row_count(store: EmbeddingCacheStore) -> int:
+    with sqlite3.connect(store.path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_round_trip_and_running_count(tmp_path):
+    store = make_store(tmp_path, max_entries=10)
+    store.put_many("m", {"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    store.put_many("m", {"a": [1.0, 2.0], "c": [5.0, 6.0]})
+    assert store.get_many(["a", "c", "missing"]) == {"a": [1.0, 2.0], "c": [5.0, 6.0]}
+    assert store.stats()["entries"] == row_count(store) == 3
+    # A reopened store starts from the real count
+    assert make_store(tmp_path, max_entries=10).stats()["entries"] == 3
+
+
+def test_hits_do_not_write_until_flushed(tmp_path):
+    store = make_store(tmp_path, max_entries=10, touch_flush_interval=3600)
+    store.put_many("m", {"a": [1.0]})
+    changes = store._conn.total_changes
+    for _ in range(5):
+        store.get_many(["a"])
+    assert store._conn.total_changes == changes
+    assert store.stats()["pending_touches"] == 1
+    store.flush()
+    assert store._conn.total_changes == changes + 1
+    assert store.stats()["pending_touches"] == 0
+
+
+def test_touches_flush_after_max_keys(tmp_path):
+    store = make_store(tmp_path, max_entries=10, touch_flush_interval=3600, touch_flush_max=2)
+    store.put_many("m", {"a": [1.0], "b": [2.0]})
+    store.get_many(["a"])
+    assert store.stats()["pending_touches"] == 1
+    store.get_many(["b"])
+    assert store.stats()["pending_touches"] == 0
+
+
+def test_eviction_uses_buffered_touches(tmp_path):
+    store = make_store(tmp_path, max_entries=3, touch_flush_interval=3600)
+    for key in "abc":
+        store.put_many("m", {key: [1.0]})
+        time.sleep(0.01)
+    # "a" is the oldest write but the most recently read
+    store.get_many(["a"])
+    store.put_many("m", {"d": [4.0]})
+    assert set(store.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+    assert store.stats()["entries"] == row_count(store) == 3
+    assert store.evictions == 1
+
+
+def test_eviction_recounts_rows_written_by_another_process(tmp_path):
+    store = make_store(tmp_path, max_entries=3)
+    other = make_store(tmp_path, max_entries=100)
+    other.put_many("m", {"x": [1.0], "y": [2.0], "z": [3.0]})
+    store.put_many("m", {"a": [1.0], "b": [2.0], "c": [3.0], "d": [4.0]})
+    assert row_count(store) == store.stats()["entries"] == 3
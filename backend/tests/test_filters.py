@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.rag import RetrievalParams, chroma_where, parse_filters
+from app.services.vector_store import open_chroma, retire_chroma_system
+
+
+def test_values_are_normalized_to_sorted_unique_lists():
+    assert parse_filters({"source": "a.pdf", "type": ["pdf", "search_result", "pdf"]}) == {
+        "source": ["a.pdf"], "type": ["pdf", "search_result"]
+    }
+    assert parse_filters(None) is None
+    assert parse_filters({}) is None
+
+
+def test_timestamps_accept_unix_seconds_and_iso_8601():
+    expected = datetime(2024, 5, 1, tzinfo=timezone.utc).timestamp()
+    assert parse_filters({"ingestedAfter": "2024-05-01T00:00:00Z"}) == {"ingested_at": (expected, None)}
+    assert parse_filters({"ingestedBefore": 1700000000}) == {"ingested_at": (None, 1700000000.0)}
+
+
+@pytest.mark.parametrize("raw", [
+    ["source"],
+    {"author": "x"},
+    {"source": []},
+    {"source": 3},
+    {"cid": ["ok", 1]},
+    {"ingestedAfter": "yesterday"},
+    {"ingestedBefore": True},
+])
+def test_invalid_filters_are_rejected(raw):
+    with pytest.raises(ValueError):
+        parse_filters(raw)
+
+
+def test_from_config_parses_filters():
+    assert RetrievalParams.from_config({"filters": {"cid": "bafy1"}}).filters == {"cid": ["bafy1"]}
+    with pytest.raises(ValueError):
+        RetrievalParams.from_config({"filters": {"author": "x"}})
+
+
+def test_single_condition_is_not_wrapped():
+    assert chroma_where(None) is None
+    assert chroma_where({"source": ["a.pdf"]}) == {"source": "a.pdf"}
+    assert chroma_where({"type": ["pdf", "search_result"]}) == {"type": {"$in": ["pdf", "search_result"]}}
+    assert chroma_where({"ingested_at": (100.0, None)}) == {"ingested_at": {"$gte": 100.0}}
+
+
+def test_several_conditions_are_combined_with_and():
+    assert chroma_where(parse_filters({
+        "source": ["a.pdf", "b.pdf"], "cid": "bafy1", "ingestedAfter": 100, "ingestedBefore": 200
+    })) == {"$and": [
+        {"source": {"$in": ["a.pdf", "b.pdf"]}},
+        {"cid": "bafy1"},
+        {"ingested_at": {"$gte": 100.0}},
+        {"ingested_at": {"$lte": 200.0}},
+    ]}
+
+
+def test_range_filters_select_chunks_in_chroma(tmp_path):
+    db = open_chroma(str(tmp_path / "chroma"), DeterministicFakeEmbedding(size=16))
+    try:
+        db.add_texts(
+            ["old", "middle", "new"],
+            metadatas=[{"type": "pdf", "ingested_at": at} for at in (100.0, 200.0, 300.0)],
+        )
+        where = chroma_where(parse_filters({"type": "pdf", "ingestedAfter": 150, "ingestedBefore": 300}))
+        assert sorted(db.get(where=where)["documents"]) == ["middle", "new"]
+        where = chroma_where(parse_filters({"ingestedBefore": 150}))
+        assert db.get(where=where)["documents"] == ["old"]
+    finally:
+        retire_chroma_system(str(tmp_path / "chroma"))
@@ -0,0 +1,55 @@
+import asyncio
+
+from app.core.config import settings
+from app.services.http_client import DSN, GOOGLE, VM, HTTPClients
+
+
+async def fetch(clients: HTTPClients, close: bool = False):
+    """Make one pooled request and return the session that served it."""
+    session = clients.get(DSN)
+    async with session.post(f"{settings.DSN_BASE_URL}/uploads/file", json={"filename": "a.txt"}) as response:
+        response.raise_for_status()
+        await response.read()
+    if close:
+        await clients.close()
+    return session
+
+
+def test_session_from_a_closed_loop_is_released(stub_dsn):
+    clients = HTTPClients()
+    first = asyncio.run(fetch(clients))
+    assert not first.closed
+    second = asyncio.run(fetch(clients, close=True))
+    assert second is not first
+    # Detached: its pool goes with the connector instead of staying open
+    assert first.closed and first.connector is None
+
+
+def test_session_from_a_live_loop_is_closed_on_it(stub_dsn):
+    clients = HTTPClients()
+    old_loop = asyncio.new_event_loop()
+    try:
+        first = old_loop.run_until_complete(fetch(clients))
+        asyncio.run(fetch(clients, close=True))
+        # The close was handed to the old loop and runs once it does
+        old_loop.run_until_complete(asyncio.sleep(0.01))
+        assert first.closed
+    finally:
+        old_loop.close()
+
+
+def test_sessions_bound_connect_and_search_time():
+    async def timeouts():
+        clients = HTTPClients()
+        try:
+            return {service: clients.get(service).timeout for service in (DSN, VM, GOOGLE)}
+        finally:
+            await clients.close()
+
+    result = asyncio.run(timeouts())
+    for timeout in result.values():
+        assert timeout.connect == settings.HTTP_CONNECT_TIMEOUT
+    assert result[GOOGLE].total == settings.SEARCH_TOTAL_TIMEOUT
+    # Long transfers and streamed generations are bounded per read instead
+    assert result[DSN].total is None and result[DSN].sock_read == settings.DSN_READ_TIMEOUT
+    assert result[VM].total is None and result[VM].sock_read == settings.VM_READ_TIMEOUT
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes import query
+from app.services import ingest_jobs
+from app.services.ingest_jobs import IngestJobQueue
+
+
+class FakeIngestion:
+    """update_database stand-in: each run reports progress, then waits for ``release``."""
+
+    def __init__(self):
+        self.runs = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self, progress=None, tenant=None):
+        self.runs += 1
+        progress({"chunks_upserted": self.runs})
+        self.started.set()
+        await self.release.wait()
+        self.release.clear()
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    fake = FakeIngestion()
+    monkeypatch.setattr(ingest_jobs, "update_database", fake)
+    return fake
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_jobs_queued_during_a_run_share_the_next_one(tmp_path, ingestion):
+    async def scenario():
+        queue = IngestJobQueue(str(tmp_path / "jobs.json"))
+        await queue.start()
+        first = queue.enqueue("retrieve:a")
+        await asyncio.wait_for(ingestion.started.wait(), 5)
+        ingestion.started.clear()
+        second, third = queue.enqueue("retrieve:b"), queue.enqueue("retrieve:c")
+        assert (first["status"], second["status"]) == ("running", "queued")
+
+        ingestion.release.set()
+        await asyncio.wait_for(ingestion.started.wait(), 5)
+        ingestion.release.set()
+        await settle()
+        await queue.stop()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert ingestion.runs == 2
+    assert second["run_id"] == third["run_id"] != first["run_id"]
+    assert [job["status"] for job in (first, second, third)] == ["succeeded"] * 3
+
+
+def test_job_status_moves_from_queued_to_running_to_finished(tmp_path, ingestion, monkeypatch):
+    queue = IngestJobQueue(str(tmp_path / "jobs.json"))
+
+    async def get_ingest_queue(tenant=None):
+        return queue
+
+    monkeypatch.setattr(query, "get_ingest_queue", get_ingest_queue)
+
+    async def scenario():
+        job = queue.enqueue("retrieve:a")
+        assert (await query.job_status(job["id"], tenant="default"))["status"] == "queued"
+        await queue.start()
+        await asyncio.wait_for(ingestion.started.wait(), 5)
+        running = await query.job_status(job["id"], tenant="default")
+        assert running["status"] == "running" and running["started_at"] is not None
+        await settle()
+        assert running["progress"] == {"chunks_upserted": 1}
+
+        ingestion.error = RuntimeError("disk full")
+        ingestion.release.set()
+        await settle()
+        failed = await query.job_status(job["id"], tenant="default")
+        assert (failed["status"], failed["error"]) == ("failed", "disk full")
+        assert failed["finished_at"] >= failed["started_at"]
+        with pytest.raises(HTTPException) as excinfo:
+            await query.job_status("missing", tenant="default")
+        assert excinfo.value.status_code == 404
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_running_jobs_are_requeued_after_a_restart(tmp_path, ingestion):
+    path = tmp_path / "jobs.json"
+    interrupted = {
+        "id": "interrupted", "reason": "retrieve:a", "status": "running", "created_at": 1.0,
+        "started_at": 2.0, "finished_at": None, "run_id": "old-run", "progress": {"chunks_upserted": 7}, "error": None,
+    }
+    finished = dict(interrupted, id="finished", status="succeeded", finished_at=3.0)
+    path.write_text(json.dumps({"jobs": [interrupted, finished]}))
+
+    async def scenario():
+        queue = IngestJobQueue(str(path))
+        await queue.start()
+        await asyncio.wait_for(ingestion.started.wait(), 5)
+        job = queue.get("interrupted")
+        assert job["status"] == "running" and job["run_id"] != "old-run"
+        ingestion.release.set()
+        await settle()
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert ingestion.runs == 1
+    assert queue.get("interrupted")["status"] == "succeeded"
+    assert queue.get("finished")["run_id"] == "old-run"
+    with open(path) as f:
+        assert {job["id"]: job["status"] for job in json.load(f)["jobs"]} == {
+            "interrupted": "succeeded", "finished": "succeeded"
+        }
+
+
+def test_saves_are_written_off_the_loop_and_coalesced(tmp_path, monkeypatch):
+    writes = []
+    write = IngestJobQueue._write
+
+    def recording_write(self, data):
+        writes.append(threading.current_thread())
+        write(self, data)
+
+    monkeypatch.setattr(IngestJobQueue, "_write", recording_write)
+
+    async def scenario():
+        queue = IngestJobQueue(str(tmp_path / "jobs.json"))
+        jobs = [queue.enqueue(f"retrieve:{i}") for i in range(20)]
+        await queue.flush()
+        return jobs
+
+    jobs = asyncio.run(scenario())
+    assert writes and threading.main_thread() not in writes
+    assert len(writes) < len(jobs)
+    with open(tmp_path / "jobs.json") as f:
+        assert len(json.load(f)["jobs"]) == 20
@@ -0,0 +1,87 @@
+import pytest
+
+from app.services.rag import reciprocal_rank_fusion
+from app.utils.lexical_index import LexicalIndex, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.upsert(
+        ["a", "b", "c"],
+        [
+            "The rover uses auto-drive on rough terrain",
+            "Battery thermal limits of the rover",
+            "Quarterly revenue for the battery division",
+        ],
+        [
+            {"source": "rover.pdf", "type": "pdf", "ingested_at": 100},
+            {"source": "rover.pdf", "type": "pdf", "ingested_at": 200},
+            {"source": "finance.pdf", "type": "pdf", "cid": "bafy1", "ingested_at": 300},
+        ],
+    )
+    return index
+
+
+def test_tokenize_lowercases_drops_stopwords_and_splits_compounds():
+    assert tokenize("The Auto-Drive of v2.1") == ["auto-drive", "auto", "drive", "v2.1", "v2", "1"]
+    assert tokenize("Price of $AI3 and GPT-4o") == ["price", "$ai3", "gpt-4o", "gpt", "4o"]
+    assert tokenize("of the and") == []
+
+
+def test_bm25_ranks_rarer_and_more_frequent_terms_higher(index):
+    ranked = [doc_id for doc_id, _score in index.search("rover battery", 3)]
+    # "b" matches both terms; "a" and "c" one each
+    assert ranked[0] == "b"
+    assert set(ranked) == {"a", "b", "c"}
+    assert [doc_id for doc_id, _ in index.search("drive", 3)] == ["a"]
+    assert index.search("unknown words", 3) == []
+    assert len(index.search("rover battery", 1)) == 1
+
+
+def test_filters_restrict_matches_without_changing_scores(index):
+    unfiltered = dict(index.search("battery", 3))
+    filtered = index.search("battery", 3, {"source": ["finance.pdf"]})
+    assert filtered == [("c", unfiltered["c"])]
+    assert index.search("battery", 3, {"cid": ["bafy1"]}) == filtered
+    assert [doc_id for doc_id, _ in index.search("rover", 3, {"ingested_at": (150, None)})] == ["b"]
+    assert [doc_id for doc_id, _ in index.search("rover", 3, {"ingested_at": (None, 150)})] == ["a"]
+    assert index.search("rover", 3, {"type": ["csv"]}) == []
+
+
+def test_counts_and_facets_follow_upserts_and_deletes(index):
+    assert index.count() == 3
+    assert index.facets() == {"source": {"rover.pdf": 2, "finance.pdf": 1}, "type": {"pdf": 3}, "cid": {"bafy1": 1}}
+    assert index.chunk_ids("bafy1") == ["c"]
+
+    # Re-upserting a chunk replaces it rather than counting it twice
+    index.upsert(["c"], ["Quarterly revenue"], [{"source": "finance-v2.pdf", "type": "pdf"}])
+    assert index.count() == 3
+    assert index.facets() == {"source": {"rover.pdf": 2, "finance-v2.pdf": 1}, "type": {"pdf": 3}, "cid": {}}
+    assert index.chunk_ids("bafy1") == []
+    assert index.search("battery", 3) == index.search("battery", 3, {"source": ["rover.pdf"]})
+
+    index.delete(["a", "b", "missing"])
+    assert index.count() == 1
+    assert index.facets() == {"source": {"finance-v2.pdf": 1}, "type": {"pdf": 1}, "cid": {}}
+    assert index.search("rover", 3) == []
+
+
+def test_rebuild_replaces_the_index(index):
+    assert index.rebuild([(["x"], ["fresh chunk"], [{"source": "new.pdf"}])]) == 1
+    assert index.count() == 1
+    assert index.search("rover", 3) == []
+    assert index.facets()["source"] == {"new.pdf": 1}
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_reciprocal_rank_fusion_breaks_ties_by_first_appearance():
+    # "a" and "x" both score 1 / 61; the sort is stable, so the first list wins
+    fused = reciprocal_rank_fusion([["a"], ["x"]], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == ["a", "x"]
+    assert reciprocal_rank_fusion([], k=60) == []
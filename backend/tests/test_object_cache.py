@@ -0,0 +1,130 @@
+import itertools
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import object_cache
+from app.utils.cid_index import CID_INDEX_VERSION, cid_index_path, claim_filename, load_cid_index, lookup_cid, record_cid
+from app.utils.object_cache import ObjectCache, file_sha256
+
+
+@pytest.fixture
+def source(tmp_path):
+    def write(name: str, size: int) -> str:
+        path = tmp_path / "source" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(name.encode()[:1] * size)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Distinct last-use times, so LRU order doesn't depend on timer resolution."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(object_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_cached_object_is_served_after_verification(tmp_path, source):
+    cache = ObjectCache(str(tmp_path / "cache"), 1024)
+    path = source("a", 10)
+    assert cache.put("cidA", path, "a.pdf")
+    assert cache.get("cidA") == {
+        "path": cache.object_path("cidA"), "filename": "a.pdf", "size": 10, "sha256": file_sha256(path)
+    }
+    assert cache.get("cidB") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_corrupted_object_is_rejected_and_forgotten(tmp_path, source):
+    cache = ObjectCache(str(tmp_path / "cache"), 1024)
+    cache.put("cidA", source("a", 10), "a.pdf")
+    # Same size, different bytes: only the hash catches it
+    with open(cache.object_path("cidA"), "r+b") as f:
+        f.write(b"X")
+    assert cache.get("cidA") is None
+    assert not os.path.exists(cache.object_path("cidA"))
+    assert cache.stats()["entries"] == 0
+    assert (cache.corrupt, cache.misses, cache.hits) == (1, 1, 0)
+
+
+def test_least_recently_used_objects_are_evicted_by_size(tmp_path, source, clock):
+    cache = ObjectCache(str(tmp_path / "cache"), 10)
+    cache.put("cidA", source("a", 4), "a.pdf")
+    cache.put("cidB", source("b", 4), "b.pdf")
+    assert cache.get("cidA") is not None
+    cache.put("cidC", source("c", 4), "c.pdf")
+    # b was used least recently; a and c fit together
+    assert cache.get("cidB") is None
+    assert not os.path.exists(cache.object_path("cidB"))
+    assert cache.get("cidA") and cache.get("cidC")
+    assert cache.stats()["size_bytes"] == 8
+    assert cache.evictions == 1
+
+
+def test_objects_larger_than_the_cache_and_bad_cids_are_skipped(tmp_path, source):
+    cache = ObjectCache(str(tmp_path / "cache"), 10)
+    assert not cache.put("cidA", source("a", 11), "a.pdf")
+    assert not cache.put("../cidA", source("b", 4), "b.pdf")
+    assert cache.get("../cidA") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_concurrent_lookups_are_all_counted(tmp_path, source):
+    cache = ObjectCache(str(tmp_path / "cache"), 1024)
+    cache.put("cidA", source("a", 10), "a.pdf")
+
+    def lookups():
+        for _ in range(50):
+            cache.get("cidA")
+            cache.get("cidB")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (400, 400, 0.5)
+
+
+def test_version_1_cid_index_is_read_and_upgraded(tmp_path):
+    data_path = str(tmp_path / "data")
+    os.makedirs(data_path)
+    with open(cid_index_path(data_path), "w") as f:
+        json.dump({"old.pdf": "cidOld"}, f)
+
+    assert load_cid_index(data_path) == {"old.pdf": "cidOld"}
+    # No hash was recorded, so a retrieve won't trust the local copy
+    assert lookup_cid(data_path, "cidOld") == {"filename": "old.pdf"}
+
+    record_cid(data_path, "new.pdf", "cidNew", 3, "abc")
+    with open(cid_index_path(data_path)) as f:
+        index = json.load(f)
+    assert index == {"version": CID_INDEX_VERSION, "objects": {
+        "cidOld": {"filename": "old.pdf"},
+        "cidNew": {"filename": "new.pdf", "size": 3, "sha256": "abc"},
+    }}
+    # Re-recording a filename moves it to the new CID
+    record_cid(data_path, "old.pdf", "cidOther", 1, "def")
+    assert load_cid_index(data_path) == {"new.pdf": "cidNew", "old.pdf": "cidOther"}
+
+
+def test_claim_filename_keeps_both_files_on_a_collision(tmp_path):
+    data_path = str(tmp_path / "data")
+    os.makedirs(data_path)
+    assert claim_filename(data_path, "report.pdf", "bafyAAAAAAAAAAAA1") == "report.pdf"
+
+    record_cid(data_path, "report.pdf", "bafyAAAAAAAAAAAA1")
+    (tmp_path / "data" / "report.pdf").write_text("first")
+    # The same CID keeps its name; another CID gets a suffix
+    assert claim_filename(data_path, "report.pdf", "bafyAAAAAAAAAAAA1") == "report.pdf"
+    assert claim_filename(data_path, "report.pdf", "bafyBBBBBBBBBBBB2") == "report-BBBBBBBBBBB2.pdf"
+
+    # So does a name held by a file /retrieve didn't write
+    (tmp_path / "data" / "notes.pdf").write_text("mine")
+    assert claim_filename(data_path, "notes.pdf", "bafyCCCCCCCCCCCC3") == "notes-CCCCCCCCCCC3.pdf"
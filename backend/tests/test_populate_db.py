@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from langchain.schema.document import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.semantic_cache import SemanticCache
+from app.services.vector_store import chroma_collection
+from vdb import populate_db
+from vdb.manifest import INGEST_MANIFEST_FILENAME
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    texts: list = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+def fake_load_pdf(file_path: str):
+    """Each line of the file is a page."""
+    with open(file_path) as f:
+        pages = f.read().splitlines()
+    return [Document(page_content=text, metadata={"source": file_path, "page": page}) for page, text in enumerate(pages)], None
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    embeddings = CountingEmbeddings(size=16, texts=[])
+    monkeypatch.setattr(populate_db, "load_pdf", fake_load_pdf)
+    monkeypatch.setattr(populate_db, "get_embedding_function", lambda: embeddings)
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    for name in ("a", "b"):
+        (data_path / f"{name}.pdf").write_text(f"first page of {name}\nsecond page of {name}\n")
+    paths = {"chroma_path": str(tmp_path / "chroma"), "data_path": str(data_path), "workers": 1}
+    yield embeddings, paths
+    populate_db.retire_chroma_system(paths["chroma_path"])
+
+
+def test_first_incremental_run_seeds_manifest_instead_of_reembedding(store):
+    embeddings, paths = store
+    populate_db.main(incremental=False, **paths)
+    assert len(embeddings.texts) == 4
+    assert not os.path.exists(os.path.join(paths["chroma_path"], INGEST_MANIFEST_FILENAME))
+
+    embeddings.texts.clear()
+    populate_db.main(incremental=True, **paths)
+    assert embeddings.texts == []
+    assert os.path.exists(os.path.join(paths["chroma_path"], INGEST_MANIFEST_FILENAME))
+
+
+def test_seeded_manifest_picks_up_later_edits(store):
+    embeddings, paths = store
+    populate_db.main(incremental=False, **paths)
+    with open(os.path.join(paths["data_path"], "b.pdf"), "w") as f:
+        f.write("first page of b\nan edited second page\n")
+    os.utime(os.path.join(paths["data_path"], "b.pdf"))
+
+    embeddings.texts.clear()
+    populate_db.main(incremental=True, **paths)
+    # b.pdf was modified after it was indexed: it is re-parsed, and only
+    # its edited page is embedded
+    assert embeddings.texts == ["an edited second page"]
+
+
+def test_file_that_fails_to_load_keeps_its_chunks_and_is_retried(store, monkeypatch):
+    embeddings, paths = store
+    populate_db.main(incremental=True, **paths)
+    b_path = os.path.join(paths["data_path"], "b.pdf")
+    with open(b_path, "w") as f:
+        f.write("first page of b\nan edited second page\n")
+    os.utime(b_path, (0, os.stat(b_path).st_mtime + 5))
+
+    def failing_load_pdf(file_path):
+        if file_path == b_path:
+            return [], "EOF marker not found"
+        return fake_load_pdf(file_path)
+
+    monkeypatch.setattr(populate_db, "load_pdf", failing_load_pdf)
+    embeddings.texts.clear()
+    populate_db.main(incremental=True, **paths)
+    assert embeddings.texts == []
+    db = populate_db.open_chroma(paths["chroma_path"], embeddings)
+    assert sorted(db.get(where={"source": b_path})["documents"]) == ["first page of b", "second page of b"]
+
+    monkeypatch.setattr(populate_db, "load_pdf", fake_load_pdf)
+    populate_db.main(incremental=True, **paths)
+    assert embeddings.texts == ["an edited second page"]
+    assert sorted(db.get(where={"source": b_path})["documents"]) == ["an edited second page", "first page of b"]
+
+
+def test_ingestion_only_invalidates_its_tenants_cached_answers(store, monkeypatch):
+    _embeddings, paths = store
+    cache = SemanticCache(threshold=0.97, max_entries=16, ttl=60)
+    cache.store([1.0, 0.0], {}, "default answer", [], cache.generation(), None)
+    monkeypatch.setattr(populate_db, "semantic_cache", cache)
+    populate_db.main(incremental=True, tenant="acme", **paths)
+    assert cache.generation("acme") == 1
+    assert cache.lookup([1.0, 0.0], {}).response == "default answer"
+
+
+def test_chunks_from_before_metadata_stamping_are_backfilled(store):
+    embeddings, paths = store
+    db = populate_db.open_chroma(paths["chroma_path"], embeddings)
+    a_path = os.path.join(paths["data_path"], "a.pdf")
+    texts = ["first page of a", "second page of a", "an old search summary"]
+    # As stored before ingest_batches added "type" and "ingested_at"
+    chroma_collection(db).add(
+        ids=[f"{a_path}:0:0", f"{a_path}:1:0", "context-1"],
+        documents=texts,
+        embeddings=embeddings.embed_documents(texts),
+        metadatas=[{"source": a_path, "page": 0}, {"source": a_path, "page": 1}, {"source": "google_search"}],
+    )
+    os.remove(os.path.join(paths["data_path"], "b.pdf"))
+
+    embeddings.texts.clear()
+    populate_db.main(incremental=True, **paths)
+    assert embeddings.texts == []
+    stored = db.get(ids=["context-1", f"{a_path}:0:0"])
+    assert sorted((m["type"], m["ingested_at"]) for m in stored["metadatas"]) == [("pdf", 0.0), ("search_result", 0.0)]
+    lexical_index = populate_db.get_lexical_index(paths["chroma_path"])
+    assert lexical_index.facets()["type"] == {"pdf": 2, "search_result": 1}
+    assert len(lexical_index.search("page", 3, {"type": ["pdf"]})) == 2
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    """Later batches finish first; records how many calls overlap."""
+    delays: dict = {}
+    lock: object = None
+    active: int = 0
+    peak: int = 0
+    finished: int = 0
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delays.get(texts[0], 0))
+        with self.lock:
+            self.active -= 1
+            self.finished += 1
+        return super().embed_documents(texts)
+
+
+def test_parallel_batches_keep_their_own_embeddings(tmp_path, monkeypatch):
+    chroma_path = str(tmp_path / "chroma")
+    monkeypatch.setattr(populate_db.settings, "CHROMA_PATH", chroma_path)
+    texts = [f"chunk {i}" for i in range(12)]
+    # Batch n sleeps longest when n is smallest, so batches complete in reverse
+    embeddings = SlowEmbeddings(size=16, delays={texts[i]: 0.05 * (6 - i // 2) for i in range(0, 12, 2)}, lock=threading.Lock())
+    db = populate_db.open_chroma(chroma_path, embeddings)
+    chunks = [Document(page_content=text, metadata={"id": f"id-{i}", "source": "s.pdf"}) for i, text in enumerate(texts)]
+    backlog = []
+
+    def batches():
+        for batch in populate_db.batched(chunks, 2):
+            # Only pulled once a slot is free
+            backlog.append(len(backlog) - embeddings.finished)
+            yield batch
+
+    reported = []
+    try:
+        added = populate_db.ingest_batches(db, batches(), max_concurrency=3, progress=reported.append)
+        stored = chroma_collection(db).get(ids=[f"id-{i}" for i in range(12)], include=["documents", "embeddings"])
+    finally:
+        populate_db.retire_chroma_system(chroma_path)
+
+    assert added == 12 and reported[-1] == {"chunks_upserted": 12}
+    assert 1 < embeddings.peak <= 3
+    assert max(backlog) < 3
+    expected = dict(zip(texts, embeddings.embed_documents(texts)))
+    for document, embedding in zip(stored["documents"], stored["embeddings"]):
+        assert list(embedding) == pytest.approx(expected[document])
+    assert sorted(stored["documents"]) == sorted(texts)
+
+
+def api_error(error_class, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    if error_class is openai.APIConnectionError:
+        return error_class(request=request)
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return error_class("rate limited", response=response, body=None)
+
+
+class FlakyEmbeddings:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[1.0] for _ in texts]
+
+
+def test_embed_with_retry_backs_off_and_honours_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(populate_db.time, "sleep", sleeps.append)
+    monkeypatch.setattr(populate_db.random, "random", lambda: 0.5)
+    flaky = FlakyEmbeddings([
+        api_error(openai.RateLimitError, {"retry-after": "7"}),
+        api_error(openai.APIConnectionError),
+        api_error(openai.RateLimitError),
+    ])
+    assert populate_db.embed_with_retry(flaky, ["a", "b"]) == [[1.0], [1.0]]
+    assert flaky.calls == 4
+    assert sleeps == [7.0, 3.0, 6.0]
+
+
+def test_embed_with_retry_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(populate_db.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(populate_db.settings, "INGEST_MAX_RETRIES", 2)
+    flaky = FlakyEmbeddings([api_error(openai.RateLimitError) for _ in range(3)])
+    with pytest.raises(openai.RateLimitError):
+        populate_db.embed_with_retry(flaky, ["a"])
+    assert flaky.calls == 3
+
+    # Anything else is not retried
+    flaky = FlakyEmbeddings([ValueError("bad input")])
+    with pytest.raises(ValueError):
+        populate_db.embed_with_retry(flaky, ["a"])
+    assert flaky.calls == 1
+
+
+def test_retry_after_reads_the_header():
+    assert populate_db.retry_after(api_error(openai.RateLimitError, {"retry-after": "2.5"})) == 2.5
+    assert populate_db.retry_after(api_error(openai.RateLimitError, {"retry-after": "soon"})) == 0.0
+    assert populate_db.retry_after(api_error(openai.RateLimitError)) == 0.0
+    assert populate_db.retry_after(api_error(openai.APIConnectionError)) == 0.0
+    assert populate_db.retry_after(ValueError()) == 0.0
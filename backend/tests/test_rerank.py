@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain.schema.document import Document
+
+from app.core.config import settings
+from app.services import rag
+from app.services.rag import Candidate, RetrievalParams, dedupe_by_page, mmr
+
+
+def candidate(chunk_id, score, embedding, source="a.pdf", page=0):
+    metadata = {"source": source, "id": chunk_id}
+    if page is not None:
+        metadata["page"] = page
+    return Candidate(chunk_id, Document(page_content=chunk_id, metadata=metadata), np.array(embedding, float), score)
+
+
+def ids(candidates):
+    return [candidate.id for candidate in candidates]
+
+
+def test_page_cap_keeps_the_best_chunk_per_page():
+    ranked = [
+        candidate("a:0:0", 0.9, [1, 0]),
+        candidate("a:0:1", 0.8, [1, 0]),
+        candidate("b:0:0", 0.7, [0, 1], source="b.pdf"),
+        candidate("a:1:0", 0.6, [1, 1], page=1),
+        candidate("web", 0.5, [1, 1], source="search", page=None),
+        candidate("web2", 0.4, [1, 1], source="search", page=None),
+    ]
+    assert ids(dedupe_by_page(ranked, 1)) == ["a:0:0", "b:0:0", "a:1:0", "web", "web2"]
+    assert ids(dedupe_by_page(ranked, 2)) == ids(ranked)
+    assert dedupe_by_page(ranked, 0) is ranked
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_near_duplicate():
+    ranked = [
+        candidate("top", 1.0, [1.0, 0.0]),
+        candidate("near-duplicate", 0.95, [0.99, 0.01]),
+        candidate("different", 0.8, [0.0, 1.0]),
+    ]
+    assert ids(mmr(ranked, 2, 0.7)) == ["top", "different"]
+    # Pure relevance ignores redundancy
+    assert ids(mmr(ranked, 2, 1.0)) == ["top", "near-duplicate"]
+    assert ids(mmr(ranked, 5, 0.7)) == ["top", "different", "near-duplicate"]
+    assert ids(mmr(ranked[:1], 2, 0.7)) == ["top"]
+
+
+def test_params_default_to_settings():
+    params = RetrievalParams.from_config(None)
+    assert (params.final_k, params.fan_out, params.rerank) == (
+        settings.RETRIEVAL_K, settings.RETRIEVAL_FANOUT, settings.RERANK_STRATEGY
+    )
+    assert params.mmr_lambda == settings.MMR_LAMBDA
+    assert params.max_per_page == settings.RETRIEVAL_MAX_PER_PAGE == 1
+    assert params.filters is None
+
+
+@pytest.mark.parametrize("config, expected", [
+    ({"finalK": 0}, {"final_k": 1}),
+    ({"finalK": 10_000}, {"final_k": settings.RETRIEVAL_MAX_FANOUT, "fan_out": settings.RETRIEVAL_MAX_FANOUT}),
+    ({"finalK": "many"}, {"final_k": settings.RETRIEVAL_K}),
+    # fanOut never drops below finalK
+    ({"finalK": 8, "fanOut": 3}, {"final_k": 8, "fan_out": 8}),
+    ({"fanOut": 10_000}, {"fan_out": settings.RETRIEVAL_MAX_FANOUT}),
+    ({"mmrLambda": 1.5}, {"mmr_lambda": 1.0}),
+    ({"mmrLambda": -1}, {"mmr_lambda": 0.0}),
+    ({"mmrLambda": "x"}, {"mmr_lambda": settings.MMR_LAMBDA}),
+    ({"rerank": "bogus"}, {"rerank": settings.RERANK_STRATEGY}),
+    ({"rerank": False}, {"rerank": "none"}),
+    ({"maxPerPage": 10_000, "fanOut": 30}, {"max_per_page": 30}),
+])
+def test_params_are_clamped(config, expected):
+    params = RetrievalParams.from_config(config)
+    assert {field: getattr(params, field) for field in expected} == expected
+
+
+@pytest.mark.parametrize("rerank", ["none", False])
+def test_rerank_off_passes_fused_order_through(monkeypatch, rerank):
+    hits = [
+        candidate("top", 1.0, [1.0, 0.0]),
+        candidate("near-duplicate", 0.9, [0.99, 0.01], page=1),
+        candidate("different", 0.8, [0.0, 1.0], page=2),
+    ]
+    monkeypatch.setattr(settings, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(rag, "vector_search", lambda embedding, k, where=None, tenant=None: hits)
+    results = asyncio.run(rag.retrieve("q", [1.0, 0.0], {"rerank": rerank, "finalK": 2}))
+    assert [document.page_content for document, _score in results] == ["top", "near-duplicate"]
+
+    # The same candidates through MMR swap in the diverse chunk
+    results = asyncio.run(rag.retrieve("q", [1.0, 0.0], {"rerank": "mmr", "finalK": 2}))
+    assert [document.page_content for document, _score in results] == ["top", "different"]
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import search
+from app.services.http_client import close_http_clients
+from app.utils.single_flight import SingleFlight
+from benchmarks.stub_servers import StubServer, create_stub_app
+
+
+class FakeSummaryChain:
+    """Stands in for prompt | gpt-4o | parser; counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"  summary of {inputs['search_results']}  "
+
+
+@pytest.fixture
+def stub_search(monkeypatch):
+    """Local Custom Search stand-in with fresh caches and flights."""
+    app = create_stub_app(search_latency=0.05)
+    chain = FakeSummaryChain()
+    with StubServer(app) as stub:
+        monkeypatch.setattr(settings, "GOOGLE_SEARCH_URL", f"{stub.base_url}/customsearch/v1")
+        monkeypatch.setattr(settings, "SEARCH_RESULTS", 2)
+        monkeypatch.setattr(search, "search_cache", search.SearchResultCache(ttl=60, max_entries=8))
+        monkeypatch.setattr(search, "search_flights", SingleFlight())
+        monkeypatch.setattr(search, "summary_flights", SingleFlight())
+        monkeypatch.setattr(search, "get_summary_chain", lambda: chain)
+        yield app, chain
+
+
+def run(coro):
+    async def scenario():
+        try:
+            return await coro
+        finally:
+            await close_http_clients()
+
+    return asyncio.run(scenario())
+
+
+def test_results_are_cached_by_normalized_query(stub_search):
+    app, _chain = stub_search
+
+    async def scenario():
+        first = await search.search_results("Rust async")
+        second = await search.search_results("  rust   ASYNC ")
+        return first, second
+
+    first, second = run(scenario())
+    assert first == second == "Result 0 about Rust async. Result 1 about Rust async."
+    assert app["stats"]["searches"] == 1
+    assert search.search_cache.stats()["hits"] == 1
+
+
+def test_concurrent_identical_searches_share_one_request_and_summary(stub_search):
+    app, chain = stub_search
+
+    async def scenario():
+        return await asyncio.gather(*(search.google_search("rust async") for _ in range(5)))
+
+    answers = run(scenario())
+    assert answers == ["summary of Result 0 about rust async. Result 1 about rust async."] * 5
+    assert app["stats"]["searches"] == 1
+    assert chain.calls == 1
+    assert search.summary_flights.stats()["coalesced"] == 4
+
+
+def test_search_does_not_block_the_event_loop(stub_search):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        tick = asyncio.create_task(ticker())
+        await search.google_search("rust async")
+        tick.cancel()
+        return ticks
+
+    # The stub takes 50 ms to answer; the loop keeps running meanwhile
+    assert run(scenario()) >= 3
+
+
+def test_upstream_error_is_raised_and_not_cached(stub_search, monkeypatch):
+    app, _chain = stub_search
+    monkeypatch.setattr(settings, "GOOGLE_SEARCH_URL", settings.GOOGLE_SEARCH_URL.replace("customsearch", "missing"))
+    with pytest.raises(search.SearchError) as excinfo:
+        run(search.search_results("rust async"))
+    assert excinfo.value.status == 404
+    assert search.search_cache.stats()["entries"] == 0
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from app.services import rag
+from app.services.semantic_cache import SemanticCache, identifier_tokens
+
+
+def make_cache() -> SemanticCache:
+    return SemanticCache(threshold=0.97, max_entries=16, ttl=60)
+
+
+def test_identifier_tokens():
+    assert identifier_tokens("What is the price of AAPL today?") == {"aapl"}
+    assert identifier_tokens("Compare gpt-4o with v2.1 for $ai3 in 2024") == {"gpt-4o", "v2.1", "$ai3", "2024"}
+    assert identifier_tokens("What should we post about the launch?") == frozenset()
+
+
+def test_hit_requires_same_identifiers():
+    cache = make_cache()
+    # Near-identical embeddings, as ada-002 gives queries differing only by ticker
+    cache.store([1.0, 0.0], {}, "AAPL answer", [], cache.generation(), None, identifier_tokens("price of AAPL"))
+    assert cache.lookup([1.0, 0.001], {}, None, identifier_tokens("price of MSFT")) is None
+    assert cache.lookup([1.0, 0.001], {}, None, identifier_tokens("Price of aapl?")) is None
+    assert cache.lookup([1.0, 0.001], {}, None, identifier_tokens("price of AAPL?")).response == "AAPL answer"
+
+
+def test_plain_queries_still_match_by_similarity():
+    cache = make_cache()
+    cache.store([1.0, 0.0], {}, "answer", [], cache.generation())
+    assert cache.lookup([1.0, 0.01], {}).response == "answer"
+    assert cache.lookup([0.0, 1.0], {}) is None
+
+
+def test_embed_query_runs_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def embed(text):
+        threads.append(threading.current_thread())
+        return [1.0, 0.0]
+
+    store = SimpleNamespace(get=lambda: SimpleNamespace(embeddings=SimpleNamespace(embed_query=embed)))
+    monkeypatch.setattr(rag, "get_vector_store", lambda tenant=None: store)
+    assert asyncio.run(rag.embed_query("question")) == [1.0, 0.0]
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_invalidation_is_per_tenant():
+    cache = make_cache()
+    cache.store([1.0, 0.0], {}, "default answer", [], cache.generation(None), None)
+    cache.store([1.0, 0.0], {}, "acme answer", [], cache.generation("acme"), "acme")
+    acme_generation, globex_generation = cache.generation("acme"), cache.generation("globex")
+
+    cache.invalidate("acme")
+    assert cache.lookup([1.0, 0.0], {}, "acme") is None
+    # The default tenant's entry survives, whichever way it is named
+    assert cache.lookup([1.0, 0.0], {}, "default").response == "default answer"
+    # An answer computed before the invalidation is only dropped for acme
+    cache.store([1.0, 0.0], {}, "stale", [], acme_generation, "acme")
+    cache.store([1.0, 0.0], {}, "globex answer", [], globex_generation, "globex")
+    assert cache.lookup([1.0, 0.0], {}, "acme") is None
+    assert cache.lookup([1.0, 0.0], {}, "globex").response == "globex answer"
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import SingleFlight
+
+
+class Work:
+    """A factory that counts its runs and blocks until released."""
+
+    def __init__(self, result="answer", error: Exception = None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_callers_share_one_execution():
+    async def scenario():
+        flights = SingleFlight()
+        work = Work()
+        callers = [asyncio.create_task(flights.do("q", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flights.stats() == {"calls": 3, "coalesced": 2, "in_flight": 1}
+        work.release.set()
+        assert await asyncio.gather(*callers) == ["answer"] * 3
+        assert work.runs == 1
+        # Results aren't kept: the key is free for the next call
+        assert flights.stats()["in_flight"] == 0
+        assert await flights.do("q", work) == "answer"
+        assert work.runs == 2
+
+    run(scenario())
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flights = SingleFlight()
+        first, second = Work("a"), Work("b")
+        callers = [asyncio.create_task(flights.do("a", first)), asyncio.create_task(flights.do("b", second))]
+        await asyncio.sleep(0)
+        first.release.set()
+        second.release.set()
+        assert await asyncio.gather(*callers) == ["a", "b"]
+        assert flights.coalesced == 0
+
+    run(scenario())
+
+
+def test_one_waiter_cancelling_leaves_the_others_their_result():
+    async def scenario():
+        flights = SingleFlight()
+        work = Work()
+        leaver = asyncio.create_task(flights.do("q", work))
+        stayers = [asyncio.create_task(flights.do("q", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        leaver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        work.release.set()
+        assert await asyncio.gather(*stayers) == ["answer", "answer"]
+        assert not work.cancelled and work.runs == 1
+
+    run(scenario())
+
+
+def test_last_waiter_cancelling_cancels_the_work():
+    async def scenario():
+        flights = SingleFlight()
+        work = Work()
+        callers = [asyncio.create_task(flights.do("q", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+        await asyncio.sleep(0)
+        assert work.cancelled
+        assert flights.stats()["in_flight"] == 0
+
+        # A later call starts fresh instead of joining the cancelled task
+        retry = asyncio.create_task(flights.do("q", work))
+        await asyncio.sleep(0)
+        work.release.set()
+        assert await retry == "answer"
+        assert work.runs == 2
+
+    run(scenario())
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+        work = Work(error=RuntimeError("upstream failed"))
+        callers = [asyncio.create_task(flights.do("q", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        work.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [type(result) for result in results] == [RuntimeError] * 3
+        assert all(str(result) == "upstream failed" for result in results)
+        assert work.runs == 1
+        assert flights.stats()["in_flight"] == 0
+
+    run(scenario())
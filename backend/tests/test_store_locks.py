@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from langchain.schema.document import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.api.routes.query import ChatContextRequest, add_chat_context
+from app.core.config import settings
+from app.services import search, vector_store
+from app.services.vector_store import VectorStoreManager, get_write_lock
+from app.utils.lexical_index import get_lexical_index
+from vdb import populate_db
+
+
+class BlockingEmbeddings:
+    """Embedding calls wait for ``release``, like a slow remote API."""
+
+    def __init__(self):
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        self.started.set()
+        assert self.release.wait(5)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+@pytest.fixture
+def context_store(tmp_path, monkeypatch):
+    manager = VectorStoreManager(str(tmp_path / "chroma"), DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(vector_store, "get_vector_store", lambda tenant=None: manager)
+    yield manager
+    vector_store.retire_chroma_system(manager.persist_directory)
+
+
+def test_ingestion_does_not_hold_the_write_lock_while_embedding(tmp_path, monkeypatch):
+    def load_pdf(file_path):
+        return [Document(page_content="only page", metadata={"source": file_path, "page": 0})], None
+
+    embeddings = BlockingEmbeddings()
+    monkeypatch.setattr(populate_db, "load_pdf", load_pdf)
+    monkeypatch.setattr(populate_db, "get_embedding_function", lambda: embeddings)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "a.pdf").write_text("a")
+    chroma_path = str(tmp_path / "chroma")
+    run = threading.Thread(target=populate_db.main, kwargs={
+        "incremental": True, "workers": 1, "chroma_path": chroma_path, "data_path": str(tmp_path / "data"),
+    })
+    run.start()
+    try:
+        assert embeddings.started.wait(5)
+        # A backup snapshot or /chat/context write gets in while the batch embeds
+        lock = get_write_lock(chroma_path)
+        assert lock.acquire(timeout=1)
+        lock.release()
+    finally:
+        embeddings.release.set()
+        run.join()
+    assert get_lexical_index(chroma_path).count() == 1
+    populate_db.retire_chroma_system(chroma_path)
+
+
+def test_context_write_is_stored(context_store):
+    asyncio.run(search.store_search_context("notes about tenants", "acme"))
+    assert context_store.get().get()["documents"] == ["notes about tenants"]
+    assert get_lexical_index(context_store.persist_directory).count() == 1
+
+
+def test_context_write_gives_up_on_a_held_lock_with_503(context_store, monkeypatch):
+    monkeypatch.setattr(settings, "STORE_WRITE_LOCK_TIMEOUT", 0.05)
+    held, done = threading.Event(), threading.Event()
+
+    def hold():
+        with get_write_lock(context_store.persist_directory):
+            held.set()
+            done.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    try:
+        assert held.wait(5)
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(add_chat_context(ChatContextRequest(context="late write"), tenant="acme"))
+        assert excinfo.value.status_code == 503
+    finally:
+        done.set()
+        holder.join()
+    assert context_store.get().get()["documents"] == []
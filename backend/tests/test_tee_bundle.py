@@ -0,0 +1,139 @@
+import io
+import os
+import struct
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app.utils.encryption import (
+    BUNDLE_MAGIC,
+    FRAME_FINAL,
+    FRAME_HEADER,
+    TAG_SIZE,
+    encrypt_file_for_tee,
+    encrypt_stream_for_tee,
+)
+from app.utils.tee_decryption import decrypt_tee_file, scan_bundle
+
+FRAME_SIZE = 64
+
+
+@pytest.fixture
+def keys(tmp_path):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_path = tmp_path / "tee_private.pem"
+    public_path = tmp_path / "tee_public.pem"
+    private_path.write_bytes(private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ))
+    public_path.write_bytes(private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ))
+    return str(public_path), str(private_path)
+
+
+def encrypt_v2(data: bytes, public_path: str) -> bytes:
+    out = io.BytesIO()
+    assert encrypt_stream_for_tee(io.BytesIO(data), out, public_path, FRAME_SIZE) == len(data)
+    return out.getvalue()
+
+
+def split_bundle(bundle: bytes):
+    """The header bytes of a version 2 bundle and its raw frames."""
+    start = len(BUNDLE_MAGIC) + 1
+    (header_length,) = struct.unpack(">I", bundle[start:start + 4])
+    offset = start + 4 + header_length
+    header, frames = bundle[:offset], []
+    while offset < len(bundle):
+        _flags, length = FRAME_HEADER.unpack_from(bundle, offset)
+        end = offset + FRAME_HEADER.size + length + TAG_SIZE
+        frames.append(bundle[offset:end])
+        offset = end
+    return header, frames
+
+
+def decrypt(tmp_path, bundle: bytes, private_path: str):
+    """Plaintext, or None if the bundle was rejected."""
+    encrypted_path = tmp_path / "bundle.enc"
+    output_path = tmp_path / "plain.out"
+    encrypted_path.write_bytes(bundle)
+    if not decrypt_tee_file(str(encrypted_path), private_path, str(output_path)):
+        # A rejected bundle leaves neither the output nor the partial file
+        assert not output_path.exists()
+        assert not os.path.exists(str(output_path) + ".partial")
+        return None
+    return output_path.read_bytes()
+
+
+@pytest.mark.parametrize("size", [0, 1, FRAME_SIZE, FRAME_SIZE * 3 + 5])
+def test_v2_round_trip(tmp_path, keys, size):
+    public_path, private_path = keys
+    data = os.urandom(size)
+    bundle = encrypt_v2(data, public_path)
+    _header, frames = split_bundle(bundle)
+    assert len(frames) == max(1, -(-size // FRAME_SIZE))
+    assert frames[-1][0] == FRAME_FINAL
+    assert decrypt(tmp_path, bundle, private_path) == data
+
+
+def test_v1_bundle_still_decrypts(tmp_path, keys):
+    public_path, private_path = keys
+    data = os.urandom(FRAME_SIZE * 5)
+    bundle = encrypt_file_for_tee(data, public_path)
+    assert not bundle.startswith(BUNDLE_MAGIC)
+    assert decrypt(tmp_path, bundle, private_path) == data
+
+
+def test_v1_tampered_data_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    bundle = bytearray(encrypt_file_for_tee(b"x" * 1000, public_path))
+    offset, _length = scan_bundle(io.BytesIO(bytes(bundle)))["encrypted_file_data"]
+    bundle[offset] ^= 0x01
+    assert decrypt(tmp_path, bytes(bundle), private_path) is None
+
+
+def test_v2_missing_final_frame_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    header, frames = split_bundle(encrypt_v2(os.urandom(FRAME_SIZE * 3), public_path))
+    assert decrypt(tmp_path, header + b"".join(frames[:-1]), private_path) is None
+
+
+def test_v2_frame_cut_short_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    bundle = encrypt_v2(os.urandom(FRAME_SIZE * 3), public_path)
+    assert decrypt(tmp_path, bundle[:-1], private_path) is None
+
+
+def test_v2_tampered_aad_rejected(tmp_path, keys):
+    """Re-flagging a middle frame as FINAL must not turn it into a valid end."""
+    public_path, private_path = keys
+    header, frames = split_bundle(encrypt_v2(os.urandom(FRAME_SIZE * 3), public_path))
+    forged = bytearray(frames[0])
+    forged[0] |= FRAME_FINAL
+    assert decrypt(tmp_path, header + bytes(forged), private_path) is None
+
+
+def test_v2_tampered_ciphertext_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    header, frames = split_bundle(encrypt_v2(os.urandom(FRAME_SIZE * 3), public_path))
+    tampered = bytearray(frames[1])
+    tampered[FRAME_HEADER.size] ^= 0x01
+    frames[1] = bytes(tampered)
+    assert decrypt(tmp_path, header + b"".join(frames), private_path) is None
+
+
+def test_v2_reordered_frames_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    header, frames = split_bundle(encrypt_v2(os.urandom(FRAME_SIZE * 3), public_path))
+    frames[0], frames[1] = frames[1], frames[0]
+    assert decrypt(tmp_path, header + b"".join(frames), private_path) is None
+
+
+def test_v2_trailing_data_rejected(tmp_path, keys):
+    public_path, private_path = keys
+    bundle = encrypt_v2(os.urandom(FRAME_SIZE * 2), public_path)
+    assert decrypt(tmp_path, bundle + b"\x00", private_path) is None
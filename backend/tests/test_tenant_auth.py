@@ -0,0 +1,49 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.deps import get_tenant
+from app.core.config import settings
+from app.services.vector_store import DEFAULT_TENANT
+
+
+@pytest.fixture(autouse=True)
+def tenant_keys(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_API_KEYS", {"key-acme": "acme"})
+
+
+def status_of(**headers) -> int:
+    with pytest.raises(HTTPException) as excinfo:
+        get_tenant(**headers)
+    return excinfo.value.status_code
+
+
+def test_no_headers_uses_default_tenant():
+    assert get_tenant(x_tenant_id=None, x_api_key=None) == DEFAULT_TENANT
+
+
+def test_api_key_selects_its_tenant():
+    assert get_tenant(x_tenant_id=None, x_api_key="key-acme") == "acme"
+    assert get_tenant(x_tenant_id="acme", x_api_key="key-acme") == "acme"
+
+
+def test_unkeyed_tenant_selected_by_header():
+    assert get_tenant(x_tenant_id="globex", x_api_key=None) == "globex"
+
+
+def test_keyed_tenant_cannot_be_selected_without_its_key():
+    assert status_of(x_tenant_id="acme", x_api_key=None) == 401
+
+
+def test_keyed_default_tenant_requires_its_key(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_API_KEYS", {"key-default": DEFAULT_TENANT})
+    assert status_of(x_tenant_id=None, x_api_key=None) == 401
+    assert get_tenant(x_tenant_id=None, x_api_key="key-default") == DEFAULT_TENANT
+
+
+def test_key_for_another_tenant_is_forbidden():
+    assert status_of(x_tenant_id="globex", x_api_key="key-acme") == 403
+
+
+def test_unknown_key_and_invalid_tenant_rejected():
+    assert status_of(x_tenant_id=None, x_api_key="nope") == 401
+    assert status_of(x_tenant_id="../etc", x_api_key=None) == 400
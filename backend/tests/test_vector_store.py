@@ -0,0 +1,59 @@
+import gc
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services import vector_store
+from app.services.vector_store import VectorStoreManager, open_chroma, retire_chroma_system
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = VectorStoreManager(str(tmp_path / "chroma"), DeterministicFakeEmbedding(size=16))
+    yield manager
+    manager.close()
+
+
+def test_handles_for_a_directory_share_one_system(manager):
+    db = manager.get()
+    writer = open_chroma(manager.persist_directory, manager.embedding_function)
+    writer.add_texts(["written by an ingestion run"])
+    # Visible through the query handle without reopening it
+    assert manager.get() is db
+    assert db.get()["documents"] == ["written by an ingestion run"]
+    assert vector_store._systems[manager.persist_directory].handles == 2
+
+
+def test_system_stops_with_its_last_handle(tmp_path):
+    path = str(tmp_path / "chroma")
+    db = open_chroma(path, DeterministicFakeEmbedding(size=16))
+    assert path in vector_store._systems
+    del db
+    gc.collect()
+    assert path not in vector_store._systems
+
+
+def test_replaced_store_gets_a_fresh_system_after_readers_drain(manager):
+    old = manager.get()
+    old.add_texts(["before the restore"])
+    old_system = vector_store._systems[manager.persist_directory]
+
+    retire_chroma_system(manager.persist_directory)
+    # An in-flight reader keeps working on the old system...
+    assert old.get()["documents"] == ["before the restore"]
+    new = manager.get()
+    assert new is not old
+    assert vector_store._systems[manager.persist_directory] is not old_system
+    assert manager.generation == 1
+
+    # ...which stops once the last handle on it is gone
+    del old
+    gc.collect()
+    assert old_system.handles == 0
+    assert new.get()["documents"] == ["before the restore"]
+
+
+def test_reload_switches_the_manager_to_a_fresh_handle(manager):
+    old = manager.get()
+    manager.reload()
+    assert manager.get() is not old
@@ -0,0 +1,143 @@
+import asyncio
+import io
+import os
+import zipfile
+
+import pytest
+
+from app.core.config import settings
+from app.services import backup
+from app.services.backup import extract_zip_stream
+from app.utils.stream_pipe import ChunkFeed
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, so zipfile falls back to data descriptors as it does for StreamPipe."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+        return len(b)
+
+
+FILES = {
+    "chroma.sqlite3": os.urandom(600 * 1024),
+    "segment/data_level0.bin": b"hnsw " * 20000,
+    "segment/empty.bin": b"",
+    "ingest_manifest.json": b'{"files": {}}',
+}
+
+
+def build(compression=zipfile.ZIP_DEFLATED, seekable=True, force_zip64=False, files=FILES) -> bytes:
+    out = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(out, "w", compression) as archive:
+        for name, data in files.items():
+            with archive.open(name, "w", force_zip64=force_zip64) as member:
+                member.write(data)
+    return out.getvalue() if seekable else bytes(out.buffer)
+
+
+def extract(data: bytes, dest: str, block_size: int = 777) -> int:
+    async def run():
+        loop = asyncio.get_running_loop()
+        blocks = [data[offset:offset + block_size] for offset in range(0, len(data), block_size)]
+        feed = ChunkFeed(loop, depth=len(blocks) + 1)
+        for block in blocks:
+            await feed.put(block)
+        await feed.put(b"")
+        return await loop.run_in_executor(None, extract_zip_stream, feed, dest)
+    return asyncio.run(run())
+
+
+def assert_extracted(dest, files=FILES):
+    for name, data in files.items():
+        with open(os.path.join(dest, name), "rb") as f:
+            assert f.read() == data, name
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+@pytest.mark.parametrize("force_zip64", [False, True])
+def test_seekable_archives(tmp_path, compression, force_zip64):
+    assert extract(build(compression, force_zip64=force_zip64), str(tmp_path)) == len(FILES)
+    assert_extracted(tmp_path)
+
+
+@pytest.mark.parametrize("force_zip64", [False, True])
+def test_deflated_with_data_descriptors(tmp_path, force_zip64):
+    data = build(seekable=False, force_zip64=force_zip64)
+    assert extract(data, str(tmp_path)) == len(FILES)
+    assert_extracted(tmp_path)
+
+
+def test_block_boundaries_do_not_matter(tmp_path):
+    files = {"a.bin": os.urandom(3000), "b.bin": b"b" * 5000}
+    data = build(seekable=False, files=files)
+    for block_size in (1, 3, 30, 64 * 1024):
+        dest = tmp_path / str(block_size)
+        dest.mkdir()
+        assert extract(data, str(dest), block_size) == len(files)
+        assert_extracted(dest, files)
+
+
+def test_directory_entries(tmp_path):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("segment/"), b"")
+        archive.writestr("segment/a.bin", b"a")
+    assert extract(out.getvalue(), str(tmp_path)) == 1
+    assert (tmp_path / "segment" / "a.bin").read_bytes() == b"a"
+
+
+def test_crc_mismatch_rejected(tmp_path):
+    payload = b"x" * 1000
+    data = bytearray(build(zipfile.ZIP_STORED, files={"a.bin": payload}))
+    data[data.index(payload) + 10] ^= 0xFF
+    with pytest.raises(ValueError, match="CRC"):
+        extract(bytes(data), str(tmp_path))
+
+
+def test_truncated_archive_rejected(tmp_path):
+    data = build(seekable=False)
+    with pytest.raises(ValueError, match="truncated"):
+        extract(data[:len(data) // 2], str(tmp_path))
+
+
+def test_entry_outside_store_rejected(tmp_path):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        archive.writestr("../escape.bin", b"x")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    with pytest.raises(ValueError, match="escapes"):
+        extract(out.getvalue(), str(dest))
+    assert not (tmp_path / "escape.bin").exists()
+
+
+def serve_object(monkeypatch, data: bytes):
+    async def iter_object(cid, session=None):
+        for offset in range(0, len(data), 4096):
+            yield data[offset:offset + 4096]
+    monkeypatch.setattr(backup, "iter_object", iter_object)
+
+
+def test_restore_backup_swaps_in_a_zip(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_PATH", str(tmp_path / "chroma"))
+    (tmp_path / "chroma").mkdir()
+    (tmp_path / "chroma" / "old.bin").write_bytes(b"old")
+    serve_object(monkeypatch, build(seekable=False))
+    stats = asyncio.run(backup.restore_backup("cid"))
+    assert stats == {"format": "zip", "files": len(FILES)}
+    assert_extracted(tmp_path / "chroma")
+    assert not (tmp_path / "chroma" / "old.bin").exists()
+
+
+def test_restore_backup_rejects_an_empty_object(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_PATH", str(tmp_path / "chroma"))
+    serve_object(monkeypatch, b"")
+    with pytest.raises(ValueError, match="neither"):
+        asyncio.run(backup.restore_backup("cid"))
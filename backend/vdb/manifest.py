@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from langchain.schema.document import Document
+
+INGEST_MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(chunk: Document) -> str:
+    """Hash of a chunk's text and metadata (minus its ID), to detect edited chunks."""
+    metadata = {k: v for k, v in chunk.metadata.items() if k != "id"}
+    payload = chunk.page_content + "\x00" + json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Per-file fingerprints (mtime, size, sha256) and per-chunk content hashes
+    for everything populate_db has indexed, persisted next to the Chroma store.
+
+    Layout::
+
+        {"files": {"data/a.pdf": {"mtime": ..., "size": ..., "sha256": ...,
+                                  "chunks": {"data/a.pdf:0:0": "<hash>", ...}}}}
+
+    Entries may also carry ``"restored": true`` (see ``mark_restored``).
+    """
+
+    def __init__(self, path: str, files: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.files: Dict[str, dict] = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        try:
+            with open(path) as f:
+                return cls(path, json.load(f).get("files", {}))
+        except (OSError, ValueError):
+            return cls(path)
+
+    def save(self) -> None:
+        # Write-then-rename so a crash never leaves a truncated manifest
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, file_path: str, stat: os.stat_result) -> bool:
+        """Cheap check: same mtime and size as when the file was last indexed."""
+        entry = self.files.get(file_path)
+        return (
+            entry is not None
+            and entry["mtime"] == stat.st_mtime
+            and entry["size"] == stat.st_size
+        )
+
+    def mark_restored(self) -> int:
+        """
+        Flag entries whose source file isn't on this machine, e.g. after the
+        store was restored from a backup onto a fresh node. Their chunks are
+        kept instead of being treated as belonging to removed files.
+        """
+        marked = 0
+        for file_path, entry in self.files.items():
+            if not os.path.exists(file_path):
+                entry["restored"] = True
+                marked += 1
+        return marked
+
+    def chunk_hashes(self, file_path: str) -> Dict[str, str]:
+        return self.files.get(file_path, {}).get("chunks", {})
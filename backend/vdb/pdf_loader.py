@@ -0,0 +1,12 @@
+from langchain_community.document_loaders import PyPDFLoader
+from pypdf.errors import PdfStreamError
+
+
+# Kept apart from populate_db so process-pool workers only import the PDF
+# loader, not Chroma/OpenAI.
+def load_pdf(file_path: str):
+    """Parse a single PDF. Returns (documents, error) so one bad file can't fail a whole pool."""
+    try:
+        return PyPDFLoader(file_path).load(), None
+    except (PdfStreamError, Exception) as e:
+        return [], str(e)
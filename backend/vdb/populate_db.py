@@ -1,98 +1,525 @@
 import argparse
 import os
+import random
 import shutil
 import logging
-from typing import List
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import get_context
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import openai
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
-from pypdf.errors import PdfStreamError
 from app.core.config import settings  
+from app.services.semantic_cache import semantic_cache
+from app.services.vector_store import (
+    chroma_collection, get_ingest_lock, get_write_lock, open_chroma, retire_chroma_system, tenant_paths
+)
+from app.utils.cid_index import load_cid_index
+from app.utils.embedding_cache import CachedEmbeddings, flush_embedding_cache, get_embedding_cache
+from app.utils.lexical_index import get_lexical_index
+from vdb.manifest import INGEST_MANIFEST_FILENAME, IngestManifest, chunk_hash, file_sha256
+from vdb.pdf_loader import load_pdf
 
 
-CHROMA_PATH = "chroma"
-DATA_PATH = "data"
+# (chroma path, data path, tenant) of the shard the current run is
+# ingesting; set by main() so tenant shards can run the same pipeline
+# concurrently in different threads. Unset means the default tenant's
+# settings.CHROMA_PATH/DATA_PATH.
+_store_paths: ContextVar[Optional[Tuple[str, str, Optional[str]]]] = ContextVar("store_paths", default=None)
 
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
 
-def main(reset=False):
+
+def main(reset=False, workers=None, streaming=None, incremental=None, progress=None, chroma_path=None, data_path=None, tenant=None):
+    token = _store_paths.set((chroma_path or settings.CHROMA_PATH, data_path or settings.DATA_PATH, tenant))
+    try:
+        # The write lock is only taken around each commit, so backups and
+        # /chat/context writes don't wait for the embedding calls; the
+        # ingest lock keeps a restore from swapping the store mid-run
+        with get_ingest_lock(current_chroma_path()):
+            _populate(reset, workers, streaming, incremental, progress)
+    finally:
+        _store_paths.reset(token)
+
+
+def current_chroma_path() -> str:
+    paths = _store_paths.get()
+    return paths[0] if paths else settings.CHROMA_PATH
+
+
+def current_data_path() -> str:
+    paths = _store_paths.get()
+    return paths[1] if paths else settings.DATA_PATH
+
+
+def current_tenant() -> Optional[str]:
+    """Tenant whose cached answers a change to this store invalidates."""
+    paths = _store_paths.get()
+    return paths[2] if paths else None
+
+
+def _populate(reset, workers, streaming, incremental, progress):
     if reset:
         print("✨ Clearing Database")
         clear_database()
 
-    documents = load_documents()
-    chunks = split_documents(documents)
-    add_to_chroma(chunks)
+    if incremental is None:
+        incremental = settings.INGEST_INCREMENTAL
+    if incremental:
+        update_changed_files(workers, progress=progress)
+        return
 
+    if streaming is None:
+        streaming = settings.INGEST_STREAMING
+
+    if streaming:
+        # Pages, chunks and batches flow through generators, so memory is
+        # bounded by the batch size rather than the size of DATA_PATH.
+        add_to_chroma(iter_chunks(iter_documents(workers)), progress=progress)
+    else:
+        documents = load_documents(workers)
+        chunks = split_documents(documents)
+        add_to_chroma(chunks, progress=progress)
 
-def load_documents() -> List[Document]:
+
+def load_documents(workers=None) -> List[Document]:
     """Load documents from the data directory, skipping corrupted files."""
-    documents = []
-    logging.info(f"Loading documents from {DATA_PATH}")
-    
-    document_loader = PyPDFDirectoryLoader(DATA_PATH)
-    
-    # Get all PDF files in the directory
-    pdf_files = [f for f in os.listdir(DATA_PATH) if f.endswith('.pdf')]
-    
-    for pdf_file in pdf_files:
-        try:
-            file_path = os.path.join(DATA_PATH, pdf_file)
-            single_loader = PyPDFDirectoryLoader(os.path.dirname(file_path), glob=pdf_file)
-            file_documents = single_loader.load()
-            documents.extend(file_documents)
-            logging.info(f"Successfully loaded {pdf_file}")
-        except (PdfStreamError, Exception) as e:
-            logging.error(f"Error loading {pdf_file}: {str(e)}")
-            continue
-    
+    logging.info(f"Loading documents from {current_data_path()}")
+    documents = list(iter_documents(workers))
     logging.info(f"Successfully loaded {len(documents)} documents")
     return documents
 
 
-def split_documents(documents: list[Document]):
-    text_splitter = RecursiveCharacterTextSplitter(
+def list_pdf_files() -> List[str]:
+    # Get all PDF files in the directory
+    data_path = current_data_path()
+    pdf_files = sorted(f for f in os.listdir(data_path) if f.endswith('.pdf'))
+    return [os.path.join(data_path, pdf_file) for pdf_file in pdf_files]
+
+
+def iter_documents(workers=None, file_paths=None, failed=None) -> Iterator[Document]:
+    """
+    Yield pages file by file, skipping corrupted files; their paths are
+    added to ``failed`` if a set is given. With more than one worker, PDFs
+    are parsed in a process pool with a bounded look-ahead; files are always
+    yielded in sorted filename order so chunk IDs are stable.
+    """
+    if file_paths is None:
+        file_paths = list_pdf_files()
+    pdf_files = [os.path.basename(file_path) for file_path in file_paths]
+    cids = load_cid_index(current_data_path())
+
+    if workers is None:
+        workers = settings.INGEST_PDF_WORKERS or os.cpu_count() or 1
+    workers = min(workers, len(file_paths))
+
+    if workers <= 1:
+        for pdf_file, file_path in zip(pdf_files, file_paths):
+            yield from _loaded_pages(pdf_file, file_path, load_pdf(file_path), cids.get(pdf_file), failed)
+        return
+
+    # spawn rather than fork: this may run on a worker thread of the API server
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+        remaining = iter(zip(pdf_files, file_paths))
+        pending = deque()
+
+        def submit_next():
+            item = next(remaining, None)
+            if item is not None:
+                pdf_file, file_path = item
+                pending.append((pdf_file, file_path, executor.submit(load_pdf, file_path)))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            pdf_file, file_path, future = pending.popleft()
+            submit_next()
+            yield from _loaded_pages(pdf_file, file_path, future.result(), cids.get(pdf_file), failed)
+
+
+def _loaded_pages(pdf_file: str, file_path: str, result, cid=None, failed=None) -> List[Document]:
+    file_documents, error = result
+    if error:
+        logging.error(f"Error loading {pdf_file}: {error}")
+        if failed is not None:
+            failed.add(file_path)
+        return []
+    logging.info(f"Successfully loaded {pdf_file}")
+    if cid:
+        # Files fetched by /retrieve can be filtered by the CID they came from
+        for document in file_documents:
+            document.metadata["cid"] = cid
+    return file_documents
+
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=80,
         length_function=len,
         is_separator_regex=False,
     )
+
+
+def split_documents(documents: list[Document]):
+    text_splitter = get_text_splitter()
     return text_splitter.split_documents(documents)
 
 
-def add_to_chroma(chunks: list[Document]):
-    # Load the existing database.
-    db = Chroma(
-        persist_directory=CHROMA_PATH,
-        embedding_function=get_embedding_function()
-    )
+def iter_chunks(documents: Iterable[Document]) -> Iterator[Document]:
+    """Split pages one at a time as they are pulled from ``documents``."""
+    text_splitter = get_text_splitter()
+    for document in documents:
+        yield from text_splitter.split_documents([document])
+
 
-    # Calculate Page IDs.
-    chunks_with_ids = calculate_chunk_ids(chunks)
+def add_to_chroma(chunks: Iterable[Document], batch_size=None, max_concurrency=None, progress=None):
+    # Load the existing database.
+    db = open_chroma(current_chroma_path(), get_embedding_function())
 
     # Add or Update the documents.
     existing_items = db.get(include=[])  # IDs are always included by default
+    # Every batch is upserted as soon as it is embedded, so this also
+    # covers batches committed by a run that crashed before finishing
     existing_ids = set(existing_items["ids"])
     print(f"Number of existing documents in DB: {len(existing_ids)}")
 
-    # Only add documents that don't exist in the DB.
-    new_chunks = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
-            new_chunks.append(chunk)
-
-    if len(new_chunks):
-        print(f"👉 Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks, ids=new_chunk_ids)
-        # db.persist()
+    # Only add documents that don't exist in the DB. Chunks are filtered
+    # lazily so a generator input is never materialized.
+    new_chunks = (
+        chunk for chunk in assign_chunk_ids(chunks)
+        if chunk.metadata["id"] not in existing_ids
+    )
+    added = ingest_batches(
+        db,
+        batched(new_chunks, batch_size or settings.INGEST_BATCH_SIZE),
+        max_concurrency or settings.INGEST_MAX_CONCURRENCY,
+        progress
+    )
+
+    if added:
+        print(f"👉 Added new documents: {added}")
+        semantic_cache.invalidate(current_tenant())
     else:
         print("✅ No new documents to add")
+    with get_write_lock(current_chroma_path()):
+        sync_lexical_index(db)
+
+
+def update_changed_files(workers=None, batch_size=None, max_concurrency=None, progress=None):
+    """
+    Incrementally sync DATA_PATH into Chroma using the ingest manifest: only
+    new or modified files are parsed, only chunks whose content hash changed
+    are upserted, and chunks of edited or removed files that no longer exist
+    are deleted. Work scales with the size of the change, not the corpus.
+    """
+    manifest = IngestManifest.load(manifest_path())
+    db = open_chroma(current_chroma_path(), get_embedding_function())
+
+    current_files = list_pdf_files()
+    # Entries of changed files as they were before this run, restored for
+    # files that then fail to load
+    previous_entries: Dict[str, Optional[dict]] = {}
+    if not manifest.files and not os.path.exists(manifest.path):
+        seeded = seed_manifest(manifest, db, current_files)
+        if seeded:
+            print(f"🌱 Seeded the ingest manifest with {seeded} files already in the collection")
+    changed_files = []
+    for file_path in current_files:
+        stat = os.stat(file_path)
+        if manifest.is_unchanged(file_path, stat):
+            continue
+        sha256 = file_sha256(file_path)
+        entry = manifest.files.get(file_path)
+        if entry is not None and entry["sha256"] == sha256:
+            # Touched but identical; just remember the new mtime
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            entry.pop("restored", None)
+            continue
+        changed_files.append(file_path)
+        previous_entries[file_path] = entry
+        manifest.files[file_path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "chunks": manifest.chunk_hashes(file_path),
+        }
+
+    # Files known only from a restored backup were never local; keep their chunks
+    removed_files = {
+        file_path for file_path in set(manifest.files) - set(current_files)
+        if not manifest.files[file_path].get("restored")
+    }
+    stale_ids = []
+    for file_path in removed_files:
+        stale_ids.extend(manifest.files.pop(file_path)["chunks"])
+
+    print(f"📄 Files: {len(current_files)} total, {len(changed_files)} new or modified, {len(removed_files)} removed")
+    if progress:
+        progress({
+            "files_total": len(current_files),
+            "files_changed": len(changed_files),
+            "files_removed": len(removed_files),
+        })
+
+    # Chunks seen per changed file in this run; anything else they used to
+    # have is stale.
+    seen_chunks = {file_path: {} for file_path in changed_files}
+    failed_files = set()
+
+    def changed_chunks():
+        chunks = assign_chunk_ids(iter_chunks(iter_documents(workers, changed_files, failed_files)))
+        for chunk in chunks:
+            file_path = chunk.metadata.get("source")
+            digest = chunk_hash(chunk)
+            seen_chunks[file_path][chunk.metadata["id"]] = digest
+            if manifest.chunk_hashes(file_path).get(chunk.metadata["id"]) != digest:
+                yield chunk
+
+    added = ingest_batches(
+        db,
+        batched(changed_chunks(), batch_size or settings.INGEST_BATCH_SIZE),
+        max_concurrency or settings.INGEST_MAX_CONCURRENCY,
+        progress
+    )
+
+    for file_path, chunks in seen_chunks.items():
+        if file_path in failed_files:
+            # A parse failure (or a file still being copied in) says nothing
+            # about its content: keep its chunks and old fingerprint so the
+            # next run tries it again
+            if previous_entries[file_path] is None:
+                del manifest.files[file_path]
+            else:
+                manifest.files[file_path] = previous_entries[file_path]
+            continue
+        stale_ids.extend(set(manifest.chunk_hashes(file_path)) - set(chunks))
+        manifest.files[file_path]["chunks"] = chunks
+
+    with get_write_lock(current_chroma_path()):
+        if stale_ids:
+            db.delete(ids=stale_ids)
+            get_lexical_index(current_chroma_path()).delete(stale_ids)
+        sync_lexical_index(db)
+        manifest.save()
+    if progress:
+        progress({"chunks_deleted": len(stale_ids), "files_failed": len(failed_files)})
+
+    print(f"👉 Upserted {added} changed chunks, deleted {len(stale_ids)} stale chunks")
+    if failed_files:
+        print(f"⚠️ {len(failed_files)} files failed to load and will be retried on the next run")
+    if added or stale_ids:
+        semantic_cache.invalidate(current_tenant())
+
+
+def seed_manifest(manifest: IngestManifest, db: Chroma, current_files: List[str], page_size: int = 1000) -> int:
+    """
+    Fill an empty manifest from chunks already in the collection, so the
+    first incremental run on a store built without one (e.g. by --full or
+    an older version) doesn't re-embed the whole corpus. Chunk hashes are
+    rebuilt from the stored text and metadata. A file modified after its
+    oldest chunk was ingested is left without a fingerprint, so it is
+    parsed again and only chunks that differ are upserted. Only files
+    still in DATA_PATH are seeded. Returns the number of files seeded.
+    """
+    wanted = set(current_files)
+    chunks: Dict[str, Dict[str, str]] = {}
+    oldest: Dict[str, float] = {}
+    total = chroma_collection(db).count()
+    for offset in range(0, total, page_size):
+        page = db.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            metadata = dict(metadata or {})
+            source = metadata.get("source")
+            if source not in wanted:
+                continue
+            # Undo what ingest_batches adds on top of the loader's metadata
+            ingested_at = metadata.pop("ingested_at", 0.0)
+            if metadata.get("type") == "pdf":
+                del metadata["type"]
+            chunks.setdefault(source, {})[chunk_id] = chunk_hash(Document(page_content=text, metadata=metadata))
+            oldest[source] = min(oldest.get(source, ingested_at), ingested_at)
+
+    for file_path, file_chunks in chunks.items():
+        stat = os.stat(file_path)
+        unchanged = stat.st_mtime < oldest[file_path]
+        manifest.files[file_path] = {
+            "mtime": stat.st_mtime if unchanged else None,
+            "size": stat.st_size,
+            "sha256": file_sha256(file_path) if unchanged else None,
+            "chunks": file_chunks,
+        }
+    return len(chunks)
+
+
+def sync_lexical_index(db: Chroma, page_size: int = 1000) -> None:
+    """
+    Rebuild the BM25 index from the collection when the two have drifted,
+    e.g. a store built before the index existed or a run that crashed
+    between a Chroma upsert and the matching index write.
+
+    Chunks stored before ingest_batches stamped "type" and "ingested_at"
+    are backfilled on the way: such a store's index predates the filter
+    columns, so it is always rebuilt here once. Only the metadata is
+    written back to Chroma; nothing is re-embedded.
+    """
+    lexical_index = get_lexical_index(current_chroma_path())
+    total = chroma_collection(db).count()
+    if lexical_index.count() == total:
+        return
+    print(f"🔤 Rebuilding lexical index for {total} documents")
+    backfilled = 0
+
+    def pages():
+        nonlocal backfilled
+        for offset in range(0, total, page_size):
+            page = db.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            metadatas = [backfill_metadata(metadata) for metadata in page["metadatas"]]
+            updated = [
+                (chunk_id, metadata)
+                for chunk_id, metadata, original in zip(page["ids"], metadatas, page["metadatas"])
+                if metadata != original
+            ]
+            if updated:
+                ids, updated_metadatas = map(list, zip(*updated))
+                chroma_collection(db).update(ids=ids, metadatas=updated_metadatas)
+                backfilled += len(ids)
+            yield page["ids"], page["documents"], metadatas
+
+    lexical_index.rebuild(pages())
+    if backfilled:
+        print(f"🏷️ Backfilled type and ingestion time on {backfilled} older chunks")
+
+
+def backfill_metadata(metadata: Optional[dict]) -> dict:
+    """
+    ``metadata`` with the fields ingest_batches and /chat/context stamp on
+    every chunk. The ingestion time of an older chunk is unknown and
+    recorded as 0, which seed_manifest already reads as "before any edit".
+    """
+    metadata = dict(metadata or {})
+    metadata.setdefault("type", "search_result" if metadata.get("source") == "google_search" else "pdf")
+    metadata.setdefault("ingested_at", 0.0)
+    return metadata
+
+
+def manifest_path() -> str:
+    return os.path.join(current_chroma_path(), INGEST_MANIFEST_FILENAME)
+
+
+def batched(items, batch_size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_batches(db: Chroma, batches, max_concurrency: int, progress=None) -> int:
+    """
+    Embed batches on a bounded thread pool and upsert each one as soon as
+    its embeddings are ready. At most ``max_concurrency`` embedding requests
+    are in flight, and ``batches`` is only pulled from as slots free up, so a
+    lazy iterable is never materialized. Upserts to Chroma and the lexical
+    index happen on the calling thread only.
+    """
+    embedding_function = db.embeddings
+    lexical_index = get_lexical_index(current_chroma_path())
+    write_lock = get_write_lock(current_chroma_path())
+    added = 0
+    batches = iter(batches)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        in_flight = {}
+
+        def submit_next() -> bool:
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            texts = [chunk.page_content for chunk in batch]
+            in_flight[executor.submit(embed_with_retry, embedding_function, texts)] = batch
+            return True
+
+        for _ in range(max_concurrency):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                embeddings = future.result()
+                ids = [chunk.metadata["id"] for chunk in batch]
+                # Stamped here rather than at load time so they don't count
+                # towards the manifest's chunk hashes
+                ingested_at = time.time()
+                metadatas = [
+                    {"type": "pdf", **chunk.metadata, "ingested_at": ingested_at}
+                    for chunk in batch
+                ]
+                with write_lock:
+                    chroma_collection(db).upsert(
+                        ids=ids,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        documents=[chunk.page_content for chunk in batch]
+                    )
+                    lexical_index.upsert(ids, [chunk.page_content for chunk in batch], metadatas)
+                added += len(batch)
+                logging.info(f"Committed batch of {len(batch)} ({added} so far)")
+                if progress:
+                    progress({"chunks_upserted": added})
+                submit_next()
+
+    return added
+
+
+def embed_with_retry(embedding_function, texts: List[str]) -> List[List[float]]:
+    """Embed ``texts``, backing off on rate limits and transient API errors."""
+    delay = 1.0
+    for attempt in range(settings.INGEST_MAX_RETRIES + 1):
+        try:
+            return embedding_function.embed_documents(texts)
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.INGEST_MAX_RETRIES:
+                raise
+            wait_for = retry_after(e) or delay * (1 + random.random())
+            logging.warning(f"Embedding request failed ({e.__class__.__name__}), retrying in {wait_for:.1f}s")
+            time.sleep(wait_for)
+            delay = min(delay * 2, 60.0)
+
+
+def retry_after(error) -> float:
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
 
 
 def calculate_chunk_ids(chunks):
+    for _chunk in assign_chunk_ids(chunks):
+        pass
+    return chunks
+
 
+def assign_chunk_ids(chunks: Iterable[Document]) -> Iterator[Document]:
+    """Set metadata["id"] to source:page:index on each chunk as it streams past."""
     last_page_id = None
     current_chunk_index = 0
 
@@ -110,13 +537,17 @@ def calculate_chunk_ids(chunks):
         last_page_id = current_page_id
 
         chunk.metadata["id"] = chunk_id
-
-    return chunks
+        yield chunk
 
 
 def clear_database():
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
+    chroma_path = current_chroma_path()
+    with get_write_lock(chroma_path):
+        if os.path.exists(chroma_path):
+            shutil.rmtree(chroma_path)
+        # Handles opened from now on must start from an empty store
+        retire_chroma_system(chroma_path)
+    semantic_cache.invalidate(current_tenant())
 
 
 def get_embedding_function():
@@ -124,8 +555,27 @@ def get_embedding_function():
         api_key=settings.OPENAI_API_KEY,
         model="text-embedding-ada-002"
     )
-    return embeddings
+    # Chunks already embedded by an earlier run (e.g. before a reset) are
+    # served from the on-disk cache instead of the API.
+    return CachedEmbeddings(embeddings, "text-embedding-ada-002", get_embedding_cache())
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (1 = serial).")
+    parser.add_argument("--streaming", action="store_true", help="Load, split and embed without materializing the corpus.")
+    parser.add_argument("--full", action="store_true", help="Scan every file instead of only new or modified ones.")
+    parser.add_argument("--tenant", default=None, help="Ingest a tenant's shard instead of CHROMA_PATH/DATA_PATH.")
+    args = parser.parse_args()
+    chroma_path, data_path = tenant_paths(args.tenant) if args.tenant else (None, None)
+    main(
+        reset=args.reset,
+        workers=args.workers,
+        streaming=args.streaming or None,
+        incremental=False if args.full else None,
+        chroma_path=chroma_path,
+        data_path=data_path,
+        tenant=args.tenant
+    )
+    flush_embedding_cache()
@@ -0,0 +1,23 @@
+import argparse
+import asyncio
+
+from app.services.backup import restore_backup
+from app.services.http_client import close_http_clients
+
+
+async def main(cid: str) -> dict:
+    try:
+        return await restore_backup(cid)
+    finally:
+        await close_http_clients()
+
+
+if __name__ == "__main__":
+    # Restores into CHROMA_PATH without re-embedding. Meant for a node whose
+    # API isn't running yet; a live server should use POST /restore-db/{cid}
+    # so the swap happens under its shared store.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cid", help="CID of a /upload-db zip backup or an incremental backup manifest.")
+    args = parser.parse_args()
+    stats = asyncio.run(main(args.cid))
+    print(f"✅ Restored {stats['files']} files from {args.cid} ({stats['format']} backup)")